@@ -0,0 +1,213 @@
+#This module contains the beam-search approximate network of the large fleets.
+# The full network has the 2^nUnits masks in every period, which can not be enumerated above ~20 units.
+# The beam network only keeps the beamWidth most promising commitment states of each period:
+#   - the candidates of period t are the priority-list masks (the k units with the lowest average full-load
+#     cost on, for k = 0..nUnits), the same masks with the units that the min up/down times lock in a state kept
+#     at t-1 left as they are, and the neighbours of the states kept at t-1 (at most nSwitches units switched),
+#   - the valid candidates (sum of Pmin <= D[t] <= sum of Pmax) are ranked by the cost of the cheapest way to reach
+#     them from the states kept at t-1 (ED costs and startup costs so far) plus a look-ahead: the cheapest startup
+#     and ED cost of period t+1 on a priority-list mask.
+#   - every kept state carries the min up/down counters of the cheapest way to reach it, and the moves its counters
+#     forbid are dropped (unless no move is allowed at all), so the kept states always hold a feasible path.
+# The network of the kept states is then solved exactly (by the DP, with min up/down), so the schedule is feasible
+# and its cost is exact, but it can be suboptimal: beamWidth and nSwitches trade runtime and memory for optimality.
+# No table of all the masks is built (see utils.SUM_TABLE_MAX_UNITS).
+#
+# Usage: python beam.py --units 30 --periods 24 --beam 50 200 [--switches 2] [--exact]
+import argparse
+import itertools
+import time
+
+import numpy as np
+
+import dispatch
+import dpsolver
+import input
+import network
+import utils
+
+DEFAULT_BEAM_WIDTH = 200
+DEFAULT_SWITCHES = 1
+EXACT_MAX_UNITS = 10  # the gap to the exact solve is only computed up to this number of units
+
+
+class BeamSolution():
+    """
+    Schedule found on the beam network
+
+    Attributes:
+        masks: commitment mask of each period (None if the beam network has no feasible path)
+        objective: cost of the schedule
+        nStates: states kept in each period
+        nArcs: arcs of the beam network
+        buildTime, solveTime: seconds spent to select the states and build the network, and to solve it
+    """
+
+    def __init__(self, masks, objective, nStates, nArcs, buildTime, solveTime):
+        self.masks = masks
+        self.objective = objective
+        self.nStates = nStates
+        self.nArcs = nArcs
+        self.buildTime = buildTime
+        self.solveTime = solveTime
+
+
+def getPriorityOrder(inp=input):
+    # Units by increasing average cost at full load: (c1 + c2 Pmax + c3 Pmax^2) / Pmax
+    Pmax = np.asarray(inp.Pmax, dtype=np.float64)
+    averageCost = (np.asarray(inp.c1) + np.asarray(inp.c2) * Pmax + np.asarray(inp.c3) * Pmax**2) / Pmax
+    return np.argsort(averageCost, kind='stable')
+
+
+def getPriorityListMasks(inp=input):
+    # Masks with the first k units of the priority order on, for k = 0..nUnits
+    bits = [utils.unitBit(int(i), inp.nUnita) for i in getPriorityOrder(inp)]
+    return np.concatenate([[0], np.cumsum(bits)]).astype(np.int64)
+
+
+def getFlipMasks(nUnits, nSwitches):
+    # Masks with at most nSwitches bits set (the moves of the neighbourhood), 0 included
+    flips = [0]
+    for k in range(1, nSwitches + 1):
+        flips.extend(sum(utils.unitBit(i, nUnits) for i in units) for units in itertools.combinations(range(nUnits), k))
+    return np.array(flips, dtype=np.int64)
+
+
+def getBeamLayers(inp=input, beamWidth=DEFAULT_BEAM_WIDTH, nSwitches=DEFAULT_SWITCHES, costFunction=None, doMinUpMinDown=True):
+    # Return the sorted masks kept in each period
+    nUnits, nPeriods = inp.nUnita, inp.nPeriodi
+    D = np.asarray(inp.D, dtype=np.float64)
+    if costFunction is None:
+        costFunction = dispatch.EconomicDispatch.fromInput(inp).cost
+    priorityMasks = getPriorityListMasks(inp)
+    flips = getFlipMasks(nUnits, nSwitches)
+    tauUp, tauDown = getMinUpMinDown(inp, doMinUpMinDown)
+
+    # look-ahead of each period: ED costs of the valid priority-list masks
+    isValid = utils.getValidMasksByPeriod(priorityMasks, inp.Pmin, inp.Pmax, D)
+    lookAheadMasks = [priorityMasks[isValid[t]] for t in range(nPeriods)]
+    lookAheadCosts = [costFunction(m, np.full(len(m), D[t])) for t, m in enumerate(lookAheadMasks)]
+
+    # every state kept carries the cost and the min up/down counters (see dpsolver) of the cheapest way to reach it
+    states = np.array([utils.binStrToInt(inp.initial_status)], dtype=np.int64)
+    costs = np.zeros(1)
+    counters = dpsolver.getInitialCounters(inp, tauUp, tauDown)[None, :]
+    layers = []
+    for t in range(nPeriods):
+        # 1. Candidates (parent state, mask): the neighbours of every state, every priority-list mask, and every
+        #    priority-list mask with the units locked by the counters of the state kept as they are
+        locked = dpsolver.lockedMasks(states, counters, tauUp, tauDown, nUnits)
+        parents = np.repeat(np.arange(len(states)), len(flips) + 2 * len(priorityMasks))
+        children = np.concatenate([states[:, None] ^ flips[None, :],
+                                   np.broadcast_to(priorityMasks, (len(states), len(priorityMasks))),
+                                   (states & locked)[:, None] | (priorityMasks[None, :] & ~locked[:, None])], axis=1).ravel()
+        valid = utils.getValidMasksByPeriod(children, inp.Pmin, inp.Pmax, D[t:t + 1])[0]
+        parents, children = parents[valid], children[valid]
+        # prefer the moves that the counters of the parent allow (a switch into the last period is never forbidden)
+        if t < nPeriods - 1 and len(children):
+            allowed = ((states[parents] ^ children) & locked[parents]) == 0
+            if np.any(allowed):
+                parents, children = parents[allowed], children[allowed]
+        if len(children) == 0:
+            # no valid mask for the demand of period t: the network has no path
+            layers.append(children)
+            states, costs, counters = children, np.zeros(0), np.zeros((0, nUnits), dtype=np.int64)
+            continue
+
+        # 2. Cheapest way to reach every candidate from the states kept at t-1
+        candidates, inverse = np.unique(children, return_inverse=True)
+        inverse = inverse.ravel()
+        reachCosts = costs[parents] + utils.getTransitionCosts(states[parents], children, inp.startup_cost)
+        order = np.lexsort((reachCosts, inverse))
+        best = order[np.r_[True, inverse[order][1:] != inverse[order][:-1]]]  # one move per candidate, in order
+        bestParents, reachCosts = parents[best], reachCosts[best]
+        edCosts = costFunction(candidates, np.full(len(candidates), D[t]))
+        feasible = edCosts < dispatch.INFEASIBLE_COST
+        candidates, bestParents, reachCosts = candidates[feasible], bestParents[feasible], reachCosts[feasible] + edCosts[feasible]
+
+        # 3. Rank by cost so far plus the look-ahead on the priority-list masks of period t+1
+        score = reachCosts.copy()
+        if t + 1 < nPeriods and len(lookAheadMasks[t + 1]):
+            score += np.min(utils.getTransitionCosts(candidates[:, None], lookAheadMasks[t + 1][None, :], inp.startup_cost)
+                            + lookAheadCosts[t + 1][None, :], axis=1)
+        keep = np.sort(np.argsort(score, kind='stable')[:beamWidth])
+        newCounters = dpsolver.nextCounters(counters[bestParents[keep]], states[bestParents[keep]] ^ candidates[keep],
+                                            candidates[keep], tauUp, tauDown, nUnits)
+        states, costs, counters = candidates[keep], reachCosts[keep], newCounters
+        layers.append(states)
+    return layers
+
+
+def getMinUpMinDown(inp=input, doMinUpMinDown=True):
+    if not doMinUpMinDown:
+        return np.zeros(inp.nUnita, dtype=np.int64), np.zeros(inp.nUnita, dtype=np.int64)
+    return np.asarray(inp.min_switch_up, dtype=np.int64), np.asarray(inp.min_switch_down, dtype=np.int64)
+
+
+def solveBeam(inp=input, beamWidth=DEFAULT_BEAM_WIDTH, nSwitches=DEFAULT_SWITCHES, doMinUpMinDown=True):
+    # Build the beam network of inp and solve it with the DP. Return a BeamSolution
+    start = time.perf_counter()
+    costFunction = dispatch.EconomicDispatch.fromInput(inp).cost
+    layers = getBeamLayers(inp, beamWidth, nSwitches, costFunction, doMinUpMinDown)
+    net = network.UC_NetworkCSR.createModelFromInput(inp, layers=layers, costFunction=costFunction)
+    buildTime = time.perf_counter() - start
+
+    start = time.perf_counter()
+    tauUp = np.asarray(inp.min_switch_up, dtype=np.int64)
+    tauDown = np.asarray(inp.min_switch_down, dtype=np.int64)
+    solution = dpsolver.solveDP(net, tauUp, tauDown, doMinUpMinDown=doMinUpMinDown,
+                                initialCounters=dpsolver.getInitialCounters(inp, tauUp, tauDown))
+    solveTime = time.perf_counter() - start
+    masks, objective = (None, None) if solution is None else (solution.masks, solution.objective)
+    return BeamSolution(masks, objective, [len(l) for l in layers], net.nArcs, buildTime, solveTime)
+
+
+def solveExact(inp=input, doMinUpMinDown=True):
+    # Solve the full network of inp with the DP. Return (objective, seconds), objective is None if there is no schedule
+    start = time.perf_counter()
+    net = network.UC_NetworkCSR.createModelFromInput(inp, doCache=False)
+    if doMinUpMinDown:
+        net = net.pruneInfeasibleArcs(inp)
+    tauUp = np.asarray(inp.min_switch_up, dtype=np.int64)
+    tauDown = np.asarray(inp.min_switch_down, dtype=np.int64)
+    solution = dpsolver.solveDP(net, tauUp, tauDown, doMinUpMinDown=doMinUpMinDown,
+                                initialCounters=dpsolver.getInitialCounters(inp, tauUp, tauDown))
+    return (None if solution is None else solution.objective), time.perf_counter() - start
+
+
+def getGap(beamSolution, exactObjective):
+    # Relative gap of the beam schedule to the exact optimum (None if one of them is missing)
+    if beamSolution.objective is None or exactObjective is None:
+        return None
+    return (beamSolution.objective - exactObjective) / abs(exactObjective)
+
+
+if "__main__" == __name__:
+    import benchmark
+
+    parser = argparse.ArgumentParser(description='Beam-search approximate solve of the UC problem')
+    parser.add_argument('--units', type=int, default=None, help='synthetic fleet (benchmark.generateInstance), default: input')
+    parser.add_argument('--periods', type=int, default=24)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--beam', type=int, nargs='+', default=[DEFAULT_BEAM_WIDTH], help='states kept per period')
+    parser.add_argument('--switches', type=int, default=DEFAULT_SWITCHES, help='units switched by a neighbourhood move')
+    parser.add_argument('--exact', action='store_true', help=f'also solve the full network (up to {EXACT_MAX_UNITS} units)')
+    args = parser.parse_args()
+
+    inp = input if args.units is None else benchmark.generateInstance(args.units, args.periods, args.seed)
+    exactObjective = None
+    if args.exact:
+        if inp.nUnita > EXACT_MAX_UNITS:
+            print(f"No exact solve above {EXACT_MAX_UNITS} units")
+        else:
+            exactObjective, exactTime = solveExact(inp)
+            print(f"Exact: objective {exactObjective}, {exactTime:.3f} s")
+    for beamWidth in args.beam:
+        beamSolution = solveBeam(inp, beamWidth, args.switches)
+        if beamSolution.objective is None:
+            print(f"Beam {beamWidth}: the beam network has no feasible schedule, increase the beam width")
+            continue
+        gap = getGap(beamSolution, exactObjective)
+        print(f"Beam {beamWidth}: objective {beamSolution.objective}, {sum(beamSolution.nStates)} states, "
+              f"{beamSolution.nArcs} arcs, build {beamSolution.buildTime:.3f} s, solve {beamSolution.solveTime:.3f} s"
+              + ("" if gap is None else f", gap {100*gap:.3f}%"))
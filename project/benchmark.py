@@ -0,0 +1,347 @@
+#This module contains the benchmarks of the network construction and of the whole solve.
+# Usage: python benchmark.py arcs
+#        python benchmark.py minupdown
+#        python benchmark.py suite --units 5 8 10 --periods 24 48 --output results.json [--compare old.json]
+# The suite runs on seeded synthetic instances, every instance in a fresh process (so its peak RSS is its own),
+# and times each phase separately. The CPLEX phases are skipped when docplex is not installed (or with --no-cplex).
+import argparse
+import concurrent.futures
+import datetime
+import json
+import multiprocessing
+import platform
+import re
+import resource
+import subprocess
+import time
+import types
+
+import numpy as np
+
+import dpsolver
+import input
+import instrument
+import network
+import solvers
+import utils
+try:
+    import main
+    from main import Arc, Node, UC_Model, UC_Network
+except ImportError:
+    # docplex is not installed: only the benchmarks without CPLEX can run
+    main = None
+
+
+def _createNodes(nUnits, nPeriods):
+    nodes = [Node(0, -1, isSource=True)]
+    nodes.extend([Node(m, t) for t in range(nPeriods) for m in utils.getAllMasks(nUnits)])
+    nodes.append(Node(0, nPeriods, isSink=True))
+    return nodes
+
+
+def benchmarkArcBuild(nUnits=input.nUnita, periodsList=(6, 12, 24, 48), doLegacy=True):
+    # Time the arc construction with the all-pairs scan (legacy) and with the period buckets.
+    # The bucketed time per arc should stay constant while the number of arcs grows.
+    # The transition costs are read from input, so nUnits can not be larger than input.nUnita.
+    assert nUnits <= input.nUnita
+    print(f"{'periods':>8} {'nodes':>8} {'arcs':>10} {'all-pairs [s]':>14} {'buckets [s]':>12} {'buckets [us/arc]':>17}")
+    results = []
+    for nPeriods in periodsList:
+        nodes = _createNodes(nUnits, nPeriods)
+
+        legacyTime = float('nan')
+        if doLegacy:
+            start = time.perf_counter()
+            legacyArcs = [Arc(i, j) for i in nodes for j in nodes if i._t == j._t - 1]
+            legacyTime = time.perf_counter() - start
+
+        start = time.perf_counter()
+        arcs = list(UC_Network.generateArcs(UC_Network.getNodesByPeriod(nodes)))
+        bucketTime = time.perf_counter() - start
+
+        if doLegacy:
+            assert [a.id for a in legacyArcs] == [a.id for a in arcs]
+        print(f"{nPeriods:>8} {len(nodes):>8} {len(arcs):>10} {legacyTime:>14.3f} {bucketTime:>12.3f} {1e6*bucketTime/len(arcs):>17.2f}")
+        results.append({'periods': nPeriods, 'nodes': len(nodes), 'arcs': len(arcs),
+                        'allPairsTime': legacyTime, 'bucketTime': bucketTime})
+    return results
+
+
+###################### Baseline min up/down scan ######################
+# The helpers of utils as they were before the node index (string node ids), copied unchanged,
+# so that benchmarkMinUpMinDown compares with the code that really ran
+def _legacyGetAllBinaryStringCombinations(nUnits):
+    nCombs = 2**nUnits
+    return ([utils.intToBinStr(i, nUnits) for i in range(nCombs)], nCombs)
+
+
+def _legacyGetAllBinaryStringCombinationMatchingPattern(strNumber):
+    # Get the list of all the possible combinations of binary strings of length strNumber
+    allCombs, _ = _legacyGetAllBinaryStringCombinations(len(strNumber))
+    # Create a regex pattern with strNumber
+    pattern = strNumber.replace('x', '.')
+    # Remove all the combinations that do not match the pattern
+    allCombs = [i for i in allCombs if re.match(pattern, i)]
+    return allCombs
+
+
+def _legacyGetIDPatternDifferences(id1, id2):
+    assert len(id1) == len(id2)
+    output = 'x' * len(id1)
+    for i in range(len(id1)):
+        if id1[i] != id2[i]:
+            # Replace the character in the output string with the character in id2
+            output = output[:i] + id2[i] + output[i+1:]
+    return output
+
+
+def _legacySplitPattern(pattern):
+    # count the 0s and 1s in the pattern
+    n0 = pattern.count('0')
+    n1 = pattern.count('1')
+    if n0 + n1 == 0:
+        assert False
+
+    simple_patterns = []
+    for i in range(len(pattern)):
+        if pattern[i] != 'x':
+            ith_simple_pattern = ('x'*len(pattern[:i])) + pattern[i] + ('x'*len(pattern[i+1:]))
+            simple_patterns.append( (ith_simple_pattern,i) )
+    return simple_patterns
+
+
+def _legacyNegatePattern(pattern):
+    return pattern.replace('0', 't').replace('1', '0').replace('t', '1')
+
+
+def _legacyGetAllNodesViolatingMinDownAndUpTime(id1, id2, nIntervalli, pattern, tau):
+    i1, t1 = id1
+    i2, t2 = id2
+    pSplit = _legacySplitPattern(pattern)
+    pSplit_Negated = [(_legacyNegatePattern(simple_pattern),i) for (simple_pattern,i) in pSplit]
+    d = {}
+    for (sp_negated, i) in pSplit_Negated:
+        for p in _legacyGetAllBinaryStringCombinationMatchingPattern(sp_negated):
+            if p not in d:
+                d[p] = tau[i]
+            else:
+                d[p] = max(d[p], tau[i])
+    output = []
+    for (node_id,window_size) in d.items():
+        lht = t2+1
+        rht = min(t2+window_size,nIntervalli-1)
+        if lht > rht:
+            continue
+        r = range(lht, rht)
+        output.extend([(node_id,time) for time in r])
+    return output
+
+
+def _legacyMinUpMinDownViolations(myNet, legacyIds):
+    # The min up/down scan of UC_Model.generateUCNetworkModel as it was before the node index: for every switching
+    # arc the list of violating node keys is rebuilt and all the nodes of the network are tested against it.
+    # legacyIds maps the id of every node to its baseline id (binary string, period)
+    tau = input.min_switch_up
+    for a in myNet.arcs:
+        if a._n2.isSink:
+            continue
+        id1, id2 = legacyIds[a._n1.id], legacyIds[a._n2.id]
+        if id1[0] == id2[0]:
+            continue
+        diffPattern = _legacyGetIDPatternDifferences(id1[0], id2[0])
+        nonValidNodeKeys = _legacyGetAllNodesViolatingMinDownAndUpTime(id1, id2, input.nPeriodi, diffPattern, tau)
+        if len(nonValidNodeKeys) == 0:
+            continue
+        not_valid_arcs_list = []
+        for n in myNet.nodes:
+            if legacyIds[n.id] in nonValidNodeKeys:
+                not_valid_arcs_list.extend(n.innerArcs)
+        if len(not_valid_arcs_list) > 0:
+            yield (a, not_valid_arcs_list)
+
+
+def benchmarkMinUpMinDown(doModelBuild=True):
+    # Time the generation of the min up/down violation sets on the network of input (legacy scan vs node index),
+    # then the whole model build phase
+    main.DO_MULTIPROCESSING_EDPROBLEMS = False
+    myNet = UC_Network.createModelFromInput()
+    print(f"Network with {len(myNet.nodes)} nodes and {len(myNet.arcs)} arcs")
+
+    legacyIds = {n.id: (utils.intToBinStr(n.id[0], input.nUnita), n.id[1]) for n in myNet.nodes}
+    start = time.perf_counter()
+    legacy = [(a.id, [b.id for b in arcs]) for (a, arcs) in _legacyMinUpMinDownViolations(myNet, legacyIds)]
+    legacyTime = time.perf_counter() - start
+
+    start = time.perf_counter()
+    indexed = [(a.id, [b.id for b in arcs]) for (a, _, arcs) in UC_Model.generateMinUpMinDownViolations(myNet)]
+    indexedTime = time.perf_counter() - start
+
+    assert legacy == indexed
+    nInvalidArcs = sum(len(arcs) for (_, arcs) in indexed)
+    print(f"{len(indexed)} min up/down constraints over {nInvalidArcs} arcs")
+    print(f"Violation sets: legacy scan {legacyTime:.3f} s, node index {indexedTime:.3f} s ({legacyTime/indexedTime:.1f}x)")
+    results = {'constraints': len(indexed), 'legacyTime': legacyTime, 'indexedTime': indexedTime}
+
+    if doModelBuild:
+        UC_Model.reset()
+        start = time.perf_counter()
+        UC_Model.generateUCNetworkModel(myNet)
+        results['modelBuildTime'] = time.perf_counter() - start
+        print(f"Model build phase: {results['modelBuildTime']:.3f} s")
+    return results
+
+
+###################### Suite ######################
+def generateInstance(nUnits, nPeriods, seed=0):
+    # Seeded synthetic instance with the attributes of the input module: a fleet of base, mid and peak units
+    # (the bigger units are cheaper per MWh, slower to start and with longer min up/down times)
+    # and a daily demand profile between 35% and 80% of the capacity of the fleet
+    rng = np.random.default_rng(seed)
+    size = rng.uniform(0, 1, nUnits)
+    Pmax = np.round(50 + 400 * size)
+    Pmin = np.round(Pmax * rng.uniform(0.2, 0.4, nUnits))
+    tau = np.clip(np.round(1 + 7 * size), 1, 8).astype(int)
+    hours = np.arange(nPeriods)
+    profile = 0.575 + 0.225 * np.sin(2 * np.pi * (hours - 9) / 24) + rng.normal(0, 0.02, nPeriods)
+    return types.SimpleNamespace(
+        nUnita=nUnits, nPeriodi=nPeriods,
+        D=list(np.round(np.clip(profile, 0.35, 0.8) * Pmax.sum())),
+        c1=list(np.round(200 + 800 * size + rng.uniform(0, 100, nUnits))),
+        c2=list(np.round(28 - 12 * size + rng.uniform(0, 2, nUnits), 2)),
+        c3=list(rng.uniform(2e-4, 5e-3, nUnits)),
+        Pmin=list(Pmin), Pmax=list(Pmax),
+        startup_cost=list(np.round(50 + 10000 * size**2)),
+        min_switch_up=list(tau), min_switch_down=list(tau),
+        initial_status=''.join('1' if s > 0.6 else '0' for s in size),
+        initial_status_periods=list(tau))
+
+
+def _runInstance(nUnits, nPeriods, seed, doCplex, doHighs, highsTimeLimit):
+    # Time the phases of one instance (in a fresh process). Return a dict of results
+    baselineRSSMB = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    inp = generateInstance(nUnits, nPeriods, seed)
+    phases, counts, objectives = {}, {}, {}
+
+    def timed(name, function, *args, **kwargs):
+        start = time.perf_counter()
+        result = function(*args, **kwargs)
+        phases[name] = time.perf_counter() - start
+        return result
+
+    # Network phases: the build of UC_NetworkCSR.createModelFromInput (without the ED cost cache),
+    # timed by its own instrumentation (validity of the masks, nodes, ED and arcs phases)
+    instrument.enable()
+    instrument.reset()
+    net = timed('network', network.UC_NetworkCSR.createModelFromInput, inp, doCache=False)
+    for name, entry in instrument.snapshot()['phases'].items():
+        phases[f'network {name}'] = entry['seconds']
+    instrument.enable(False)
+    initialMask = utils.binStrToInt(inp.initial_status)
+    counts['nodes'], counts['arcs'] = net.nNodes, net.nArcs
+
+    # Min up/down: pruning of the arcs and aggregated constraints
+    prunedNet = timed('arc pruning', net.pruneInfeasibleArcs, inp)
+    counts['pruned arcs'] = prunedNet.nArcs
+    tauUp = np.asarray(inp.min_switch_up, dtype=np.int64)
+    tauDown = np.asarray(inp.min_switch_down, dtype=np.int64)
+    initialCounters = dpsolver.getInitialCounters(inp, tauUp, tauDown)
+    minUpMinDown = timed('min up/down constraints', solvers.getMinUpMinDownMatrix, prunedNet.nodeMask, prunedNet.nodePeriod,
+                         prunedNet.arcFrom, prunedNet.arcTo, nUnits, nPeriods, tauUp, tauDown, initialCounters, initialMask)
+    counts['min up/down constraints'] = 0 if minUpMinDown is None else minUpMinDown[0].shape[0]
+
+    # Solves
+    dpSolution = timed('DP solve', dpsolver.solveDP, prunedNet, tauUp, tauDown, initialCounters=initialCounters)
+    objectives['DP'] = None if dpSolution is None else dpSolution.objective
+    if doHighs:
+        backend = solvers.ScipyMilpBackend(inp=inp, timeLimit=highsTimeLimit)
+        timed('HiGHS model build', backend.buildModel, prunedNet)
+        highsSolution = timed('HiGHS solve', backend.solve, prunedNet)
+        objectives['HiGHS'] = highsSolution.objective
+    if doCplex:
+        # UC_Model reads the input module: this process is discarded after the instance
+        for name, value in vars(inp).items():
+            setattr(input, name, value)
+        UC_Model.reset()
+        timed('CPLEX model build', UC_Model.generateUCNetworkModel, prunedNet)
+        model = UC_Model.getSingletonModel()
+        counts['CPLEX variables'], counts['CPLEX constraints'] = model.number_of_variables, model.number_of_constraints
+        try:
+            cplexSolution = timed('CPLEX solve', main.CplexBackend().solve, prunedNet)
+            objectives['CPLEX'] = cplexSolution.objective
+        except Exception as e:
+            # e.g. over the size limits of the Community Edition
+            objectives['CPLEX'] = f"{type(e).__name__}: {e}"
+
+    return {'units': nUnits, 'periods': nPeriods, 'seed': seed, 'phases': phases, 'counts': counts,
+            'objectives': objectives, 'baselineRSSMB': baselineRSSMB,
+            'peakRSSMB': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}
+
+
+def _getCommit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def benchmarkSuite(unitsList=(5, 8, 10), periodsList=(24,), seeds=(0,), doCplex=True, doHighs=False, highsTimeLimit=60):
+    # Run every (units, periods, seed) instance in a fresh process and return the results with the environment
+    doCplex = doCplex and main is not None
+    context = multiprocessing.get_context('spawn')
+    results = []
+    for nUnits in unitsList:
+        for nPeriods in periodsList:
+            for seed in seeds:
+                with concurrent.futures.ProcessPoolExecutor(1, mp_context=context) as executor:
+                    result = executor.submit(_runInstance, nUnits, nPeriods, seed, doCplex, doHighs, highsTimeLimit).result()
+                results.append(result)
+                print(f"{nUnits} units x {nPeriods} periods (seed {seed}): {result['counts']['arcs']} arcs, "
+                      f"peak RSS {result['peakRSSMB']:.0f} MB (after the imports {result['baselineRSSMB']:.0f} MB)")
+                for phase, seconds in result['phases'].items():
+                    print(f"    {phase:<24} {seconds:10.4f} s")
+    return {'commit': _getCommit(), 'date': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(), 'numpy': np.__version__, 'cplex': doCplex, 'results': results}
+
+
+def compareSuites(old, new):
+    # Print the ratio new/old of the time of every phase of the instances in both suites
+    oldResults = {(r['units'], r['periods'], r['seed']): r for r in old['results']}
+    print(f"Comparing {new.get('commit')} with {old.get('commit')} (new/old time)")
+    for r in new['results']:
+        key = (r['units'], r['periods'], r['seed'])
+        if key not in oldResults:
+            continue
+        ratios = [f"{phase} {seconds/oldResults[key]['phases'][phase]:.2f}x" for phase, seconds in r['phases'].items()
+                  if oldResults[key]['phases'].get(phase)]
+        print(f"{key[0]} units x {key[1]} periods (seed {key[2]}): " + ", ".join(ratios))
+
+
+if "__main__" == __name__:
+    parser = argparse.ArgumentParser(description='Benchmarks of the network construction and of the solve')
+    parser.add_argument('benchmark', choices=['arcs', 'minupdown', 'suite'])
+    parser.add_argument('--units', type=int, nargs='+', default=[input.nUnita])
+    parser.add_argument('--periods', type=int, nargs='+', default=None)
+    parser.add_argument('--no-legacy', action='store_true', help='skip the all-pairs scan')
+    parser.add_argument('--no-model', action='store_true', help='skip the docplex model build')
+    parser.add_argument('--seeds', type=int, nargs='+', default=[0], help='suite: seeds of the synthetic instances')
+    parser.add_argument('--no-cplex', action='store_true', help='suite: skip the CPLEX model build and solve')
+    parser.add_argument('--highs', action='store_true', help='suite: also build and solve the HiGHS model')
+    parser.add_argument('--highs-time-limit', type=float, default=60)
+    parser.add_argument('--output', default=None, help='suite: write the results to this JSON file')
+    parser.add_argument('--compare', default=None, help='suite: JSON file of a previous run to compare with')
+    args = parser.parse_args()
+
+    if args.benchmark == 'arcs':
+        benchmarkArcBuild(args.units[0], args.periods or [6, 12, 24, 48], not args.no_legacy)
+    elif args.benchmark == 'minupdown':
+        benchmarkMinUpMinDown(not args.no_model)
+    elif args.benchmark == 'suite':
+        if main is None and not args.no_cplex:
+            print("docplex is not installed: the CPLEX phases are skipped")
+        suite = benchmarkSuite(args.units, args.periods or [24], args.seeds, not args.no_cplex, args.highs, args.highs_time_limit)
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(suite, f, indent=2)
+        if args.compare:
+            with open(args.compare) as f:
+                compareSuites(json.load(f), suite)
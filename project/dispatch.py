@@ -0,0 +1,102 @@
+#This module contains the native Economic Dispatch (ED) engine.
+# The ED problem of a node is
+#   min  sum_i u[i]*c1[i] + c2[i]*p[i] + c3[i]*p[i]^2
+#   s.t. sum_i p[i] == D[t]
+#        u[i]*Pmin[i] <= p[i] <= u[i]*Pmax[i]
+# It is a convex quadratic with box bounds and a single balance equation, so its KKT conditions give
+#   p[i](lambda) = clip((lambda - c2[i]) / (2*c3[i]), u[i]*Pmin[i], u[i]*Pmax[i])
+# and sum_i p[i](lambda) is monotone in lambda. The engine looks for the lambda that balances the demand
+# for many (commitment mask, demand) pairs at once with NumPy.
+import numpy as np
+
+import input
+import utils
+
+# Cost returned for the nodes whose ED problem is infeasible (same value used by the CPLEX path)
+INFEASIBLE_COST = 1000000000
+
+# Number of bisection steps on lambda before the exact (breakpoint) step
+N_BISECTION_STEPS = 60
+
+
+class EconomicDispatch():
+    """
+    Vectorized Economic Dispatch solver (lambda-iteration + KKT breakpoint step)
+
+    Attributes:
+        nUnits: number of units
+        c1, c2, c3: cost coefficients of the units
+        Pmin, Pmax: generation limits of the units
+    """
+
+    def __init__(self, c1, c2, c3, Pmin, Pmax):
+        self.c1 = np.asarray(c1, dtype=np.float64)
+        self.c2 = np.asarray(c2, dtype=np.float64)
+        self.c3 = np.asarray(c3, dtype=np.float64)
+        self.Pmin = np.asarray(Pmin, dtype=np.float64)
+        self.Pmax = np.asarray(Pmax, dtype=np.float64)
+        self.nUnits = len(self.c1)
+        assert len(self.c2) == len(self.c3) == len(self.Pmin) == len(self.Pmax) == self.nUnits
+        assert np.all(self.c3 > 0), "The ED engine needs strictly convex cost functions (c3 > 0)"
+
+        # lambda bracket valid for every commitment: at lambda_lo every unit is at Pmin, at lambda_hi at Pmax
+        self._lambdaLo = float(np.min(self.c2 + 2 * self.c3 * self.Pmin))
+        self._lambdaHi = float(np.max(self.c2 + 2 * self.c3 * self.Pmax))
+
+    @staticmethod
+    def fromInput(inp=input):
+        return EconomicDispatch(inp.c1, inp.c2, inp.c3, inp.Pmin, inp.Pmax)
+
+    def _power(self, lam, lo, hi):
+        # p[k,i](lambda[k]) for every problem k and unit i
+        p = (lam[:, None] - self.c2[None, :]) / (2 * self.c3[None, :])
+        return np.clip(p, lo, hi)
+
+    def dispatch(self, masks, demands):
+        # Solve the ED problem for every pair (masks[k], demands[k]).
+        # Return (P, costs): P[k,i] is the power of the unit i, costs[k] the ED cost (INFEASIBLE_COST if infeasible)
+        masks = np.asarray(masks, dtype=np.int64).ravel()
+        return self.dispatchUnits(utils.masksToUnitsMatrix(masks, self.nUnits), demands)
+
+    def dispatchUnits(self, u, demands):
+        # Same as dispatch with the commitments as a (len(demands), nUnits) 0/1 matrix instead of masks
+        # (the fleets above 63 units do not fit in an int64 mask)
+        u = np.asarray(u, dtype=np.float64)
+        demands = np.asarray(demands, dtype=np.float64).ravel()
+        assert u.shape == (len(demands), self.nUnits)
+
+        lo = u * self.Pmin[None, :]
+        hi = u * self.Pmax[None, :]
+
+        # Same check as Node.isValid
+        feasible = (lo.sum(axis=1) <= demands) & (demands <= hi.sum(axis=1))
+
+        # 1. Bisection on lambda, all the problems at once
+        lamLo = np.full(len(demands), self._lambdaLo)
+        lamHi = np.full(len(demands), self._lambdaHi)
+        for _ in range(N_BISECTION_STEPS):
+            lam = 0.5 * (lamLo + lamHi)
+            tooLow = self._power(lam, lo, hi).sum(axis=1) < demands
+            lamLo = np.where(tooLow, lam, lamLo)
+            lamHi = np.where(tooLow, lamHi, lam)
+        lam = 0.5 * (lamLo + lamHi)
+
+        # 2. Breakpoint step: with the set of units at their bounds known,
+        # the balance equation is linear in lambda on the free units
+        p = self._power(lam, lo, hi)
+        free = (p > lo) & (p < hi)
+        fixedPower = np.where(free, 0.0, p).sum(axis=1)
+        slope = np.where(free, 1 / (2 * self.c3[None, :]), 0.0).sum(axis=1)
+        offset = np.where(free, self.c2[None, :] / (2 * self.c3[None, :]), 0.0).sum(axis=1)
+        hasFree = slope > 0
+        lamExact = np.where(hasFree, (demands - fixedPower + offset) / np.where(hasFree, slope, 1.0), lam)
+        p = self._power(lamExact, lo, hi)
+
+        costs = (u * self.c1[None, :] + self.c2[None, :] * p + self.c3[None, :] * p**2).sum(axis=1)
+        costs = np.where(feasible, costs, INFEASIBLE_COST)
+        p[~feasible] = 0
+        return p, costs
+
+    def cost(self, masks, demands):
+        # Return only the ED costs (the _F of the nodes)
+        return self.dispatch(masks, demands)[1]
@@ -0,0 +1,275 @@
+#This module contains a dynamic-programming (DP) solver for the UC network.
+# The network is a layered DAG from the source (period -1) to the sink (period nPeriodi).
+# Without min up/down the UC problem is a shortest path on it. With min up/down every label of the DP
+# also carries, for each unit, how many periods the unit has been in its current state (capped at the
+# min up/down time of that state): a unit can switch only if its counter reached the min up/down time.
+# A label is dominated by another label on the same node with lower cost and counters that are all
+# greater or equal (more elapsed time can only allow more switches), so it is pruned.
+# Labels are also pruned by bound: cost + (shortest path to the sink without min up/down) > upper bound,
+# where the upper bound comes from a first greedy pass that keeps only the cheapest label of each node.
+#
+# The counters reproduce the constraints of UC_Model.generateUCNetworkModel:
+#   - the switches of the arcs from the source are constrained too, the units start unlocked (initial_status
+#     is considered held for long enough) unless initialCounters or input.initial_status_periods is given,
+#   - a switch into the last period (nPeriodi-1) is never forbidden (relaxLastPeriod),
+#   - the arcs to the sink are never constrained.
+import numpy as np
+
+import input
+import utils
+
+DOMINANCE_BLOCK_SIZE = 2**22  # label pairs compared at once by the dominance test
+
+
+class DPSolution():
+    """
+    Optimal path found by the DP solver
+
+    Attributes:
+        objective: cost of the path
+        nodePath: network node indexes from the source to the sink
+        arcPath: network arc indexes of the path
+        masks: commitment mask of each period 0..nPeriodi-1
+        nLabels: number of labels kept in each layer (a measure of the work done)
+    """
+
+    def __init__(self, objective, nodePath, arcPath, masks, nLabels):
+        self.objective = objective
+        self.nodePath = nodePath
+        self.arcPath = arcPath
+        self.masks = masks
+        self.nLabels = nLabels
+
+    def getCommitmentStrings(self, nUnits):
+        return [utils.intToBinStr(m, nUnits) for m in self.masks]
+
+
+def lockedMasks(masks, counters, tauUp, tauDown, nUnits):
+    # Bitmask of the units that can not switch: counter lower than the min up (if on) or min down (if off) time
+    unitsOn = utils.masksToUnitsMatrix(masks, nUnits) > 0
+    tau = np.where(unitsOn, tauUp[None, :], tauDown[None, :])
+    bits = np.left_shift(1, np.arange(nUnits - 1, -1, -1, dtype=np.int64))
+    return ((counters < tau) * bits[None, :]).sum(axis=1)
+
+
+def nextCounters(counters, switched, toMasks, tauUp, tauDown, nUnits):
+    # Counters after a transition: 1 for the units that switched, +1 otherwise (capped at the min up/down time of the new state)
+    switchedUnits = utils.masksToUnitsMatrix(switched, nUnits) > 0
+    unitsOn = utils.masksToUnitsMatrix(toMasks, nUnits) > 0
+    counters = np.where(switchedUnits, 1, counters + 1)
+    return np.minimum(counters, np.where(unitsOn, tauUp[None, :], tauDown[None, :]))
+
+
+def getInitialCounters(inp, tauUp, tauDown):
+    # Periods each unit has been in its initial status (inp.initial_status_periods), capped at its min up/down time.
+    # Without history the units are considered free to switch at the first period.
+    cap = np.maximum(tauUp, tauDown)
+    initialStatusPeriods = getattr(inp, 'initial_status_periods', None)
+    if initialStatusPeriods is None:
+        return cap
+    return np.minimum(np.asarray(initialStatusPeriods, dtype=np.int64), cap)
+
+
+def isFeasibleSchedule(masks, initialMask, initialCounters, tauUp, tauDown, nUnits, relaxLastPeriod=True):
+    # True if the commitment masks of the periods 0..len(masks)-1, from initialMask with initialCounters, switch no unit
+    # before its min up/down time (with the rules of solveDP: a switch into the last period is never forbidden)
+    tauUp = np.asarray(tauUp, dtype=np.int64)
+    tauDown = np.asarray(tauDown, dtype=np.int64)
+    masks = np.concatenate([[initialMask], np.asarray(masks, dtype=np.int64)]).astype(np.int64)
+    counters = np.minimum(np.asarray(initialCounters, dtype=np.int64), np.maximum(tauUp, tauDown))[None, :]
+    for t in range(len(masks) - 1):
+        switched = masks[t:t + 1] ^ masks[t + 1:t + 2]
+        if not (relaxLastPeriod and t == len(masks) - 2):
+            if switched[0] & lockedMasks(masks[t:t + 1], counters, tauUp, tauDown, nUnits)[0]:
+                return False
+        counters = nextCounters(counters, switched, masks[t + 1:t + 2], tauUp, tauDown, nUnits)
+    return True
+
+
+def lowerBoundsToSink(net):
+    # Cost of the shortest path from each node to the sink, ignoring min up/down
+    lb = np.zeros(net.nNodes)
+    for t in range(net.nPeriods - 1, -2, -1):
+        nodes = net.nodesOfPeriod(t)
+        if len(nodes) == 0:
+            continue
+        first, last = net.arcPtr[nodes[0]], net.arcPtr[nodes[-1] + 1]
+        costsToSink = net.arcCost[first:last] + lb[net.arcTo[first:last]]
+        hasArcs = net.arcPtr[nodes + 1] > net.arcPtr[nodes]
+        lb[nodes] = np.inf
+        if np.any(hasArcs):
+            lb[nodes[hasArcs]] = np.minimum.reduceat(costsToSink, net.arcPtr[nodes[hasArcs]] - first)
+    return lb
+
+
+def _cheapestPerNode(heads, costs, counters):
+    # Return the index of the cheapest label of each node
+    order = np.lexsort((costs, heads))
+    return order[np.r_[True, heads[order][1:] != heads[order][:-1]]] if len(order) else order
+
+
+def _pruneDominated(heads, costs, counters):
+    # Return the indexes of the labels that are not dominated by another label on the same node.
+    # The duplicates (same node and counters) are removed first, keeping the cheapest
+    if len(heads) == 0:
+        return np.array([], dtype=np.int64)
+    words, guards = _packCounters(counters)
+    order = np.lexsort((costs,) + tuple(words.T) + (heads,))
+    sortedKeys = np.column_stack([heads, words])[order]
+    unique = order[np.r_[True, np.any(sortedKeys[1:] != sortedKeys[:-1], axis=1)]]
+
+    # labels by node, then by increasing cost (and decreasing sum of the counters, so that a label comes after the
+    # labels of the same cost that dominate it): a label is dominated if an earlier label of its node has counters
+    # that are all greater or equal (dominance is transitive, so testing the earlier labels is the same as testing
+    # the earlier kept labels)
+    order = unique[np.lexsort((-counters[unique].sum(axis=1), costs[unique], heads[unique]))]
+    sortedHeads = heads[order]
+    starts = np.flatnonzero(np.r_[True, sortedHeads[1:] != sortedHeads[:-1]])
+    ends = np.r_[starts[1:], len(order)]
+    isKept = np.ones(len(order), dtype=bool)
+    for start, end in zip(starts[ends - starts > 1], ends[ends - starts > 1]):
+        isKept[start:end] = _getNotDominated(words[order[start:end]], guards)
+    return order[isKept]
+
+
+def _packCounters(counters):
+    # Pack the counters of every label in a few int64 words, each counter in a field with a guard bit on top.
+    # Return (words, guards): guards has the guard bits of each word. A label a then has all its counters greater
+    # or equal to the ones of a label b iff no guard bit is borrowed in ((a | guards) - b), for every word
+    bits = max(1, int(counters.max(initial=0)).bit_length())
+    fieldBits = bits + 1
+    perWord = max(1, 63 // fieldBits)
+    nUnits = counters.shape[1]
+    words, guards = [], []
+    for first in range(0, nUnits, perWord):
+        word = np.zeros(len(counters), dtype=np.int64)
+        guard = 0
+        for k in range(first, min(first + perWord, nUnits)):
+            word = (word << fieldBits) | counters[:, k]
+            guard = (guard << fieldBits) | (1 << bits)
+        words.append(word)
+        guards.append(guard)
+    return np.column_stack(words), np.array(guards, dtype=np.int64)
+
+
+def _getNotDominated(words, guards):
+    # Packed counters (see _packCounters) of the labels of one node by increasing cost: True for the labels that no
+    # earlier label dominates. The comparisons are broadcast by blocks of labels, to bound the memory
+    nLabels, nWords = words.shape
+    blockSize = max(1, DOMINANCE_BLOCK_SIZE // (nLabels * nWords))
+    isKept = np.ones(nLabels, dtype=bool)
+    for first in range(1, nLabels, blockSize):
+        last = min(first + blockSize, nLabels)
+        # dominates[j, i]: the label i (earlier than first + j) dominates the label first + j
+        dominates = np.arange(last)[None, :] < np.arange(first, last)[:, None]
+        for w in range(nWords):
+            borrow = ((words[None, :last, w] | guards[w]) - words[first:last, None, w]) & guards[w]
+            dominates &= borrow == guards[w]
+        isKept[first:last] = ~np.any(dominates, axis=1)
+    return isKept
+
+
+def solveDP(net, tauUp=None, tauDown=None, doMinUpMinDown=True, initialCounters=None, relaxLastPeriod=True,
+            upperBound=None):
+    # Solve the UC problem on a network.UC_NetworkCSR. Return a DPSolution (None if there is no feasible path).
+    # upperBound is the cost of a known feasible path (e.g. the previous solution), it is used to prune labels.
+    nUnits = net.nUnits
+    if tauUp is None:
+        tauUp = input.min_switch_up
+    if tauDown is None:
+        tauDown = input.min_switch_down
+    tauUp = np.asarray(tauUp, dtype=np.int64)
+    tauDown = np.asarray(tauDown, dtype=np.int64)
+    if not doMinUpMinDown:
+        tauUp = np.zeros(nUnits, dtype=np.int64)
+        tauDown = np.zeros(nUnits, dtype=np.int64)
+    cap = np.maximum(tauUp, tauDown)
+    if initialCounters is None:
+        initialCounters = getInitialCounters(input, tauUp, tauDown)
+    initialCounters = np.minimum(np.asarray(initialCounters, dtype=np.int64), cap)
+    if np.any(np.diff(net.periodPtr) == 0):
+        # a period without nodes (e.g. the demand is over the capacity of the fleet): no path at all
+        return None
+
+    if not np.any(cap > 1):
+        # no counters: the cheapest label of each node is the shortest path
+        return _solveLabels(net, tauUp, tauDown, initialCounters, relaxLastPeriod, _cheapestPerNode)
+
+    greedySolution = _solveLabels(net, tauUp, tauDown, initialCounters, relaxLastPeriod, _cheapestPerNode)
+    if greedySolution is not None:
+        upperBound = greedySolution.objective if upperBound is None else min(upperBound, greedySolution.objective)
+    bound = None
+    if upperBound is not None:
+        bound = (upperBound + 1e-6 * max(1, abs(upperBound)), lowerBoundsToSink(net))
+    return _solveLabels(net, tauUp, tauDown, initialCounters, relaxLastPeriod, _pruneDominated, bound)
+
+
+def _solveLabels(net, tauUp, tauDown, initialCounters, relaxLastPeriod, selectLabels, bound=None):
+    # Label-setting DP, layer by layer. selectLabels(heads, costs, counters) returns the labels kept on each node,
+    # bound is (upper bound, lower bounds to the sink) or None
+    nUnits = net.nUnits
+    # Labels of the current layer: node, cost, counters. Every layer also remembers (parent label, arc) to rebuild the path
+    labelNode = np.array([net.source], dtype=np.int64)
+    labelCost = np.zeros(1)
+    labelCounters = initialCounters[None, :].copy()
+    history = []
+    nLabels = [1]
+
+    for t in range(-1, net.nPeriods):
+        toSink = t == net.nPeriods - 1
+        checkLocks = not toSink and not (relaxLastPeriod and t + 1 == net.nPeriods - 1)
+
+        # 1. Expand every label along all the out arcs of its node
+        degree = net.arcPtr[labelNode + 1] - net.arcPtr[labelNode]
+        candLabel = np.repeat(np.arange(len(labelNode)), degree)
+        firstCand = np.cumsum(degree) - degree
+        candArc = net.arcPtr[labelNode][candLabel] + np.arange(len(candLabel)) - firstCand[candLabel]
+        heads = net.arcTo[candArc].astype(np.int64)
+        costs = labelCost[candLabel] + net.arcCost[candArc]
+
+        fromMasks = net.nodeMask[labelNode][candLabel]
+        toMasks = net.nodeMask[heads]
+        switched = fromMasks ^ toMasks
+        if checkLocks:
+            locked = lockedMasks(net.nodeMask[labelNode], labelCounters, tauUp, tauDown, nUnits)
+            allowed = (switched & locked[candLabel]) == 0
+            candLabel, candArc, heads, costs, toMasks, switched = (
+                candLabel[allowed], candArc[allowed], heads[allowed], costs[allowed], toMasks[allowed], switched[allowed])
+
+        if bound is not None and not toSink:
+            upperBound, lb = bound
+            inBound = costs + lb[heads] <= upperBound
+            candLabel, candArc, heads, costs, toMasks, switched = (
+                candLabel[inBound], candArc[inBound], heads[inBound], costs[inBound], toMasks[inBound], switched[inBound])
+
+        if toSink:
+            if len(costs) == 0:
+                return None
+            best = int(np.argmin(costs))
+            history.append((candLabel[best:best + 1], candArc[best:best + 1]))
+            objective = float(costs[best])
+            nLabels.append(1)
+            break
+
+        # 2. Update the counters: 1 for the units that switched, +1 otherwise (capped at the min up/down time of the new state)
+        counters = nextCounters(labelCounters[candLabel], switched, toMasks, tauUp, tauDown, nUnits)
+
+        # 3. Keep only the selected (e.g. non-dominated) labels of each node
+        keep = selectLabels(heads, costs, counters)
+
+        history.append((candLabel[keep], candArc[keep]))
+        labelNode, labelCost, labelCounters = heads[keep], costs[keep], counters[keep]
+        nLabels.append(len(keep))
+        if len(labelNode) == 0:
+            return None
+
+    # Rebuild the path from the sink
+    arcPath = []
+    label = 0
+    for (parents, arcs) in reversed(history):
+        arcPath.append(int(arcs[label]))
+        label = parents[label]
+    arcPath.reverse()
+    nodePath = [net.source] + [int(net.arcTo[a]) for a in arcPath]
+    masks = [int(net.nodeMask[k]) for k in nodePath[1:-1]]
+    return DPSolution(objective, nodePath, arcPath, masks, nLabels)
@@ -0,0 +1,159 @@
+#This module contains the cache of the Economic Dispatch (ED) costs.
+# The ED cost of a node only depends on its commitment mask and on the demand of its period,
+# so the costs are memoized with the key (commitment mask, demand) and shared:
+#   - across periods (the same demand in two periods is solved once),
+#   - across processes (every process reads and writes the same SQLite file),
+#   - across runs (the SQLite file is kept on disk, with a least-recently-used eviction
+#     when it grows over maxEntries).
+# The in-memory dict is also bounded by maxEntries (least recently used out), so a long-lived cache without a disk
+# store (path=None, e.g. in the solve service) does not grow with every demand it sees.
+# The costs of different fleets never mix: every entry is also tagged with a fingerprint of the unit parameters.
+import hashlib
+import os
+import sqlite3
+import time
+
+import numpy as np
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.edcache.sqlite')
+DEFAULT_MAX_ENTRIES = 200000
+
+
+def fleetKey(inp):
+    # Fingerprint of the parameters the ED cost depends on
+    params = repr([list(inp.c1), list(inp.c2), list(inp.c3), list(inp.Pmin), list(inp.Pmax)])
+    return hashlib.sha1(params.encode()).hexdigest()
+
+
+class EDCostCache():
+    """
+    Two-level cache of ED costs: an in-memory dict in front of a SQLite store
+
+    Attributes:
+        path: path of the SQLite file (None to keep the cache in memory only)
+        fleet: fingerprint of the fleet (see fleetKey)
+        maxEntries: maximum number of entries kept on disk and in memory
+        hits, misses: lookup statistics of this process
+    """
+
+    def __init__(self, fleet, path=DEFAULT_CACHE_PATH, maxEntries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.fleet = fleet
+        self.maxEntries = maxEntries
+        self.hits = 0
+        self.misses = 0
+
+        self._memory = {}
+        self._pendingStores = {}
+        self._pendingHits = set()
+        self._connection = None
+        if path is not None:
+            self._connection = sqlite3.connect(path, timeout=60)
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS ed_cost (fleet TEXT, mask INTEGER, demand REAL, cost REAL, last_used REAL, '
+                'PRIMARY KEY (fleet, mask, demand))')
+            self._connection.commit()
+            # The store is small, load all the entries of this fleet once (the most recently used last)
+            for (mask, demand, cost) in self._connection.execute(
+                    'SELECT mask, demand, cost FROM ed_cost WHERE fleet = ? ORDER BY last_used', (fleet,)):
+                self._memory[(mask, demand)] = cost
+
+    def __len__(self):
+        return len(self._memory)
+
+    def lookup(self, mask, demand):
+        # Return the cached cost or None
+        key = (int(mask), float(demand))
+        cost = self._memory.pop(key, None)
+        if cost is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._memory[key] = cost  # most recently used last
+        if self._connection is not None:
+            self._pendingHits.add(key)
+        return cost
+
+    def store(self, mask, demand, cost):
+        key = (int(mask), float(demand))
+        self._memory.pop(key, None)
+        self._memory[key] = float(cost)
+        if self._connection is not None:
+            self._pendingStores[key] = float(cost)
+        while len(self._memory) > self.maxEntries:
+            del self._memory[next(iter(self._memory))]
+
+    def getCosts(self, masks, demands, solveFunction):
+        # Return the costs of all the pairs (masks[k], demands[k]).
+        # The missing pairs are deduplicated and solved in one call of solveFunction(masks, demands).
+        costs, missing = self.getCachedCosts(masks, demands)
+        if missing:
+            keys = list(missing)
+            self.storeMissing(costs, missing, solveFunction([m for (m, _) in keys], [d for (_, d) in keys]))
+        return costs
+
+    def getCachedCosts(self, masks, demands):
+        # First half of getCosts: return (costs, missing), the costs of the cached pairs and, for every distinct
+        # missing pair, the indexes k where it is needed (the costs of these indexes are not set yet)
+        masks = np.asarray(masks, dtype=np.int64).ravel()
+        demands = np.asarray(demands, dtype=np.float64).ravel()
+        costs = np.empty(len(masks))
+
+        missing = {}
+        for k, key in enumerate(zip(masks.tolist(), demands.tolist())):
+            cost = self.lookup(*key)
+            if cost is None:
+                missing.setdefault(key, []).append(k)
+            else:
+                costs[k] = cost
+        return costs, missing
+
+    def storeMissing(self, costs, missing, solvedCosts):
+        # Second half of getCosts: store the costs solved for the missing pairs (in the order of missing) and fill costs
+        for key, cost in zip(missing, solvedCosts):
+            self.store(key[0], key[1], cost)
+            costs[missing[key]] = cost
+        # the duplicates of a missing key have been solved once
+        nDuplicates = sum(len(idxs) - 1 for idxs in missing.values())
+        self.misses -= nDuplicates
+        self.hits += nDuplicates
+
+    def flush(self):
+        # Write the new entries (and the last use of the hit ones) to disk, then evict the oldest entries
+        if self._connection is None:
+            self._pendingStores.clear()
+            self._pendingHits.clear()
+            return
+        now = time.time()
+        self._connection.executemany(
+            'INSERT OR REPLACE INTO ed_cost (fleet, mask, demand, cost, last_used) VALUES (?, ?, ?, ?, ?)',
+            [(self.fleet, m, d, c, now) for ((m, d), c) in self._pendingStores.items()])
+        self._connection.executemany(
+            'UPDATE ed_cost SET last_used = ? WHERE fleet = ? AND mask = ? AND demand = ?',
+            [(now, self.fleet, m, d) for (m, d) in self._pendingHits])
+        nEntries = self._connection.execute('SELECT COUNT(*) FROM ed_cost').fetchone()[0]
+        if nEntries > self.maxEntries:
+            self._connection.execute(
+                'DELETE FROM ed_cost WHERE rowid IN (SELECT rowid FROM ed_cost ORDER BY last_used ASC LIMIT ?)',
+                (nEntries - self.maxEntries,))
+        self._connection.commit()
+        self._pendingStores.clear()
+        self._pendingHits.clear()
+
+    def close(self):
+        self.flush()
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+# One cache per (process, path, fleet). A SQLite connection must not be shared with a forked process,
+# so a worker process opens its own connection to the same file.
+_openCaches = {}
+
+
+def openCache(fleet, path=DEFAULT_CACHE_PATH, maxEntries=DEFAULT_MAX_ENTRIES):
+    key = (os.getpid(), path, fleet)
+    if key not in _openCaches:
+        _openCaches[key] = EDCostCache(fleet, path, maxEntries)
+    return _openCaches[key]
@@ -22,6 +22,8 @@ if DO_HUGE_SIZE_PROBLEM:
     # end size of I
 
     initial_status = '1100000000'
+    # number of periods each unit has been in its initial status
+    initial_status_periods = [8, 8, 5, 5, 6, 3, 3, 1, 1, 1]
 else:
     nUnita = 5
     nPeriodi = 10
@@ -44,3 +46,5 @@ else:
     # end size of I
 
     initial_status = '11000'
+    # number of periods each unit has been in its initial status
+    initial_status_periods = [8, 8, 5, 5, 6]
@@ -0,0 +1,189 @@
+#This module contains the instrumentation of a run: nested phase timers, counters and latency histograms.
+# It is disabled by default: phase() then returns a shared no-op context and count()/observe() return at once,
+# so the instrumented code pays one function call per event.
+# A worker process records in its own copy of the module and sends snapshot() back to the parent, which
+# merges it with merge(); the histograms of all the workers are added bucket by bucket.
+#
+# Usage: instrument.enable()
+#        with instrument.phase('network'):
+#            with instrument.phase('ED'):
+#                ...
+#        instrument.count('nodes', len(nodes))
+#        instrument.observe('ED solve', seconds)
+#        print(instrument.summary()); instrument.saveJSON(path)
+import contextlib
+import json
+import math
+import time
+
+ENABLED = False
+N_BUCKETS = 40  # bucket k holds the values in [2^(k-1), 2^k) microseconds (bucket 0: below 1 us)
+
+_phases = {}  # 'network/ED' -> [seconds, calls]
+_counters = {}
+_histograms = {}
+_stack = []
+_NULL_PHASE = contextlib.nullcontext()
+
+
+class Histogram():
+    """
+    Latency histogram with power-of-two buckets in microseconds
+
+    Attributes:
+        buckets: number of values in each bucket
+        count, total, minimum, maximum: statistics of the values (in seconds)
+    """
+
+    def __init__(self):
+        self.buckets = [0] * N_BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.minimum = math.inf
+        self.maximum = 0.0
+
+    def add(self, seconds):
+        microseconds = seconds * 1e6
+        bucket = 0 if microseconds < 1 else min(N_BUCKETS - 1, int(math.log2(microseconds)) + 1)
+        self.buckets[bucket] += 1
+        self.count += 1
+        self.total += seconds
+        self.minimum = min(self.minimum, seconds)
+        self.maximum = max(self.maximum, seconds)
+
+    def merge(self, other):
+        self.buckets = [a + b for a, b in zip(self.buckets, other.buckets)]
+        self.count += other.count
+        self.total += other.total
+        self.minimum = min(self.minimum, other.minimum)
+        self.maximum = max(self.maximum, other.maximum)
+
+    def quantile(self, q):
+        # Upper edge (in seconds) of the bucket holding the q-quantile
+        if self.count == 0:
+            return None
+        seen = 0
+        for bucket, n in enumerate(self.buckets):
+            seen += n
+            if seen >= q * self.count:
+                return min(2**bucket * 1e-6, self.maximum)
+        return self.maximum
+
+    def toDict(self):
+        return {'buckets': self.buckets, 'count': self.count, 'total': self.total,
+                'minimum': self.minimum if self.count else None, 'maximum': self.maximum}
+
+    @staticmethod
+    def fromDict(d):
+        histogram = Histogram()
+        histogram.buckets = list(d['buckets'])
+        histogram.count = d['count']
+        histogram.total = d['total']
+        histogram.minimum = math.inf if d['minimum'] is None else d['minimum']
+        histogram.maximum = d['maximum']
+        return histogram
+
+
+def enable(enabled=True):
+    global ENABLED
+    ENABLED = enabled
+
+
+def reset():
+    _phases.clear()
+    _counters.clear()
+    _histograms.clear()
+    _stack.clear()
+
+
+@contextlib.contextmanager
+def _timedPhase(name):
+    _stack.append(name)
+    # the entry is created on entry, so that a phase is listed before the phases nested in it
+    entry = _phases.setdefault('/'.join(_stack), [0.0, 0])
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        entry[0] += time.perf_counter() - start
+        entry[1] += 1
+        _stack.pop()
+
+
+def phase(name):
+    # Context manager timing the phase name, nested in the phases already open
+    if not ENABLED:
+        return _NULL_PHASE
+    return _timedPhase(name)
+
+
+def record(name, seconds):
+    # Add a phase timed elsewhere (e.g. UC_Model.buildTimes), nested in the phases already open
+    if not ENABLED:
+        return
+    entry = _phases.setdefault('/'.join(_stack + [name]), [0.0, 0])
+    entry[0] += seconds
+    entry[1] += 1
+
+
+def count(name, n=1):
+    if not ENABLED:
+        return
+    _counters[name] = _counters.get(name, 0) + n
+
+
+def observe(name, seconds):
+    # Add a latency to the histogram name
+    if not ENABLED:
+        return
+    histogram = _histograms.get(name)
+    if histogram is None:
+        histogram = _histograms[name] = Histogram()
+    histogram.add(seconds)
+
+
+def snapshot():
+    # Everything recorded so far as a plain dict (JSON-serializable and picklable)
+    return {'phases': {path: {'seconds': s, 'calls': c} for path, (s, c) in _phases.items()},
+            'counters': dict(_counters),
+            'histograms': {name: h.toDict() for name, h in _histograms.items()}}
+
+
+def merge(other):
+    # Add a snapshot (e.g. of a worker process) to what is recorded here.
+    # The phases of a worker are added as they are (they overlap in time with the phases of the parent)
+    for path, entry in other['phases'].items():
+        mine = _phases.setdefault(path, [0.0, 0])
+        mine[0] += entry['seconds']
+        mine[1] += entry['calls']
+    for name, n in other['counters'].items():
+        _counters[name] = _counters.get(name, 0) + n
+    for name, d in other['histograms'].items():
+        histogram = Histogram.fromDict(d)
+        if name in _histograms:
+            _histograms[name].merge(histogram)
+        else:
+            _histograms[name] = histogram
+
+
+def summary():
+    # Text summary: the phases as a tree, the counters and the quantiles of the histograms
+    lines = ['Phases:']
+    for path, (seconds, calls) in _phases.items():
+        depth = path.count('/')
+        name = path.rsplit('/', 1)[-1]
+        lines.append(f"{'  ' * (depth + 1)}{name:<{32 - 2 * depth}} {seconds:10.4f} s  ({calls} calls)")
+    if _counters:
+        lines.append('Counters:')
+        lines.extend(f"  {name:<32} {n}" for name, n in _counters.items())
+    if _histograms:
+        lines.append('Histograms:')
+        for name, h in _histograms.items():
+            lines.append(f"  {name:<32} n={h.count} mean={1e3*h.total/h.count:.3f} ms p50<={1e3*h.quantile(0.5):.3f} ms "
+                         f"p90<={1e3*h.quantile(0.9):.3f} ms p99<={1e3*h.quantile(0.99):.3f} ms max={1e3*h.maximum:.3f} ms")
+    return '\n'.join(lines)
+
+
+def saveJSON(path):
+    with open(path, 'w') as f:
+        json.dump(snapshot(), f, indent=2)
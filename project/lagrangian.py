@@ -0,0 +1,278 @@
+#This module contains a Lagrangian-relaxation solver of the UC problem that decomposes it by unit.
+# The network has 2^nUnits states per period. Only the demand balance sum_i p[i,t] == D[t] couples the units:
+# with multipliers lambda[t] on it, the relaxed problem splits into one small problem per unit
+#   min  sum_t u[t]*(c1 + c2 p[t] + c3 p[t]^2 - lambda[t] p[t]) + startup_cost * (startups of the unit)
+#   s.t. u[t]*Pmin <= p[t] <= u[t]*Pmax, min up/down of the unit
+# whose p[t] is the clipped KKT power of dispatch and whose commitment is a DP on the states (on/off, periods in
+# the state capped at the min up/down time), with the counter rules of dpsolver. So one iteration costs
+# O(nUnits * nPeriods * max min up/down): all the units are solved at once with NumPy. This batch is the parallel
+# path: a pool of processes does not pay off, sending the blocks of units to the workers at every iteration costs
+# more than solving them (3.5x slower with 2 workers on the default case).
+#   - lower bound: the value of the relaxed problem, L(lambda) = sum of the unit values + sum_t lambda[t] D[t],
+#   - multipliers: subgradient steps lambda += step * (D - sum_i p[i]), step = theta (UB - L) / |D - sum_i p|^2,
+#     theta is halved when the lower bound stops improving,
+#   - upper bound: the commitment of the units is repaired by raising lambda in the periods short of capacity
+#     (lowering it where the sum of Pmin is over the demand) and solving the unit problems again, so the repaired
+#     schedule always meets the min up/down times. Its cost is the exact ED cost (dispatch) plus the startups.
+# The schedule is not optimal in general, its gap to the optimum is at most (UB - L) / UB.
+# No mask is built: the commitment is a (nPeriods, nUnits) matrix, so the fleet can have more than 63 units.
+#
+# Usage: python lagrangian.py --units 100 --periods 24 [--iterations 200] [--exact]
+import argparse
+import time
+
+import numpy as np
+
+import beam
+import dispatch
+import dpsolver
+import input
+import solvers
+
+DEFAULT_ITERATIONS = 200
+DEFAULT_GAP = 1e-3  # stop when (UB - L) / UB is below this
+PATIENCE = 5  # iterations without a better lower bound before theta is halved
+MIN_THETA = 1e-4
+REPAIR_ROUNDS = 50
+REPAIR_STEP = 0.02  # relative change of lambda in the periods to repair, at each round
+
+
+class LagrangianSolution():
+    """
+    Best schedule found by the Lagrangian relaxation and its bounds
+
+    Attributes:
+        schedule: solvers.CommitmentSchedule of the best repaired schedule (None if no repair was feasible)
+        upperBound: cost of the schedule (inf if there is none)
+        lowerBound: best value of the relaxed problem (no schedule costs less)
+        multipliers: lambda of each period at the best lower bound
+        history: (lower bound, upper bound) after each iteration
+        solveTime: seconds spent
+    """
+
+    def __init__(self, schedule, upperBound, lowerBound, multipliers, history, solveTime):
+        self.schedule = schedule
+        self.upperBound = upperBound
+        self.lowerBound = lowerBound
+        self.multipliers = multipliers
+        self.history = history
+        self.solveTime = solveTime
+
+    @property
+    def gap(self):
+        # Bound on the relative gap of the schedule to the optimum
+        if self.schedule is None:
+            return None
+        return (self.upperBound - self.lowerBound) / abs(self.upperBound)
+
+
+def getOnCosts(fleet, lam, units):
+    # Cost of each unit in units when it is on at each period, at its best power for the multipliers lam.
+    # Return (costs, P): (len(units), nPeriods) arrays
+    c1, c2, c3 = (np.asarray(v, dtype=np.float64)[units, None] for v in (fleet.c1, fleet.c2, fleet.c3))
+    Pmin, Pmax = (np.asarray(v, dtype=np.float64)[units, None] for v in (fleet.Pmin, fleet.Pmax))
+    P = np.clip((lam[None, :] - c2) / (2 * c3), Pmin, Pmax)
+    return c1 + c2 * P + c3 * P**2 - lam[None, :] * P, P
+
+
+def solveUnitDPs(onCosts, startupCosts, tauUp, tauDown, initialOn, initialCounters, relaxLastPeriod=True):
+    # Cheapest commitment of every unit alone, with its min up/down times: onCosts[i, t] is paid when the unit i is
+    # on at t, startupCosts[i] when it switches on. Return (u, values): u is the (nUnits, nPeriods) 0/1 commitment
+    nUnits, nPeriods = onCosts.shape
+    rows = np.arange(nUnits)
+    # the states of a unit are (on or off, counter k): the counter is capped at the min up/down time of the state
+    capOn, capOff = np.maximum(tauUp, 1), np.maximum(tauDown, 1)
+    K = int(max(capOn.max(), capOff.max()))
+    ks = np.arange(K + 1)
+    isOnState = ks[None, :] <= capOn[:, None]
+    isOffState = ks[None, :] <= capOff[:, None]
+    canLeaveOn = ks[None, :] >= tauUp[:, None]
+    canLeaveOff = ks[None, :] >= tauDown[:, None]
+
+    # value of each state before period 0 (inf if the unit is not in it)
+    on = np.full((nUnits, K + 1), np.inf)
+    off = np.full((nUnits, K + 1), np.inf)
+    counters = np.minimum(initialCounters, np.where(initialOn, capOn, capOff))
+    on[rows[initialOn], counters[initialOn]] = 0
+    off[rows[~initialOn], counters[~initialOn]] = 0
+
+    def nextValues(stay, cap, isState, leave, switchCost, pred, stayIndex, switchIndex):
+        # values of the states of one kind at the next period, and their predecessors (in pred)
+        # stay in the state: k-1 -> k, and k -> k at the cap
+        new = np.full((nUnits, K + 1), np.inf)
+        new[:, 1:] = stay[:, :-1]
+        pred[:, :] = stayIndex + ks[None, :] - 1
+        atCap = stay[rows, cap] < new[rows, cap]
+        new[rows[atCap], cap[atCap]] = stay[rows[atCap], cap[atCap]]
+        pred[rows[atCap], cap[atCap]] = stayIndex + cap[atCap]
+        # switch from the other state (the unit must have been in it for long enough)
+        j = np.argmin(leave, axis=1)
+        switch = leave[rows, j] + switchCost
+        better = switch < new[:, 1]
+        new[better, 1] = switch[better]
+        pred[better, 1] = switchIndex + j[better]
+        new[~isState] = np.inf
+        return new
+
+    # best predecessor of each state at each period: k for (on, k), K+1+k for (off, k)
+    predOn = np.empty((nPeriods, nUnits, K + 1), dtype=np.int64)
+    predOff = np.empty((nPeriods, nUnits, K + 1), dtype=np.int64)
+    for t in range(nPeriods):
+        relax = relaxLastPeriod and t == nPeriods - 1
+        leaveOn = on if relax else np.where(canLeaveOn, on, np.inf)
+        leaveOff = off if relax else np.where(canLeaveOff, off, np.inf)
+        on, off = (nextValues(on, capOn, isOnState, leaveOff, startupCosts, predOn[t], 0, K + 1) + onCosts[:, t][:, None],
+                   nextValues(off, capOff, isOffState, leaveOn, 0, predOff[t], K + 1, 0))
+
+    # best final state of each unit, then back along the predecessors
+    final = np.concatenate([on, off], axis=1)
+    state = np.argmin(final, axis=1)
+    values = final[rows, state]
+    u = np.zeros((nUnits, nPeriods), dtype=np.int64)
+    for t in range(nPeriods - 1, -1, -1):
+        isOn = state <= K
+        u[:, t] = isOn
+        k = np.where(isOn, state, state - K - 1)
+        state = np.where(isOn, predOn[t, rows, k], predOff[t, rows, k])
+    return u, values
+
+
+def getMinUpMinDown(fleet, doMinUpMinDown=True):
+    if not doMinUpMinDown:
+        return np.zeros(fleet.nUnita, dtype=np.int64), np.zeros(fleet.nUnita, dtype=np.int64)
+    return np.asarray(fleet.min_switch_up, dtype=np.int64), np.asarray(fleet.min_switch_down, dtype=np.int64)
+
+
+def getInitialMultipliers(fleet):
+    # lambda[t]: average full-load cost of the last unit of the priority order needed to cover D[t]
+    order = beam.getPriorityOrder(fleet)
+    Pmax = np.asarray(fleet.Pmax, dtype=np.float64)[order]
+    averageCost = ((np.asarray(fleet.c1)[order] + np.asarray(fleet.c2)[order] * Pmax
+                    + np.asarray(fleet.c3)[order] * Pmax**2) / Pmax)
+    last = np.minimum(np.searchsorted(np.cumsum(Pmax), fleet.D), len(order) - 1)
+    return averageCost[last]
+
+
+def getScheduleFromUnits(u, fleet, edEngine):
+    # solvers.CommitmentSchedule of a (nPeriods, nUnits) commitment, the masks are Python integers
+    D = np.asarray(fleet.D, dtype=np.float64)
+    P, edCosts = edEngine.dispatchUnits(u, D)
+    initialOn = np.array([s == '1' for s in fleet.initial_status], dtype=np.int64)
+    fromU = np.vstack([initialOn[None, :], u[:-1]])
+    startupCosts = ((1 - fromU) * u) @ np.asarray(fleet.startup_cost, dtype=np.float64)
+    masks = [int(''.join(map(str, row)), 2) for row in u]
+    return solvers.CommitmentSchedule(masks, u, P, edCosts, startupCosts)
+
+
+class UnitSubproblems():
+    """
+    The unit problems of a fleet, all solved at once for the multipliers lambda
+
+    Attributes:
+        fleet: parameters of the fleet and demands (see rolling.copyInput)
+        relaxLastPeriod: a switch into the last period is never forbidden (see dpsolver)
+    """
+
+    def __init__(self, fleet, doMinUpMinDown=True, relaxLastPeriod=True):
+        self.fleet = fleet
+        self.relaxLastPeriod = relaxLastPeriod
+        self._units = np.arange(fleet.nUnita)
+        self._tauUp, self._tauDown = getMinUpMinDown(fleet, doMinUpMinDown)
+        self._initialOn = np.array([s == '1' for s in fleet.initial_status])
+        self._initialCounters = dpsolver.getInitialCounters(fleet, self._tauUp, self._tauDown)
+        self._startupCosts = np.asarray(fleet.startup_cost, dtype=np.float64)
+
+    def solve(self, lam):
+        # Return (u, values, P) of all the units for the multipliers lam: u and P are (nPeriods, nUnits)
+        onCosts, P = getOnCosts(self.fleet, lam, self._units)
+        u, values = solveUnitDPs(onCosts, self._startupCosts, self._tauUp, self._tauDown, self._initialOn,
+                                 self._initialCounters, self.relaxLastPeriod)
+        return u.T, values, P.T
+
+
+def repairCommitment(subproblems, lam, u):
+    # Raise (lower) lambda in the periods short of capacity (with the sum of Pmin over the demand) and solve the unit
+    # problems again until the commitment can meet every demand. Return the commitment (None if it still can not)
+    fleet = subproblems.fleet
+    D = np.asarray(fleet.D, dtype=np.float64)
+    Pmin = np.asarray(fleet.Pmin, dtype=np.float64)
+    Pmax = np.asarray(fleet.Pmax, dtype=np.float64)
+    lam = lam.copy()
+    for _ in range(REPAIR_ROUNDS):
+        short = u @ Pmax < D
+        over = u @ Pmin > D
+        if not np.any(short | over):
+            return u
+        step = REPAIR_STEP * np.maximum(np.abs(lam), 1)
+        lam = lam + step * short - step * over
+        u = subproblems.solve(lam)[0]
+    return None
+
+
+def solveLagrangian(inp=input, nIterations=DEFAULT_ITERATIONS, doMinUpMinDown=True, gapTolerance=DEFAULT_GAP,
+                    relaxLastPeriod=True, verbose=False):
+    # Solve the Lagrangian relaxation of inp by subgradient steps. Return a LagrangianSolution
+    start = time.perf_counter()
+    D = np.asarray(inp.D, dtype=np.float64)
+    edEngine = dispatch.EconomicDispatch.fromInput(inp)
+    subproblems = UnitSubproblems(inp, doMinUpMinDown, relaxLastPeriod)
+
+    lam = getInitialMultipliers(inp)
+    bestLam, lowerBound, upperBound, bestSchedule = lam, -np.inf, np.inf, None
+    theta, sinceImprovement = 1.0, 0
+    history = []
+    for iteration in range(nIterations):
+        u, values, P = subproblems.solve(lam)
+        value = float(values.sum() + lam @ D)
+        if value > lowerBound:
+            bestLam, lowerBound, sinceImprovement = lam, value, 0
+        else:
+            sinceImprovement += 1
+            if sinceImprovement >= PATIENCE:
+                theta, sinceImprovement = theta / 2, 0
+
+        repaired = repairCommitment(subproblems, lam, u)
+        if repaired is not None:
+            schedule = getScheduleFromUnits(repaired, inp, edEngine)
+            if np.all(schedule.edCosts < dispatch.INFEASIBLE_COST) and schedule.totalCost < upperBound:
+                bestSchedule, upperBound = schedule, schedule.totalCost
+        history.append((lowerBound, upperBound))
+        if verbose:
+            print(f"Iteration {iteration}: L {value:.2f}, LB {lowerBound:.2f}, UB {upperBound:.2f}, theta {theta:.4f}")
+        if upperBound - lowerBound <= gapTolerance * abs(upperBound) or theta < MIN_THETA:
+            break
+
+        # subgradient step towards the target: the best upper bound (or 5% above the value if there is none yet)
+        subgradient = D - (u * P).sum(axis=1)
+        norm = float(subgradient @ subgradient)
+        if norm == 0:
+            break
+        target = upperBound if np.isfinite(upperBound) else value + 0.05 * abs(value)
+        lam = lam + theta * (target - value) / norm * subgradient
+    return LagrangianSolution(bestSchedule, upperBound, lowerBound, bestLam, history, time.perf_counter() - start)
+
+
+if "__main__" == __name__:
+    import benchmark
+
+    parser = argparse.ArgumentParser(description='Lagrangian-relaxation solve of the UC problem (one problem per unit)')
+    parser.add_argument('--units', type=int, default=None, help='synthetic fleet (benchmark.generateInstance), default: input')
+    parser.add_argument('--periods', type=int, default=24)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--iterations', type=int, default=DEFAULT_ITERATIONS)
+    parser.add_argument('--gap', type=float, default=DEFAULT_GAP, help='stop at this relative gap between the bounds')
+    parser.add_argument('--exact', action='store_true', help=f'also solve the full network (up to {beam.EXACT_MAX_UNITS} units)')
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    inp = input if args.units is None else benchmark.generateInstance(args.units, args.periods, args.seed)
+    solution = solveLagrangian(inp, args.iterations, gapTolerance=args.gap, verbose=args.verbose)
+    print(f"Lagrangian: lower bound {solution.lowerBound:.2f}, upper bound {solution.upperBound:.2f}, "
+          f"{len(solution.history)} iterations, {solution.solveTime:.3f} s"
+          + ("" if solution.gap is None else f", gap {100*solution.gap:.3f}%"))
+    if args.exact:
+        if inp.nUnita > beam.EXACT_MAX_UNITS:
+            print(f"No exact solve above {beam.EXACT_MAX_UNITS} units")
+        else:
+            exactObjective, exactTime = beam.solveExact(inp)
+            print(f"Exact: objective {exactObjective}, {exactTime:.3f} s")
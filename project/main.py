@@ -1,28 +1,65 @@
 import utils
 import input  # import the input file
+import dispatch
+import edcache
+import network
+import netcache
+import dpsolver
+import instrument
+import preprocess
+import rolling
+import solvers
+import symmetry
 import datetime
+import time
 import multiprocessing
+import concurrent.futures
+import numpy as np
 from docplex.mp.model import Model
+from docplex.mp.solution import SolveSolution
 
 DO_REDUCE_NUMBER_OF_NODES = True
+DO_VECTORIZED_ED = True
+DO_CPLEX_ED_CROSSCHECK = False
+DO_ED_COST_CACHE = True
+ED_COST_CACHE_PATH = edcache.DEFAULT_CACHE_PATH
+ED_COST_CACHE_MAX_ENTRIES = edcache.DEFAULT_MAX_ENTRIES
 DO_MULTIPROCESSING_EDPROBLEMS = True
+ED_WORKERS = None  # None: one worker per core
+ED_CHUNKS_PER_WORKER = 4
 DO_SAVE_ARCS_IN_NODES = True
+DO_CSR_NETWORK = False
+DO_NETWORK_CACHE = False  # build with UC_NetworkCSR and save it (DO_VECTORIZED_ED and the ED pool are then not used)
+NETWORK_CACHE_DIR = netcache.DEFAULT_CACHE_DIR
+DO_DP_SOLVER = False
+DO_SYMMETRY_AGGREGATION = False  # one state per count of interchangeable units (see symmetry)
+SYMMETRY_RTOL = 0.0  # > 0: also aggregate the near-identical units
 
 DO_MINUP_MINDOWN = True
+DO_PRUNE_INFEASIBLE_ARCS = False
+DO_AGGREGATED_MINUP_MINDOWN = False
+DO_INITIAL_STATUS_CONSTRAINTS = False  # enforce the min up/down history of input.initial_status_periods (else the units start free)
+DO_BULK_MODEL_BUILD = True
+DO_NAME_VARIABLES = True
+SOLVER_BACKEND = 'cplex'  # 'cplex' (docplex) or 'highs' (scipy.optimize.milp)
 DO_PRINT_ALL_ARCS = False
+PLOT_PATH = None  # save the plot to this file (.png, .svg) instead of showing it
+PLOT_MAX_ARCS = utils.PLOT_MAX_ARCS
+DO_INSTRUMENTATION = False  # phase timers, counters and ED latency histograms (see instrument)
+INSTRUMENTATION_PATH = None  # save them to this JSON file too
 
 class Node():
     """
     A node is a combination of units that are on at time t
 
     Attributes:
-        id: (combinationBinaryString, time)
+        id: (combinationMask, time), the unit i is on if the bit (nUnita-1-i) of combinationMask is set
         u: vector of boolean units that are on at time t
         b: demand at time t: 1 if the node is the source, -1 if the node is the sink, 0 otherwise
     """
 
-    def __init__(self, combinationBinaryString: str, time, isSource=False, isSink=False):
-        self.__i = combinationBinaryString
+    def __init__(self, combinationMask: int, time, isSource=False, isSink=False):
+        self.__i = combinationMask
         self._t = time
         self.id = (self.__i, self._t)
         self.u = self.__getUnitsVector()
@@ -43,15 +80,13 @@ class Node():
     def __getUnitsVector(self):
         # return the vector of boolean units
         # that are on at time t
-        # and have binary number i
-        return [bool(int(digit)) for digit in self.__i]
+        # and have mask i
+        return [bool(self.__i & utils.unitBit(i, input.nUnita)) for i in range(input.nUnita)]
 
     def isValid(self):
         # Check if the sum of the sum of the minimum power of the units that are on is greater than the demand D
-        minimumPower = sum([input.Pmin[i]
-                           for i in range(len(self.u)) if self.u[i]])
-        maximumPower = sum([input.Pmax[i]
-                           for i in range(len(self.u)) if self.u[i]])
+        minimumPower = utils.getSumByMask(input.Pmin)[self.__i]
+        maximumPower = utils.getSumByMask(input.Pmax)[self.__i]
 
         isMinimumPowerValid = minimumPower <= input.D[self._t]
         isMaximumPowerValid = input.D[self._t] <= maximumPower
@@ -60,14 +95,30 @@ class Node():
 
         return True
 
-    # Create a CPlex model to solve the economic dispatch problem for the units that are on
-    # and return the cost of the flow
+    # Set the cost of the flow, reading it from the ED cost cache when possible
     def _calculateFlowCost(self):
         if self.isSource:
             self._F = 0
             return
         if self.isSink:
-            return;        
+            return;
+        if DO_ED_COST_CACHE:
+            cache = getEDCostCache()
+            cachedF = cache.lookup(self.getIntegerNumber(), input.D[self._t])
+            if cachedF is not None:
+                self._F = cachedF
+                instrument.count('ED cache hits')
+                return
+        start = time.perf_counter()
+        self._solveEDWithCplex()
+        instrument.observe('ED solve', time.perf_counter() - start)
+        instrument.count('ED solves')
+        if DO_ED_COST_CACHE:
+            cache.store(self.getIntegerNumber(), input.D[self._t], self._F)
+
+    # Create a CPlex model to solve the economic dispatch problem for the units that are on
+    # and return the cost of the flow
+    def _solveEDWithCplex(self):
         # Create a cplex variable for each unit
         # x[i] is the power of the unit i
         # x[i] >= 0
@@ -113,11 +164,10 @@ class Node():
             self._F = modelSolution.get_objective_value()
 
     def getIntegerNumber(self):
-        int2 = utils.binStrToInt(self.__i)
-        return int2
+        return self.__i
 
     def __str__(self):
-        return f"Node {self.id}"
+        return f"Node {(utils.intToBinStr(self.__i, input.nUnita), self._t)}"
 
     def __eq__(self, __o: object) -> bool:
         if isinstance(__o, Node):
@@ -125,21 +175,38 @@ class Node():
 
         return False
 
-def Worker_RunEDModelOnSample(nodes, return_list):
-    l=[]
-    for n in nodes:
+def getEDCostCache():
+    # The ED cost cache of the current process (every worker process opens its own connection to the same file)
+    return edcache.openCache(edcache.fleetKey(input), ED_COST_CACHE_PATH, ED_COST_CACHE_MAX_ENTRIES)
+
+def getNetworkMasks():
+    # The masks of the nodes of the network: None (all of them) or the canonical masks of the interchangeable units
+    if not DO_SYMMETRY_AGGREGATION:
+        return None
+    return symmetry.getSymmetryMasks(input, DO_MINUP_MINDOWN, SYMMETRY_RTOL)[0]
+
+def Worker_RunEDModelOnSample(workItems):
+    # Solve the ED problems of a chunk of (mask, period) work items and return their flow costs,
+    # with what the worker recorded on this chunk (None if the instrumentation is disabled)
+    instrument.reset()
+    costs = np.empty(len(workItems))
+    for k, (mask, t) in enumerate(workItems):
+        n = Node(mask, t)
         n._calculateFlowCost()
-        l.append(n)
-    
-    return_list.extend(l)
+        costs[k] = n._F
+    if DO_ED_COST_CACHE:
+        getEDCostCache().flush()
+    return costs, instrument.snapshot() if instrument.ENABLED else None
 
 class Arc():
-    def __init__(self, node1: Node, node2: Node):
+    def __init__(self, node1: Node, node2: Node, transitionCost=None):
         self._n1 = node1
         self._n2 = node2
         assert node1.id[1] == node2.id[1] - 1
         self.id = (self._n1.id, self._n2.id)
-        self._transitionCost = Arc.calculateTransitionCost(node1, node2)
+        if transitionCost is None:
+            transitionCost = Arc.calculateTransitionCost(node1, node2)
+        self._transitionCost = transitionCost
 
     def doLazyEvaluation(self):
         self._calculateOutputFlowCost()
@@ -163,12 +230,8 @@ class Arc():
         if node2.isSink:
             return 0
 
-        u1 = node1.u
-        u2 = node2.u
-        assert len(u1) == len(u2)
-
-        # save the indexes where the first vector is 0 and the second is 1
-        return sum([input.startup_cost[i] for i in range(0, len(u1)) if not u1[i] and u2[i]])
+        # startup cost of the units that are 0 in the first mask and 1 in the second
+        return float(utils.getTransitionCosts(node1.id[0], node2.id[0], input.startup_cost))
 
     def __str__(self):
         return f"Arc: [{self._n1.id}] --> [{self._n2.id}]"
@@ -193,7 +256,7 @@ class UC_Network():
         self.arcs = arcs
 
     @staticmethod
-    def createModelFromInput():
+    def createModelFromInput(masks=None):
         assert len(input.D) == input.nPeriodi
 
         assert len(input.c1) == input.nUnita
@@ -212,76 +275,77 @@ class UC_Network():
         print("Range of periods: ", T)
 
         # save all boolean combinations with I
-        [combinations, nCombs] = utils.getAllBinaryStringCombinations(input.nUnita)
-
-        # Create the nodes
-        nodes = []
-        print("I'm creating the source node")
-        source = Node(input.initial_status, -1, isSource=True)
-        nodes.append(source)
-
-        print("I'm creating the (internal) transporation nodes")
-        nodes.extend([Node(bs, t) for t in T for bs in combinations])
-        print("Number of nodes created ", oldLength := len(nodes)-1)
-
-        print("I'm creating the sink node")
-        sink = Node(input.initial_status, input.nPeriodi, isSink=True)
-        nodes.append(sink)
+        combinations = np.arange(2**input.nUnita, dtype=np.int64) if masks is None else np.asarray(masks, dtype=np.int64)
+        initialMask = utils.binStrToInt(input.initial_status)
 
+        # Select the valid (mask, period) pairs before creating any node
         if DO_REDUCE_NUMBER_OF_NODES:
-            nodes = [n for n in nodes if (n.isSource or n.isSink) or n.isValid()]
+            isValid = utils.getValidMasksByPeriod(combinations, input.Pmin, input.Pmax, input.D)
+        else:
+            isValid = np.ones((input.nPeriodi, len(combinations)), dtype=bool)
 
+        # Create the nodes
+        nodes = []
+        with instrument.phase('nodes'):
+            print("I'm creating the source node")
+            source = Node(initialMask, -1, isSource=True)
+            nodes.append(source)
+
+            print("I'm creating the (internal) transporation nodes")
+            nodes.extend([Node(int(m), t) for t in T for m in combinations[isValid[t]]])
+            oldLength = len(combinations) * input.nPeriodi
+            print("Number of nodes created ", currLength := len(nodes)-1)
+
+            print("I'm creating the sink node")
+            sink = Node(initialMask, input.nPeriodi, isSink=True)
+            nodes.append(sink)
+        instrument.count('nodes', len(nodes))
         print(
-            f"I removed {(oldLength-(currLength := len(nodes)-2))/oldLength:.2f}% nodes. Current number of nodes is {currLength}")
+            f"I removed {100*(oldLength-currLength)/oldLength:.2f}% nodes. Current number of nodes is {currLength}")
         
         ####################################################################################################
         # Solve the Economic Dispatch Problem on each node
-        print("I'm starting solving all ED problems at", datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
-        if DO_MULTIPROCESSING_EDPROBLEMS:
-        ####################################################
-            # Split the nodes in as many chunks as the number of cores and calculate the flow cost in parallel
-            manager = multiprocessing.Manager()
-            return_list = manager.list()
-            nCores = multiprocessing.cpu_count()
-            print("Number of cores: ", nCores)
-            nNodes = len(nodes)
-            print("Number of nodes: ", nNodes)
-            nNodesPerCore = nNodes // nCores
-            print("Number of nodes per core: ", nNodesPerCore)
-            nNodesLastCore = nNodes - nNodesPerCore * (nCores - 1)
-            print("Number of nodes on the last core: ", nNodesLastCore)
-
-            # Create the processes
-            processes = []
-            for i in range(nCores):
-                if i == nCores - 1:
-                    processes.append(multiprocessing.Process(target=Worker_RunEDModelOnSample, args=(nodes[i * nNodesPerCore:],return_list)))
-                else:
-                    processes.append(multiprocessing.Process(target=Worker_RunEDModelOnSample, args=(nodes[i * nNodesPerCore:(i + 1) * nNodesPerCore],return_list)))
-            # wait for all processes to finish
-            for p in processes:
-                p.start()
-
-            for p in processes:
-                p.join()
-
-            nodes = [n for n in return_list]
-        ####################################################
-        else:
-            for node in nodes:
-                node._calculateFlowCost()
-        print("I'm done solving all ED problems at", datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+        with instrument.phase('ED'):
+            print("I'm starting solving all ED problems at", datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+            if DO_VECTORIZED_ED:
+            ####################################################
+                # Solve the ED problems of all the nodes of all the periods in one batched call
+                source._F = 0
+                internalNodes = [n for n in nodes if not (n.isSource or n.isSink)]
+                UC_Network.calculateFlowCostsVectorized(internalNodes)
+                if DO_CPLEX_ED_CROSSCHECK:
+                    UC_Network.crossCheckFlowCostsWithCplex(internalNodes)
+            ####################################################
+            elif DO_MULTIPROCESSING_EDPROBLEMS:
+            ####################################################
+                # Send only (mask, period) work items to a pool of processes and get back the flow costs, in the order of the nodes
+                source._F = 0
+                internalNodes = [n for n in nodes if not (n.isSource or n.isSink)]
+                costs = UC_Network.calculateFlowCostsInPool([(n.getIntegerNumber(), n._t) for n in internalNodes])
+                for n, F in zip(internalNodes, costs):
+                    n._F = float(F)
+            ####################################################
+            else:
+                for node in nodes:
+                    node._calculateFlowCost()
+                if DO_ED_COST_CACHE:
+                    getEDCostCache().flush()
+            print("I'm done solving all ED problems at", datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+        if instrument.ENABLED:
+            instrument.count('ED infeasible nodes', sum(1 for n in nodes[1:-1] if n._F >= dispatch.INFEASIBLE_COST))
         #############################################################################################################################
 
-        print("I'm creating the arcs")
-        arcs = [Arc(i, j) for i in nodes for j in nodes if i._t == j._t - 1]
-        print(f"I created {len(arcs)} arcs.")
-
-        # Finally evaluate the flow cost on each node
-        print("I'm calculating the final output flow cost on each arc")
-        for arc in arcs:
-            arc.doLazyEvaluation()
-        print("Flow cost calculated on each arc")
+        print("I'm creating the arcs and calculating the final output flow cost on each arc")
+        # The arcs are not streamed into the model: the network keeps them all in self.arcs, because the pruning, the
+        # min up/down constraints, the model builders and the solution extraction each traverse them again.
+        # So the peak memory is the one of the whole arc list, generateArcs only avoids the all-pairs scan
+        with instrument.phase('arcs'):
+            arcs = []
+            for arc in UC_Network.generateArcs(UC_Network.getNodesByPeriod(nodes)):
+                arc.doLazyEvaluation()
+                arcs.append(arc)
+            print(f"I created {len(arcs)} arcs.")
+        instrument.count('arcs', len(arcs))
 
         # Assert consistency
         assert hasattr(nodes[0], '_F')
@@ -290,9 +354,146 @@ class UC_Network():
         # return the network
         return UC_Network(nodes, arcs)
 
+    @staticmethod
+    def fromCSR(net):
+        # Return the object network with the nodes, the ED costs and the arcs of a network.UC_NetworkCSR
+        nodes = []
+        for (mask, t, F) in zip(net.nodeMask.tolist(), net.nodePeriod.tolist(), net.nodeF.tolist()):
+            node = Node(mask, t, isSource=t == -1, isSink=t == net.nPeriods)
+            node._F = F
+            nodes.append(node)
+        arcs = []
+        for (fromIdx, toIdx, cost) in zip(net.arcFrom.tolist(), net.arcTo.tolist(), net.arcCost.tolist()):
+            arc = Arc(nodes[fromIdx], nodes[toIdx], cost - nodes[fromIdx]._F)
+            arc.doLazyEvaluation()
+            arc.cost = cost
+            arcs.append(arc)
+        return UC_Network(nodes, arcs)
+
+    def pruneInfeasibleArcs(self, inp=input):
+        # Remove the arcs and the nodes that can never be on a path feasible for min up/down (see preprocess)
+        tauUp = np.asarray(inp.min_switch_up)
+        tauDown = np.asarray(inp.min_switch_down)
+        nodeIndex = {n.id: k for k, n in enumerate(self.nodes)}
+        arcFrom = [nodeIndex[a._n1.id] for a in self.arcs]
+        arcTo = [nodeIndex[a._n2.id] for a in self.arcs]
+        keepArcs = preprocess.findFeasibleArcs([n.id[0] for n in self.nodes], [n._t for n in self.nodes], arcFrom, arcTo,
+                                               inp.nPeriodi, inp.nUnita, tauUp, tauDown,
+                                               dpsolver.getInitialCounters(inp, tauUp, tauDown))
+        keepNodes = preprocess.getKeptNodes(len(self.nodes), [n._t for n in self.nodes], inp.nPeriodi, arcFrom, arcTo, keepArcs)
+
+        oldNArcs, oldNNodes = len(self.arcs), len(self.nodes)
+        self.arcs = [a for (a, keep) in zip(self.arcs, keepArcs) if keep]
+        self.nodes = [n for (n, keep) in zip(self.nodes, keepNodes) if keep]
+        if DO_SAVE_ARCS_IN_NODES:
+            for n in self.nodes:
+                n.innerArcs = []
+                n.outerArcs = []
+            for a in self.arcs:
+                a._n1.outerArcs.append(a)
+                a._n2.innerArcs.append(a)
+        print(f"I removed {oldNArcs-len(self.arcs)} arcs and {oldNNodes-len(self.nodes)} nodes that can not be on a feasible path")
+        return self
+
+    @staticmethod
+    def getNodesByPeriod(nodes):
+        # Return a dict period -> list of the nodes of that period (source is period -1, sink is period nPeriodi)
+        nodesByPeriod = {}
+        for n in nodes:
+            nodesByPeriod.setdefault(n._t, []).append(n)
+        return dict(sorted(nodesByPeriod.items()))
+
+    @staticmethod
+    def generateArcs(nodesByPeriod):
+        # Yield the arcs between each pair of adjacent periods (createModelFromInput collects them in a list).
+        # The work is linear in the number of arcs instead of quadratic in the number of nodes.
+        # The transition costs of each pair of periods are read from the startup table with one gather.
+        for t, fromNodes in nodesByPeriod.items():
+            toNodes = nodesByPeriod.get(t + 1, [])
+            if len(toNodes) == 0:
+                continue
+            if toNodes[0].isSink:
+                transitionCosts = np.zeros((len(fromNodes), len(toNodes)))
+            else:
+                fromMasks = np.array([i.id[0] for i in fromNodes], dtype=np.int64)
+                toMasks = np.array([j.id[0] for j in toNodes], dtype=np.int64)
+                transitionCosts = utils.getTransitionCosts(fromMasks[:, None], toMasks[None, :], input.startup_cost)
+            for i, rowCosts in zip(fromNodes, transitionCosts.tolist()):
+                for j, transitionCost in zip(toNodes, rowCosts):
+                    yield Arc(i, j, transitionCost)
+
+    @staticmethod
+    def calculateFlowCostsInPool(workItems, nWorkers=None, chunksPerWorker=None):
+        # Solve the ED problems of the (mask, period) work items in a process pool and return a flat array of flow costs.
+        # Every worker gets a few chunks, so the load stays balanced while the overhead per chunk stays negligible.
+        nWorkers = nWorkers or ED_WORKERS or multiprocessing.cpu_count()
+        chunksPerWorker = chunksPerWorker or ED_CHUNKS_PER_WORKER
+        chunkSize = max(1, -(-len(workItems) // (nWorkers * chunksPerWorker)))
+        chunks = [workItems[i:i + chunkSize] for i in range(0, len(workItems), chunkSize)]
+        print(f"Solving {len(workItems)} ED problems with {nWorkers} workers in {len(chunks)} chunks of {chunkSize}")
+
+        costs = []
+        # the workers do not share the module state of this process: they get the instrumentation switch from the initializer
+        with concurrent.futures.ProcessPoolExecutor(max_workers=nWorkers, initializer=instrument.enable,
+                                                    initargs=(instrument.ENABLED,)) as pool:
+            for k, (chunkCosts, chunkRecord) in enumerate(pool.map(Worker_RunEDModelOnSample, chunks)):
+                costs.append(chunkCosts)
+                if chunkRecord is not None:
+                    instrument.merge(chunkRecord)
+                print(f"ED progress: {k+1}/{len(chunks)} chunks", end='\r' if k+1 < len(chunks) else '\n')
+        return np.concatenate(costs) if costs else np.empty(0)
+
+    @staticmethod
+    def calculateFlowCostsVectorized(nodes):
+        # Set _F on every (internal) node with the native ED engine
+        edEngine = dispatch.EconomicDispatch.fromInput()
+        masks = [n.getIntegerNumber() for n in nodes]
+        demands = [input.D[n._t] for n in nodes]
+        if DO_ED_COST_CACHE:
+            cache = getEDCostCache()
+            hits, misses = cache.hits, cache.misses
+            costs = cache.getCosts(masks, demands, UC_Network.timedCost(edEngine))
+            cache.flush()
+            print(f"ED cost cache: {cache.hits-hits} hits, {cache.misses-misses} misses")
+            instrument.count('ED cache hits', cache.hits - hits)
+        else:
+            costs = UC_Network.timedCost(edEngine)(masks, demands)
+        for n, F in zip(nodes, costs):
+            n._F = float(F)
+
+    @staticmethod
+    def timedCost(edEngine):
+        # edEngine.cost, recording the latency of every batch and the number of ED problems solved
+        def cost(masks, demands):
+            start = time.perf_counter()
+            costs = edEngine.cost(masks, demands)
+            instrument.observe('ED batch', time.perf_counter() - start)
+            instrument.count('ED solves', len(costs))
+            return costs
+        return cost
+
+    @staticmethod
+    def crossCheckFlowCostsWithCplex(nodes, relTolerance=1e-6):
+        # Solve again every ED problem with CPLEX and compare it with the _F already set on the node
+        print("I'm cross-checking the ED costs with CPLEX")
+        maxRelDiff = 0
+        for n in nodes:
+            vectorizedF = n._F
+            n._solveEDWithCplex()
+            relDiff = abs(n._F - vectorizedF) / max(1, abs(n._F))
+            maxRelDiff = max(maxRelDiff, relDiff)
+            if relDiff > relTolerance:
+                print(f"ED mismatch on {n}: CPLEX {n._F}, vectorized {vectorizedF}")
+            n._F = vectorizedF
+        print(f"Max relative difference between CPLEX and vectorized ED costs: {maxRelDiff:.2e}")
+        return maxRelDiff
+
 
 class UC_Model():
     UCNetworkModel = None
+    arcVariables = None
+    arcVariableList = None  # variable of each arc, in the order of myNet.arcs (and of UC_Solution.flows)
+    buildTimes = {}
 
     @staticmethod
     def generateUCNetworkModel(myNet):
@@ -301,106 +502,393 @@ class UC_Model():
 
         UC_Model.UCNetworkModel = Model(name='Unit Commitment Problem - Network Formulation')
         UC_Model.UCNetworkModel.context.cplex_parameters.threads =  multiprocessing.cpu_count()
+        UC_Model.buildTimes = {}
+        if DO_BULK_MODEL_BUILD:
+            x = UC_Model._addFlowModelInBulk(UC_Model.UCNetworkModel, myNet)
+        else:
+            x = UC_Model._addFlowModel(UC_Model.UCNetworkModel, myNet)
+        UC_Model.arcVariables = x
+        UC_Model.arcVariableList = list(x.values())
+
+        # Unit commitment constraints
+        if DO_MINUP_MINDOWN:
+            phaseStart = time.perf_counter()
+            nConstraints = UC_Model.UCNetworkModel.number_of_constraints
+            if DO_AGGREGATED_MINUP_MINDOWN:
+                UC_Model.addAggregatedMinUpMinDownConstraints(UC_Model.UCNetworkModel, myNet, x)
+            else:
+                # The arcs sharing the same switching pattern and period share the same sum of invalid flows
+                invalidArcsFlowsByPattern = {}
+                indicatorVars, indicatorCts = [], []
+                for (a, key, not_valid_arcs_list) in UC_Model.generateMinUpMinDownViolations(myNet):
+                    # If this arc variable is 1, then all the variables in the not_valid_arcs_list must be 0
+                    if key not in invalidArcsFlowsByPattern:
+                        invalidArcsFlowsByPattern[key] = UC_Model.UCNetworkModel.sum_vars(x[(not_valid_arc._n1.id, not_valid_arc._n2.id)] for not_valid_arc in not_valid_arcs_list)
+                    invalidArcsFlows = invalidArcsFlowsByPattern[key]
+                    # the arc variables are binary: they are the indicator variables themselves
+                    if DO_BULK_MODEL_BUILD:
+                        indicatorVars.append(x[(a._n1.id, a._n2.id)])
+                        indicatorCts.append(invalidArcsFlows <= 0)
+                    else:
+                        UC_Model.UCNetworkModel.add_indicator(x[(a._n1.id, a._n2.id)], invalidArcsFlows <= 0)
+                if indicatorVars:
+                    UC_Model.UCNetworkModel.add_indicators(indicatorVars, indicatorCts)
+                if DO_INITIAL_STATUS_CONSTRAINTS:
+                    UC_Model.addInitialStatusConstraints(UC_Model.UCNetworkModel, myNet, x)
+            print(f"I added {UC_Model.UCNetworkModel.number_of_constraints-nConstraints} min up/down constraints")
+            UC_Model.buildTimes['min up/down'] = time.perf_counter() - phaseStart
+
+        print("Model build phases: " + ", ".join(f"{phase} {seconds:.3f} s" for phase, seconds in UC_Model.buildTimes.items()))
+        for phase, seconds in UC_Model.buildTimes.items():
+            instrument.record(phase, seconds)
+        instrument.count('variables', UC_Model.UCNetworkModel.number_of_variables)
+        instrument.count('constraints', UC_Model.UCNetworkModel.number_of_constraints)
+        print("I added all the constraints\n")
+
+    @staticmethod
+    def _addFlowModel(model, myNet):
+        # Variables, objective and flow conservation constraints, one at a time
+        phaseStart = time.perf_counter()
         # Create the variables
         print("I'm creating the variables")
-        x = {(arc._n1.id, arc._n2.id): UC_Model.UCNetworkModel.integer_var(name='x_{0}_{1}'.format(arc._n1.id, arc._n2.id)) for arc in myNet.arcs}
+        x = {(arc._n1.id, arc._n2.id): model.binary_var(name='x_{0}_{1}'.format(arc._n1.id, arc._n2.id)) for arc in myNet.arcs}
+        UC_Model.buildTimes['variables'] = time.perf_counter() - phaseStart
 
         # each arc comes with a cost. Minimize all costed flows
+        phaseStart = time.perf_counter()
         print("I'm creating the objective function")
-        z = UC_Model.UCNetworkModel.sum(x[(arc._n1.id, arc._n2.id)]* arc.cost for arc in myNet.arcs)
-        UC_Model.UCNetworkModel.minimize(z)
+        z = model.sum(x[(arc._n1.id, arc._n2.id)]* arc.cost for arc in myNet.arcs)
+        model.minimize(z)
+        UC_Model.buildTimes['objective'] = time.perf_counter() - phaseStart
 
         # Flow conservation constraints
+        phaseStart = time.perf_counter()
         print("I'm creating the flow conservation constraints")
         for i in myNet.nodes:
             if DO_SAVE_ARCS_IN_NODES:
-                out_flow = UC_Model.UCNetworkModel.sum(x[(i.id, arc._n2.id)] for arc in i.outerArcs)
-                in_flow = UC_Model.UCNetworkModel.sum(x[(arc._n1.id, i.id)] for arc in i.innerArcs)
+                out_flow = model.sum(x[(i.id, arc._n2.id)] for arc in i.outerArcs)
+                in_flow = model.sum(x[(arc._n1.id, i.id)] for arc in i.innerArcs)
             else:
-                out_flow = UC_Model.UCNetworkModel.sum(x[(i.id, arc._n2.id)] for arc in myNet.arcs if arc._n1.id == i.id)
-                in_flow = UC_Model.UCNetworkModel.sum(x[(arc._n1.id, i.id)] for arc in myNet.arcs if arc._n2.id == i.id)
-            UC_Model.UCNetworkModel.add_constraint(out_flow - in_flow == i.b)
-            
+                out_flow = model.sum(x[(i.id, arc._n2.id)] for arc in myNet.arcs if arc._n1.id == i.id)
+                in_flow = model.sum(x[(arc._n1.id, i.id)] for arc in myNet.arcs if arc._n2.id == i.id)
+            model.add_constraint(out_flow - in_flow == i.b)
+        UC_Model.buildTimes['flow conservation'] = time.perf_counter() - phaseStart
+
         # # Flow bound constraints
         # for (i,j) in arcs:
-        #     UC_Model.UCNetworkModel.add_constraint(x[i,j] <= ub.get((i,j), 0))
-        #     UC_Model.UCNetworkModel.add_constraint(x[i,j] >= lb.get((i,j), 0))
+        #     model.add_constraint(x[i,j] <= ub.get((i,j), 0))
+        #     model.add_constraint(x[i,j] >= lb.get((i,j), 0))
+        return x
 
-        # Unit commitment constraints
-        if DO_MINUP_MINDOWN:
-            assert input.min_switch_down == input.min_switch_up
-            tau = input.min_switch_up
-            for a in myNet.arcs:
-                if a._n2.isSink:
-                    continue
+    @staticmethod
+    def _addFlowModelInBulk(model, myNet):
+        # Same variables, objective and flow conservation constraints as _addFlowModel, built with the batched docplex API:
+        # one binary_var_list, one scal_prod and one add_constraints call
+        arcs = myNet.arcs
+        phaseStart = time.perf_counter()
+        print("I'm creating the variables")
+        names = ['x_{0}_{1}'.format(arc._n1.id, arc._n2.id) for arc in arcs] if DO_NAME_VARIABLES else None
+        xList = model.binary_var_list(len(arcs), name=names)
+        x = {arc.id: var for (arc, var) in zip(arcs, xList)}
+        UC_Model.buildTimes['variables'] = time.perf_counter() - phaseStart
 
-                if a._n1.id[0] == a._n2.id[0]:
-                    continue
+        phaseStart = time.perf_counter()
+        print("I'm creating the objective function")
+        model.minimize(model.scal_prod(xList, [arc.cost for arc in arcs]))
+        UC_Model.buildTimes['objective'] = time.perf_counter() - phaseStart
 
-                diffPattern = utils.getIDPatternDifferences(a._n1.id[0], a._n2.id[0]) 
-                nonValidNodeKeys = utils.getAllNodesViolatingMinDownAndUpTime(a._n1.id, a._n2.id,  input.nPeriodi, diffPattern, tau)
-                if len(nonValidNodeKeys) == 0:
-                    continue
+        phaseStart = time.perf_counter()
+        print("I'm creating the flow conservation constraints")
+        nodeIndex = {n.id: k for k, n in enumerate(myNet.nodes)}
+        outVars = [[] for _ in myNet.nodes]
+        inVars = [[] for _ in myNet.nodes]
+        for (arc, var) in zip(arcs, xList):
+            outVars[nodeIndex[arc._n1.id]].append(var)
+            inVars[nodeIndex[arc._n2.id]].append(var)
+        model.add_constraints([model.sum_vars(outVars[k]) - model.sum_vars(inVars[k]) == n.b for k, n in enumerate(myNet.nodes)])
+        UC_Model.buildTimes['flow conservation'] = time.perf_counter() - phaseStart
+        return x
 
-                # From the outer arcs list of a.n2, search the arcs with n2.id in nonValidNodeKeys and add its inner arcs to the list
-                not_valid_arcs_list = []
-                for n in myNet.nodes:
-                    if n.id in nonValidNodeKeys:
-                        if DO_SAVE_ARCS_IN_NODES:
-                            not_valid_arcs_list.extend(n.innerArcs)
-                        else:
-                            not_valid_arcs_list.extend([arc for arc in myNet.arcs if arc._n2.id == n.id])
-                # If this arc variable is 1, then all the variables in the not_valid_arcs_list must be 0
-                if len(not_valid_arcs_list)>0:
-                    invalidArcsFlows = UC_Model.UCNetworkModel.sum(x[(not_valid_arc._n1.id, not_valid_arc._n2.id)] for not_valid_arc in not_valid_arcs_list)
-                    UC_Model.UCNetworkModel.add_constraint(UC_Model.UCNetworkModel.if_then(x[(a._n1.id, a._n2.id)] >= 1, invalidArcsFlows <= 0 ))
-        
+    @staticmethod
+    def getUnitFlows(myNet, x):
+        # Return three dicts (unit, period) -> list of arc variables:
+        #   uOn: arcs into the nodes of the period with the unit on,
+        #   yOn/yOff: arcs into the period switching the unit on/off.
+        nUnits = input.nUnita
+        uOn, yOn, yOff = {}, {}, {}
+        for arc in myNet.arcs:
+            if arc._n2.isSink:
+                continue
+            m1, m2, t = arc._n1.id[0], arc._n2.id[0], arc._n2._t
+            var = x[(arc._n1.id, arc._n2.id)]
+            for i in range(nUnits):
+                bit = utils.unitBit(i, nUnits)
+                if m2 & bit:
+                    uOn.setdefault((i, t), []).append(var)
+                    if not m1 & bit:
+                        yOn.setdefault((i, t), []).append(var)
+                elif m1 & bit:
+                    yOff.setdefault((i, t), []).append(var)
+        return uOn, yOn, yOff
 
-        print("I added all the constraints\n")
+    @staticmethod
+    def addInitialStatusConstraints(model, myNet, x, uOn=None):
+        # A unit that has been in its initial status for fewer periods than its min up/down time
+        # keeps that status in the first periods (the last period is never constrained, as for the other switches)
+        if uOn is None:
+            uOn, _, _ = UC_Model.getUnitFlows(myNet, x)
+        tauUp = np.asarray(input.min_switch_up)
+        tauDown = np.asarray(input.min_switch_down)
+        counters = dpsolver.getInitialCounters(input, tauUp, tauDown)
+        initialMask = utils.binStrToInt(input.initial_status)
+        constraints = []
+        for i in range(input.nUnita):
+            isOn = bool(initialMask & utils.unitBit(i, input.nUnita))
+            tau = tauUp[i] if isOn else tauDown[i]
+            for t in range(min(tau - counters[i], input.nPeriodi - 1)):
+                onFlow = model.sum(uOn.get((i, t), []))
+                constraints.append(onFlow >= 1 if isOn else onFlow <= 0)
+        if constraints:
+            model.add_constraints(constraints)
+        return len(constraints)
+
+    @staticmethod
+    def addAggregatedMinUpMinDownConstraints(model, myNet, x):
+        # Min up/down as one linear constraint per (unit, period) instead of one indicator per switching arc.
+        # For each unit i and period t < nPeriodi-1:
+        #   sum_{s=t-tauUp[i]+1..t} yOn[i,s] <= uOn[i,t]        a unit switched on in the last tauUp periods is still on
+        #   sum_{s=t-tauDown[i]+1..t} yOff[i,s] <= 1 - uOn[i,t]  a unit switched off in the last tauDown periods is still off
+        # On integer flows it is equivalent to the indicator constraints (the last period is not constrained either).
+        uOn, yOn, yOff = UC_Model.getUnitFlows(myNet, x)
+        tauUp = input.min_switch_up
+        tauDown = input.min_switch_down
+        constraints = []
+        for i in range(input.nUnita):
+            for t in range(input.nPeriodi - 1):
+                switchedOn = [v for s in range(max(0, t - tauUp[i] + 1), t + 1) for v in yOn.get((i, s), [])]
+                switchedOff = [v for s in range(max(0, t - tauDown[i] + 1), t + 1) for v in yOff.get((i, s), [])]
+                onFlow = model.sum(uOn.get((i, t), []))
+                # a window of one period is implied by the definition of yOn/yOff
+                if tauUp[i] > 1 and switchedOn:
+                    constraints.append(model.sum(switchedOn) <= onFlow)
+                if tauDown[i] > 1 and switchedOff:
+                    constraints.append(model.sum(switchedOff) <= 1 - onFlow)
+        model.add_constraints(constraints)
+        if DO_INITIAL_STATUS_CONSTRAINTS:
+            return len(constraints) + UC_Model.addInitialStatusConstraints(model, myNet, x, uOn)
+        return len(constraints)
+
+    @staticmethod
+    def generateMinUpMinDownViolations(myNet):
+        # Yield (arc, (pattern, period), list of the arcs that must have no flow if arc is used) for every arc switching some units.
+        # The violating nodes only depend on the switching pattern and on the period of the switch,
+        # so the list of violating arcs is computed once per (pattern, period).
+        assert input.min_switch_down == input.min_switch_up
+        tau = input.min_switch_up
+        nodeIndex = {n.id: n for n in myNet.nodes}
+        violationsByPattern = {}
+        for a in myNet.arcs:
+            if a._n2.isSink:
+                continue
+
+            if a._n1.id[0] == a._n2.id[0]:
+                continue
+
+            diffPattern = utils.getIDPatternDifferences(a._n1.id[0], a._n2.id[0])
+            key = (diffPattern, a._n2._t)
+            if key not in violationsByPattern:
+                nonValidNodeKeys = utils.getAllNodesViolatingMinDownAndUpTime(a._n1.id, a._n2.id, input.nPeriodi, diffPattern, tau, input.nUnita)
+                # Collect the inner arcs of the violating nodes (in the order of the nodes: by period, then by mask)
+                not_valid_arcs_list = []
+                for nodeKey in sorted(nonValidNodeKeys, key=lambda k: (k[1], k[0])):
+                    n = nodeIndex.get(nodeKey)
+                    if n is None:
+                        continue
+                    if DO_SAVE_ARCS_IN_NODES:
+                        not_valid_arcs_list.extend(n.innerArcs)
+                    else:
+                        not_valid_arcs_list.extend([arc for arc in myNet.arcs if arc._n2.id == n.id])
+                violationsByPattern[key] = not_valid_arcs_list
+
+            if len(violationsByPattern[key]) > 0:
+                yield (a, key, violationsByPattern[key])
 
     @staticmethod
     def getSingletonModel():
         assert  UC_Model.UCNetworkModel is not None, "UC_Model.UCNetworkModel must be not None"
         return UC_Model.UCNetworkModel
 
+    @staticmethod
+    def reset():
+        # Drop the singleton model, so that the next generateUCNetworkModel builds the model of a new network
+        UC_Model.UCNetworkModel = None
+        UC_Model.arcVariables = None
+        UC_Model.arcVariableList = None
+        UC_Model.buildTimes = {}
+
+    @staticmethod
+    def addMipStart(masks):
+        # Give CPLEX the path through the commitment masks of each period (e.g. the previous solution) as a MIP start.
+        # Return False if some arc of the path is not in the model
+        initialMask = utils.binStrToInt(input.initial_status)
+        nodeIds = [(initialMask, -1)] + [(int(m), t) for t, m in enumerate(masks)] + [(initialMask, input.nPeriodi)]
+        arcIds = list(zip(nodeIds[:-1], nodeIds[1:]))
+        x = UC_Model.arcVariables
+        if any(arcId not in x for arcId in arcIds):
+            return False
+        UC_Model.getSingletonModel().add_mip_start(SolveSolution(UC_Model.getSingletonModel(), {x[arcId]: 1 for arcId in arcIds}))
+        return True
+
+    @staticmethod
+    def getBackend(name=None):
+        # Return the solver backend called name (SOLVER_BACKEND by default)
+        name = SOLVER_BACKEND if name is None else name
+        if name == 'cplex':
+            return CplexBackend()
+        if name == 'highs':
+            return solvers.ScipyMilpBackend(doMinUpMinDown=DO_MINUP_MINDOWN, inp=getHistoryInput())
+        raise ValueError(f"Unknown solver backend {name}")
+
+
+class CplexBackend(solvers.SolverBackend):
+    # The docplex model of UC_Model solved with CPLEX
+    name = 'cplex'
+
+    def buildModel(self, myNet):
+        with instrument.phase('model'):
+            UC_Model.generateUCNetworkModel(myNet)
+        UC_Model.getSingletonModel().print_information()
+
+    def solve(self, myNet):
+        if UC_Model.UCNetworkModel is None:
+            self.buildModel(myNet)
+        model = UC_Model.getSingletonModel()
+        start = time.perf_counter()
+        with instrument.phase('solve'):
+            modelSolution = model.solve()
+        solveTime = time.perf_counter() - start
+        if not modelSolution:
+            return solvers.UC_Solution(self.name, str(model.solve_details.status), solveTime=solveTime)
+        # the values of the arc variables, in the order of the arcs: no variable name is parsed
+        flows = np.round(modelSolution.get_values(UC_Model.arcVariableList))
+        arcIds = list(UC_Model.arcVariables.keys())
+        selectedArcs = [arcIds[a] for a in np.flatnonzero(flows > 0.5)]
+        status = 'optimal' if 'optimal' in model.solve_details.status else 'feasible'
+        return solvers.UC_Solution(self.name, status, modelSolution.get_objective_value(), flows, selectedArcs, solveTime)
+
+
+def getHistoryInput():
+    # The input with its min up/down history (initial_status_periods) only if DO_INITIAL_STATUS_CONSTRAINTS:
+    # without it the units are free to switch at the first period, as in the indicator model
+    if DO_INITIAL_STATUS_CONSTRAINTS:
+        return input
+    return rolling.copyInput(input, initial_status_periods=None)
+
+
+def reportInstrumentation():
+    # Print what the instrumentation recorded (and save it to INSTRUMENTATION_PATH)
+    if not DO_INSTRUMENTATION:
+        return
+    print(instrument.summary())
+    if INSTRUMENTATION_PATH:
+        instrument.saveJSON(INSTRUMENTATION_PATH)
+        print(f"Instrumentation saved to {INSTRUMENTATION_PATH}")
+
 
 if "__main__" == __name__:
+    if DO_INSTRUMENTATION:
+        instrument.enable()
+
     ######################################################
     print("****** STARTING CREATING THE NETWORK ******")
     now1 = datetime.datetime.now()
-    myNet = UC_Network.createModelFromInput()
+    networkMasks = getNetworkMasks()
+    with instrument.phase('network'):
+        if DO_NETWORK_CACHE:
+            # Load the network built by a previous run with the same input (or build it and save it)
+            myNet = netcache.getNetwork(masks=networkMasks, cacheDir=NETWORK_CACHE_DIR, doReduceNodes=DO_REDUCE_NUMBER_OF_NODES, doCache=DO_ED_COST_CACHE,
+                cachePath=ED_COST_CACHE_PATH, cacheMaxEntries=ED_COST_CACHE_MAX_ENTRIES)
+            print(f"Network with {myNet.nNodes} nodes and {myNet.nArcs} arcs in {myNet.nbytes()/2**20:.1f} MB")
+            if not DO_CSR_NETWORK:
+                myNet = UC_Network.fromCSR(myNet)
+        elif DO_CSR_NETWORK:
+            myNet = network.UC_NetworkCSR.createModelFromInput(masks=networkMasks, doReduceNodes=DO_REDUCE_NUMBER_OF_NODES, doCache=DO_ED_COST_CACHE,
+                cachePath=ED_COST_CACHE_PATH, cacheMaxEntries=ED_COST_CACHE_MAX_ENTRIES)
+            print(f"Network with {myNet.nNodes} nodes and {myNet.nArcs} arcs in {myNet.nbytes()/2**20:.1f} MB")
+        else:
+            myNet = UC_Network.createModelFromInput(networkMasks)
+        if DO_MINUP_MINDOWN and DO_PRUNE_INFEASIBLE_ARCS:
+            with instrument.phase('pruning'):
+                myNet = myNet.pruneInfeasibleArcs(getHistoryInput())
     after1 = datetime.datetime.now()
     print("****** NETWORK CREATED IN ", after1-now1, " ******\n\n")
     ######################################################
 
+    if DO_DP_SOLVER:
+        ######################################################
+        # Solve the problem with the native DP solver instead of the MILP
+        print("****** I'M SOLVING THE MODEL WITH THE DP SOLVER ******")
+        now2 = datetime.datetime.now()
+        if DO_CSR_NETWORK:
+            dpNet = myNet
+        elif DO_NETWORK_CACHE:
+            dpNet = netcache.getNetwork(masks=networkMasks, cacheDir=NETWORK_CACHE_DIR, doReduceNodes=DO_REDUCE_NUMBER_OF_NODES, doCache=DO_ED_COST_CACHE,
+                cachePath=ED_COST_CACHE_PATH, cacheMaxEntries=ED_COST_CACHE_MAX_ENTRIES)
+            if DO_MINUP_MINDOWN and DO_PRUNE_INFEASIBLE_ARCS:
+                dpNet = dpNet.pruneInfeasibleArcs(getHistoryInput())
+        else:
+            dpNet = network.UC_NetworkCSR.createModelFromInput(masks=networkMasks, doReduceNodes=DO_REDUCE_NUMBER_OF_NODES,
+                doCache=DO_ED_COST_CACHE, cachePath=ED_COST_CACHE_PATH, cacheMaxEntries=ED_COST_CACHE_MAX_ENTRIES)
+            if DO_MINUP_MINDOWN and DO_PRUNE_INFEASIBLE_ARCS:
+                dpNet = dpNet.pruneInfeasibleArcs(getHistoryInput())
+        with instrument.phase('solve'):
+            tauUp, tauDown = np.asarray(input.min_switch_up), np.asarray(input.min_switch_down)
+            dpSolution = dpsolver.solveDP(dpNet, tauUp, tauDown, doMinUpMinDown=DO_MINUP_MINDOWN,
+                                          initialCounters=dpsolver.getInitialCounters(getHistoryInput(), tauUp, tauDown))
+        after2 = datetime.datetime.now()
+        if dpSolution is None:
+            print("****** MODEL NOT SOLVED ******\n\n")
+            reportInstrumentation()
+            exit(1)
+        for t, commitment in enumerate(dpSolution.getCommitmentStrings(input.nUnita)):
+            print(f"Period {t}: {commitment}")
+        print(f"Objective: {dpSolution.objective}")
+        print("****** MODEL SOLVED IN ", after2-now2, " ******\n\n")
+        print("Total time elapsed: ", after2-now1)
+        reportInstrumentation()
+        exit(0)
+        ######################################################
+
     
     ######################################################
     print("****** I'M CREATING THE MODEL TO SOLVE THE UNIT COMMITMENT PROBLEM ******")
     now2 = datetime.datetime.now()
-    UC_Model.generateUCNetworkModel(myNet)
-    UCNetworkModel = UC_Model.getSingletonModel()
+    backend = UC_Model.getBackend()
+    backend.buildModel(myNet)
     after2 = datetime.datetime.now()
-    UCNetworkModel.print_information()
     print("****** UNIT COMMITMENT (NETWORK) MODEL CREATED IN ", after2-now2, " ******\n\n")
     ######################################################
 
 
     ######################################################
     # # solve the model and print the solution
-    print("****** I'M SOLVING THE MODEL ******")
+    print(f"****** I'M SOLVING THE MODEL WITH {backend.name.upper()} ******")
     now3 = datetime.datetime.now()
-    modelSolution = UCNetworkModel.solve()
+    modelSolution = backend.solve(myNet)
     after3 = datetime.datetime.now()
-    if modelSolution:
+    if modelSolution.isSolved:
         modelSolution.display()
+        schedule = modelSolution.getSchedule()
+        print(f"ED cost {schedule.edCosts.sum():.2f}, startup cost {schedule.startupCosts.sum():.2f}")
         print("****** MODEL SOLVED IN ", after3-now3, " ******\n\n")
     else:
-        print("****** MODEL NOT SOLVED ******\n\n")
+        print(f"****** MODEL NOT SOLVED ({modelSolution.status}) ******\n\n")
+        reportInstrumentation()
         exit(1)
     ######################################################
 
     print("Total time elapsed: ", after3-now1)
+    reportInstrumentation()
     ######################################################
-    utils.plotNetworkWithSolution(myNet, modelSolution, print_all_arcs=DO_PRINT_ALL_ARCS)
+    utils.plotNetworkWithSolution(myNet, modelSolution, print_all_arcs=DO_PRINT_ALL_ARCS, savePath=PLOT_PATH, maxArcs=PLOT_MAX_ARCS)
     ######################################################
-
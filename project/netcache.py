@@ -0,0 +1,89 @@
+#This module contains the persistent cache of the built networks.
+# Building the network (nodes, ED costs, arcs) only depends on the input parameters, so the arrays of a
+# network.UC_NetworkCSR are saved as .npy files in a directory named after a fingerprint of all the input
+# parameters. The next run with the same input loads them memory-mapped and skips the whole network phase,
+# e.g. when only the solver settings change or in a parameter sweep on the MILP.
+# A directory is written under a temporary name and renamed at the end, so a reader never sees a partial artifact.
+# The artifacts of a key are identical: when two processes save the same key, the artifact renamed first is kept.
+# Only the maxArtifacts most recently used networks are kept.
+import hashlib
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+import input
+import network
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.netcache')
+DEFAULT_MAX_ARTIFACTS = 8
+ARTIFACT_VERSION = 1
+ARRAY_NAMES = ('nodeMask', 'nodePeriod', 'nodeF', 'arcPtr', 'arcTo', 'arcCost')
+
+
+def inputKey(inp=input, doReduceNodes=True, masks=None):
+    # Fingerprint of all the input parameters (and of the construction options) of a network
+    params = [ARTIFACT_VERSION, inp.nUnita, inp.nPeriodi, list(inp.D), list(inp.c1), list(inp.c2), list(inp.c3),
+              list(inp.Pmin), list(inp.Pmax), list(inp.startup_cost), list(inp.min_switch_up), list(inp.min_switch_down),
+              inp.initial_status, getattr(inp, 'initial_status_periods', None), doReduceNodes]
+    if masks is not None:
+        # a network on a subset of the masks (e.g. symmetry.getSymmetryMasks)
+        params.append(hashlib.sha1(np.asarray(masks, dtype=np.int64).tobytes()).hexdigest())
+    return hashlib.sha1(repr(params).encode()).hexdigest()
+
+
+def saveNetwork(net, path):
+    # Save the arrays of a UC_NetworkCSR in the directory path (kept as it is if another process saved it first)
+    parent = os.path.dirname(os.path.abspath(path))
+    os.makedirs(parent, exist_ok=True)
+    tmpPath = tempfile.mkdtemp(dir=parent, prefix='.tmp-')
+    try:
+        for name in ARRAY_NAMES:
+            np.save(os.path.join(tmpPath, name + '.npy'), np.ascontiguousarray(getattr(net, name)))
+        np.save(os.path.join(tmpPath, 'shape.npy'), np.array([net.nUnits, net.nPeriods], dtype=np.int64))
+        try:
+            os.replace(tmpPath, path)
+        except OSError:
+            # path is already there (a directory is not replaced by a rename): it is a complete artifact of the same key
+            if not os.path.isfile(os.path.join(path, 'shape.npy')):
+                raise
+            shutil.rmtree(tmpPath, ignore_errors=True)
+    except BaseException:
+        shutil.rmtree(tmpPath, ignore_errors=True)
+        raise
+
+
+def loadNetwork(path, mmap=True):
+    # Return the UC_NetworkCSR saved in the directory path (None if there is none).
+    # With mmap the arrays are memory-mapped read-only: only the pages that are used are read from disk.
+    if not os.path.isfile(os.path.join(path, 'shape.npy')):
+        return None
+    mmapMode = 'r' if mmap else None
+    arrays = {name: np.load(os.path.join(path, name + '.npy'), mmap_mode=mmapMode) for name in ARRAY_NAMES}
+    nUnits, nPeriods = (int(v) for v in np.load(os.path.join(path, 'shape.npy')))
+    return network.UC_NetworkCSR(nUnits, nPeriods, **arrays)
+
+
+def evictArtifacts(cacheDir, maxArtifacts):
+    # Remove the least recently used artifacts over maxArtifacts
+    artifacts = [os.path.join(cacheDir, name) for name in os.listdir(cacheDir) if not name.startswith('.')]
+    artifacts.sort(key=os.path.getmtime, reverse=True)
+    for path in artifacts[maxArtifacts:]:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def getNetwork(inp=input, cacheDir=DEFAULT_CACHE_DIR, doReduceNodes=True, mmap=True, maxArtifacts=DEFAULT_MAX_ARTIFACTS,
+               masks=None, **buildOptions):
+    # Load the network of inp from the cache, or build it (UC_NetworkCSR.createModelFromInput) and save it
+    path = os.path.join(cacheDir, inputKey(inp, doReduceNodes, masks))
+    net = loadNetwork(path, mmap)
+    if net is not None:
+        os.utime(path)
+        print(f"I loaded the network from {path}")
+        return net
+    net = network.UC_NetworkCSR.createModelFromInput(inp, masks=masks, doReduceNodes=doReduceNodes, **buildOptions)
+    saveNetwork(net, path)
+    evictArtifacts(cacheDir, maxArtifacts)
+    print(f"I saved the network in {path}")
+    return net
@@ -0,0 +1,362 @@
+#This module contains a compact, array-backed representation of the time-expanded UC network.
+# Nodes are stored as integer (mask, period) arrays sorted by period, arcs as a CSR adjacency
+# (the out arcs of node k are arcTo[arcPtr[k]:arcPtr[k+1]]) with a float cost array.
+# Since the nodes are sorted by period, the arcs of each period are a contiguous block too.
+# A thin object view (nodes/arcs with the attributes of main.Node/main.Arc) is created on demand
+# for the model builder and for utils.plotNetworkWithSolution.
+import time
+
+import numpy as np
+
+import dispatch
+import dpsolver
+import edcache
+import input
+import instrument
+import preprocess
+import utils
+
+
+class UC_NetworkCSR():
+    """
+    Array-backed UC network
+
+    Attributes:
+        nUnits, nPeriods: size of the instance
+        nodeMask: commitment mask of each node (int64)
+        nodePeriod: period of each node (int32), -1 for the source and nPeriods for the sink
+        nodeF: ED cost of each node (float64), 0 for the source and the sink
+        periodPtr: the nodes of period t are the indexes in [periodPtr[t+1], periodPtr[t+2])
+        arcPtr: CSR index pointer over the nodes (int64, len nNodes+1)
+        arcTo: head node of each arc (int32)
+        arcCost: cost of each arc (float64)
+    """
+
+    def __init__(self, nUnits, nPeriods, nodeMask, nodePeriod, nodeF, arcPtr, arcTo, arcCost):
+        self.nUnits = nUnits
+        self.nPeriods = nPeriods
+        self.nodeMask = nodeMask
+        self.nodePeriod = nodePeriod
+        self.nodeF = nodeF
+        self.arcPtr = arcPtr
+        self.arcTo = arcTo
+        self.arcCost = arcCost
+        self.periodPtr = np.searchsorted(nodePeriod, np.arange(-1, nPeriods + 2), side='left')
+
+        self._arcFrom = None
+        self._inArcs = None
+        self._nodeViews = None
+        self._arcViews = None
+
+    @property
+    def nNodes(self):
+        return len(self.nodeMask)
+
+    @property
+    def nArcs(self):
+        return len(self.arcTo)
+
+    @property
+    def source(self):
+        return 0
+
+    @property
+    def sink(self):
+        return self.nNodes - 1
+
+    @property
+    def arcFrom(self):
+        # tail node of each arc (expanded from the CSR index pointer on demand)
+        if self._arcFrom is None:
+            self._arcFrom = np.repeat(np.arange(self.nNodes, dtype=np.int32), np.diff(self.arcPtr))
+        return self._arcFrom
+
+    def nodesOfPeriod(self, t):
+        return np.arange(self.periodPtr[t + 1], self.periodPtr[t + 2])
+
+    def outArcs(self, k):
+        return np.arange(self.arcPtr[k], self.arcPtr[k + 1])
+
+    def inArcs(self, k):
+        # the reverse adjacency is built once, the first time it is needed
+        if self._inArcs is None:
+            order = np.argsort(self.arcTo, kind='stable')
+            inPtr = np.zeros(self.nNodes + 1, dtype=np.int64)
+            np.cumsum(np.bincount(self.arcTo, minlength=self.nNodes), out=inPtr[1:])
+            self._inArcs = (inPtr, order)
+        inPtr, order = self._inArcs
+        return order[inPtr[k]:inPtr[k + 1]]
+
+    def nbytes(self):
+        # memory used by the arrays of the network
+        arrays = [self.nodeMask, self.nodePeriod, self.nodeF, self.arcPtr, self.arcTo, self.arcCost, self.periodPtr]
+        return sum(a.nbytes for a in arrays)
+
+    def subNetwork(self, keepArcs):
+        # Return the network with only the arcs in keepArcs (boolean array) and the nodes still on some arc
+        keepArcs = np.asarray(keepArcs, dtype=bool)
+        keepNodes = preprocess.getKeptNodes(self.nNodes, self.nodePeriod, self.nPeriods, self.arcFrom, self.arcTo, keepArcs)
+        newIndex = np.cumsum(keepNodes) - 1
+        outDegree = np.bincount(self.arcFrom[keepArcs], minlength=self.nNodes)[keepNodes]
+        arcPtr = np.zeros(keepNodes.sum() + 1, dtype=np.int64)
+        np.cumsum(outDegree, out=arcPtr[1:])
+        return UC_NetworkCSR(self.nUnits, self.nPeriods, self.nodeMask[keepNodes], self.nodePeriod[keepNodes],
+                             self.nodeF[keepNodes], arcPtr, newIndex[self.arcTo[keepArcs]].astype(np.int32),
+                             self.arcCost[keepArcs])
+
+    def pruneInfeasibleArcs(self, inp=input, relaxLastPeriod=True):
+        # Return the network without the arcs and the nodes that can never be on a path feasible for min up/down
+        tauUp = np.asarray(inp.min_switch_up, dtype=np.int64)
+        tauDown = np.asarray(inp.min_switch_down, dtype=np.int64)
+        keepArcs = preprocess.findFeasibleArcs(self.nodeMask, self.nodePeriod, self.arcFrom, self.arcTo, self.nPeriods,
+                                               self.nUnits, tauUp, tauDown, dpsolver.getInitialCounters(inp, tauUp, tauDown),
+                                               relaxLastPeriod)
+        prunedNet = self.subNetwork(keepArcs)
+        print(f"I removed {self.nArcs-prunedNet.nArcs} arcs and {self.nNodes-prunedNet.nNodes} nodes that can not be on a feasible path")
+        return prunedNet
+
+    ###################### Thin object view ######################
+    @property
+    def nodes(self):
+        if self._nodeViews is None:
+            self._nodeViews = [NodeView(self, k) for k in range(self.nNodes)]
+        return self._nodeViews
+
+    @property
+    def arcs(self):
+        if self._arcViews is None:
+            nodes = self.nodes
+            arcFrom = self.arcFrom
+            self._arcViews = [ArcView(self, a, nodes[arcFrom[a]], nodes[self.arcTo[a]]) for a in range(self.nArcs)]
+        return self._arcViews
+
+    ###################### Construction ######################
+    @staticmethod
+    def createModelFromInput(inp=input, masks=None, doReduceNodes=True, doCache=True,
+                             cachePath=edcache.DEFAULT_CACHE_PATH, cacheMaxEntries=edcache.DEFAULT_MAX_ENTRIES,
+                             costFunction=None, layers=None):
+        # costFunction(masks, demands) returns the ED costs (by default the vectorized ED through the ED cost cache).
+        # layers are the sorted masks of each period (e.g. beam.getBeamLayers), instead of the same masks for every period
+        nUnits, nPeriods = inp.nUnita, inp.nPeriodi
+        assert len(inp.D) == nPeriods
+        if masks is None and layers is None:
+            masks = np.arange(2**nUnits, dtype=np.int64)
+        D = np.asarray(inp.D, dtype=np.float64)
+
+        # 1. Validity: the masks whose units can meet the demand of each period (if doReduceNodes)
+        isValid = None
+        if layers is None and doReduceNodes:
+            masks = np.asarray(masks, dtype=np.int64)
+            with instrument.phase('validity'):
+                isValid = utils.getValidMasksByPeriod(masks, inp.Pmin, inp.Pmax, D)
+
+        # 2. Nodes: the masks of each period (only the valid ones if doReduceNodes)
+        with instrument.phase('nodes'):
+            if layers is not None:
+                layers = [np.asarray(l, dtype=np.int64) for l in layers]
+                assert len(layers) == nPeriods
+            elif isValid is not None:
+                layers = [masks[isValid[t]] for t in range(nPeriods)]
+            else:
+                layers = [np.asarray(masks, dtype=np.int64)] * nPeriods
+            initialMask = utils.binStrToInt(inp.initial_status)
+
+            nodeMask = np.concatenate([[initialMask], *layers, [initialMask]]).astype(np.int64)
+            nodePeriod = np.concatenate([[-1], *[np.full(len(l), t) for t, l in enumerate(layers)], [nPeriods]]).astype(np.int32)
+        instrument.count('nodes', len(nodeMask))
+
+        # 3. ED costs of all the internal nodes in one batched call
+        nodeF = np.zeros(len(nodeMask))
+        internal = slice(1, len(nodeMask) - 1)
+        if costFunction is None:
+            costFunction = UC_NetworkCSR.getCostFunction(inp, doCache, cachePath, cacheMaxEntries)
+        with instrument.phase('ED'):
+            nodeF[internal] = costFunction(nodeMask[internal], D[nodePeriod[internal]])
+        instrument.count('ED infeasible nodes', int(np.count_nonzero(nodeF >= dispatch.INFEASIBLE_COST)))
+
+        # 4. Arcs: every node of period t is connected with every node of period t+1
+        periodPtr = np.searchsorted(nodePeriod, np.arange(-1, nPeriods + 2), side='left')
+        outDegree = np.zeros(len(nodeMask), dtype=np.int64)
+        arcToBlocks, arcCostBlocks = [], []
+        with instrument.phase('arcs'):
+            for t in range(-1, nPeriods):
+                fromIdx = np.arange(periodPtr[t + 1], periodPtr[t + 2])
+                toIdx = np.arange(periodPtr[t + 2], periodPtr[t + 3])
+                outDegree[fromIdx] = len(toIdx)
+                arcTo, arcCost = UC_NetworkCSR.getArcBlock(fromIdx, toIdx, nodeMask, nodeF, inp.startup_cost, t == nPeriods - 1)
+                arcToBlocks.append(arcTo)
+                arcCostBlocks.append(arcCost)
+            arcPtr = np.zeros(len(nodeMask) + 1, dtype=np.int64)
+            np.cumsum(outDegree, out=arcPtr[1:])
+        instrument.count('arcs', int(arcPtr[-1]))
+
+        return UC_NetworkCSR(nUnits, nPeriods, nodeMask, nodePeriod, nodeF, arcPtr,
+                             np.concatenate(arcToBlocks), np.concatenate(arcCostBlocks))
+
+    @staticmethod
+    def getCostFunction(inp=input, doCache=True, cachePath=edcache.DEFAULT_CACHE_PATH, cacheMaxEntries=edcache.DEFAULT_MAX_ENTRIES):
+        # Return a function (masks, demands) -> ED costs, through the ED cost cache if doCache
+        edEngine = dispatch.EconomicDispatch.fromInput(inp)
+
+        def solve(masks, demands):
+            start = time.perf_counter()
+            costs = edEngine.cost(masks, demands)
+            instrument.observe('ED batch', time.perf_counter() - start)
+            instrument.count('ED solves', len(costs))
+            return costs
+        if not doCache:
+            return solve
+        cache = edcache.openCache(edcache.fleetKey(inp), cachePath, cacheMaxEntries)
+
+        def cachedCost(masks, demands):
+            hits = cache.hits
+            costs = cache.getCosts(masks, demands, solve)
+            cache.flush()
+            instrument.count('ED cache hits', cache.hits - hits)
+            return costs
+        return cachedCost
+
+    @staticmethod
+    def getArcBlock(fromIdx, toIdx, nodeMask, nodeF, startup_cost, toSink):
+        # Arcs from every node of fromIdx to every node of toIdx (row by row): (head nodes, costs)
+        if toSink:
+            # arcs to the sink: no transition cost
+            transitionCost = np.zeros((len(fromIdx), len(toIdx)))
+        else:
+            transitionCost = utils.getTransitionCosts(nodeMask[fromIdx][:, None], nodeMask[toIdx][None, :], startup_cost)
+        return np.tile(toIdx, len(fromIdx)).astype(np.int32), (nodeF[fromIdx][:, None] + transitionCost).ravel()
+
+    ###################### Demand updates ######################
+    def updateDemands(self, D, inp=input, masks=None, doReduceNodes=True, doCache=True,
+                      cachePath=edcache.DEFAULT_CACHE_PATH, cacheMaxEntries=edcache.DEFAULT_MAX_ENTRIES):
+        # Move the network built by createModelFromInput(inp, masks, doReduceNodes) (not pruned) to the demands D.
+        # Only the periods whose demand changed are recomputed: their valid masks and ED costs, and the arcs out of them.
+        # Return (network, changed periods). The network is self with nodeF and arcCost patched in place if the valid
+        # masks of the changed periods are the same, otherwise a new network where only the layers of the changed
+        # periods and their arcs are rebuilt.
+        D = np.asarray(D, dtype=np.float64)
+        changed = np.flatnonzero(D != np.asarray(inp.D, dtype=np.float64))
+        if len(changed) == 0:
+            return self, changed
+        if masks is None:
+            masks = np.arange(2**self.nUnits, dtype=np.int64)
+        masks = np.asarray(masks, dtype=np.int64)
+        if doReduceNodes:
+            isValid = utils.getValidMasksByPeriod(masks, inp.Pmin, inp.Pmax, D[changed])
+            layers = {int(t): masks[isValid[k]] for k, t in enumerate(changed)}
+        else:
+            layers = {int(t): masks for t in changed}
+        costFunction = UC_NetworkCSR.getCostFunction(inp, doCache, cachePath, cacheMaxEntries)
+
+        if all(np.array_equal(layers[t], self.nodeMask[self.nodesOfPeriod(t)]) for t in layers):
+            # Same nodes: patch the ED costs of the changed periods and the costs of their out arcs
+            if not self.nodeF.flags.writeable or not self.arcCost.flags.writeable:
+                # e.g. memory-mapped from netcache
+                self.nodeF, self.arcCost = np.array(self.nodeF), np.array(self.arcCost)
+            for t in layers:
+                nodes = self.nodesOfPeriod(t)
+                self.nodeF[nodes] = costFunction(self.nodeMask[nodes], np.full(len(nodes), D[t]))
+                if len(nodes) == 0:
+                    continue
+                first, last = self.arcPtr[nodes[0]], self.arcPtr[nodes[-1] + 1]
+                arcFrom = self.arcFrom[first:last]
+                arcTo = self.arcTo[first:last]
+                if t == self.nPeriods - 1:
+                    self.arcCost[first:last] = self.nodeF[arcFrom]
+                else:
+                    self.arcCost[first:last] = self.nodeF[arcFrom] + utils.getTransitionCosts(
+                        self.nodeMask[arcFrom], self.nodeMask[arcTo], inp.startup_cost)
+            return self, changed
+
+        # Different nodes: rebuild the changed layers and the arcs into and out of them, copy the other arc blocks
+        nodeMaskBlocks, nodeFBlocks = [], []
+        for t in range(-1, self.nPeriods + 1):
+            if t in layers:
+                nodeMaskBlocks.append(layers[t])
+                nodeFBlocks.append(costFunction(layers[t], np.full(len(layers[t]), D[t])))
+            else:
+                nodes = self.nodesOfPeriod(t)
+                nodeMaskBlocks.append(self.nodeMask[nodes])
+                nodeFBlocks.append(self.nodeF[nodes])
+        nodeMask = np.concatenate(nodeMaskBlocks).astype(np.int64)
+        nodeF = np.concatenate(nodeFBlocks).astype(np.float64)
+        nodePeriod = np.concatenate([np.full(len(b), t) for t, b in zip(range(-1, self.nPeriods + 1), nodeMaskBlocks)]).astype(np.int32)
+        periodPtr = np.searchsorted(nodePeriod, np.arange(-1, self.nPeriods + 2), side='left')
+
+        outDegree = np.zeros(len(nodeMask), dtype=np.int64)
+        arcToBlocks, arcCostBlocks = [], []
+        for t in range(-1, self.nPeriods):
+            fromIdx = np.arange(periodPtr[t + 1], periodPtr[t + 2])
+            toIdx = np.arange(periodPtr[t + 2], periodPtr[t + 3])
+            if t in layers or t + 1 in layers:
+                outDegree[fromIdx] = len(toIdx)
+                arcTo, arcCost = UC_NetworkCSR.getArcBlock(fromIdx, toIdx, nodeMask, nodeF, inp.startup_cost, t == self.nPeriods - 1)
+            else:
+                oldNodes = self.nodesOfPeriod(t)
+                outDegree[fromIdx] = np.diff(self.arcPtr[oldNodes[0]:oldNodes[-1] + 2]) if len(oldNodes) else 0
+                first, last = self.arcPtr[self.periodPtr[t + 1]], self.arcPtr[self.periodPtr[t + 2]]
+                arcTo = (self.arcTo[first:last] - self.periodPtr[t + 2] + periodPtr[t + 2]).astype(np.int32)
+                arcCost = self.arcCost[first:last]
+            arcToBlocks.append(arcTo)
+            arcCostBlocks.append(arcCost)
+        arcPtr = np.zeros(len(nodeMask) + 1, dtype=np.int64)
+        np.cumsum(outDegree, out=arcPtr[1:])
+        return UC_NetworkCSR(self.nUnits, self.nPeriods, nodeMask, nodePeriod, nodeF, arcPtr,
+                             np.concatenate(arcToBlocks), np.concatenate(arcCostBlocks)), changed
+
+
+class NodeView():
+    # Read-only view of a node of a UC_NetworkCSR with the interface of main.Node
+    __slots__ = ('_net', 'index', 'id', '_t', 'isSource', 'isSink', 'b')
+
+    def __init__(self, net, index):
+        self._net = net
+        self.index = index
+        self._t = int(net.nodePeriod[index])
+        self.id = (int(net.nodeMask[index]), self._t)
+        self.isSource = index == net.source
+        self.isSink = index == net.sink
+        self.b = 1 if self.isSource else (-1 if self.isSink else 0)
+
+    @property
+    def u(self):
+        return [bool(self.id[0] & utils.unitBit(i, self._net.nUnits)) for i in range(self._net.nUnits)]
+
+    @property
+    def _F(self):
+        return float(self._net.nodeF[self.index])
+
+    @property
+    def outerArcs(self):
+        arcs = self._net.arcs
+        return [arcs[a] for a in self._net.outArcs(self.index)]
+
+    @property
+    def innerArcs(self):
+        arcs = self._net.arcs
+        return [arcs[a] for a in self._net.inArcs(self.index)]
+
+    def getIntegerNumber(self):
+        return int(self._net.nodeMask[self.index])
+
+    def __str__(self):
+        return f"Node {(utils.intToBinStr(self.id[0], self._net.nUnits), self._t)}"
+
+
+class ArcView():
+    # Read-only view of an arc of a UC_NetworkCSR with the interface of main.Arc
+    __slots__ = ('_net', 'index', '_n1', '_n2', 'id')
+
+    def __init__(self, net, index, node1, node2):
+        self._net = net
+        self.index = index
+        self._n1 = node1
+        self._n2 = node2
+        self.id = (node1.id, node2.id)
+
+    @property
+    def cost(self):
+        return float(self._net.arcCost[self.index])
+
+    def __str__(self):
+        return f"Arc: [{self._n1.id}] --> [{self._n2.id}]"
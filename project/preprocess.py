@@ -0,0 +1,81 @@
+#This module contains the static elimination of the arcs that can never be on a feasible path.
+# 1. Forward reachability from the source: every node keeps, for each unit, the largest number of periods
+#    the unit can have been in its current state on a path reaching the node (the initial status history
+#    is the starting point). An arc switching a unit is removed if the unit is locked by its min up/down time
+#    even with that largest counter, i.e. on every path reaching the tail node.
+# 2. Backward reachability from the sink on the remaining arcs.
+# The two passes are repeated until nothing changes. The largest counters over-approximate the freedom of every
+# path, so no arc of a feasible path is ever removed. The rules follow dpsolver (source arcs constrained,
+# switches into the last period and arcs to the sink never constrained).
+import numpy as np
+
+import dpsolver
+
+
+def findFeasibleArcs(nodeMask, nodePeriod, arcFrom, arcTo, nPeriods, nUnits, tauUp, tauDown, initialCounters,
+                     relaxLastPeriod=True):
+    # Return a boolean array: True for the arcs that can be on a feasible path.
+    # The source is the node of period -1, the sink the node of period nPeriods.
+    nodeMask = np.asarray(nodeMask, dtype=np.int64)
+    nodePeriod = np.asarray(nodePeriod)
+    arcFrom = np.asarray(arcFrom, dtype=np.int64)
+    arcTo = np.asarray(arcTo, dtype=np.int64)
+    tauUp = np.asarray(tauUp, dtype=np.int64)
+    tauDown = np.asarray(tauDown, dtype=np.int64)
+    nNodes = len(nodeMask)
+    source = int(np.flatnonzero(nodePeriod == -1)[0])
+    sink = int(np.flatnonzero(nodePeriod == nPeriods)[0])
+
+    # arcs grouped by the period of their tail node
+    arcPeriod = nodePeriod[arcFrom]
+    order = np.argsort(arcPeriod, kind='stable')
+    periodStarts = np.searchsorted(arcPeriod[order], np.arange(-1, nPeriods + 1))
+    arcsOfPeriod = [order[periodStarts[t + 1]:periodStarts[t + 2]] for t in range(-1, nPeriods)]
+
+    keep = np.ones(len(arcFrom), dtype=bool)
+    while True:
+        nKept = keep.sum()
+
+        # 1. Forward pass
+        reached = np.zeros(nNodes, dtype=bool)
+        counters = np.zeros((nNodes, nUnits), dtype=np.int64)
+        reached[source] = True
+        counters[source] = initialCounters
+        for t in range(-1, nPeriods):
+            arcs = arcsOfPeriod[t + 1]
+            arcs = arcs[keep[arcs] & reached[arcFrom[arcs]]]
+            keep[arcsOfPeriod[t + 1]] = False
+            if len(arcs) == 0:
+                continue
+            tails, heads = arcFrom[arcs], arcTo[arcs]
+            switched = nodeMask[tails] ^ nodeMask[heads]
+            if t < nPeriods - 1 and not (relaxLastPeriod and t + 1 == nPeriods - 1):
+                locked = dpsolver.lockedMasks(nodeMask[tails], counters[tails], tauUp, tauDown, nUnits)
+                allowed = (switched & locked) == 0
+                arcs, tails, heads, switched = arcs[allowed], tails[allowed], heads[allowed], switched[allowed]
+            keep[arcs] = True
+            if t < nPeriods - 1:
+                newCounters = dpsolver.nextCounters(counters[tails], switched, nodeMask[heads], tauUp, tauDown, nUnits)
+                np.maximum.at(counters, heads, newCounters)
+            reached[heads] = True
+
+        # 2. Backward pass
+        reachesSink = np.zeros(nNodes, dtype=bool)
+        reachesSink[sink] = True
+        for t in range(nPeriods - 1, -2, -1):
+            arcs = arcsOfPeriod[t + 1]
+            arcs = arcs[keep[arcs]]
+            keep[arcs] = reachesSink[arcTo[arcs]]
+            reachesSink[arcFrom[arcs[keep[arcs]]]] = True
+
+        if keep.sum() == nKept:
+            return keep
+
+
+def getKeptNodes(nNodes, nodePeriod, nPeriods, arcFrom, arcTo, keepArcs):
+    # Nodes still on some kept arc (the source and the sink are always kept)
+    keepNodes = np.zeros(nNodes, dtype=bool)
+    keepNodes[np.asarray(arcFrom)[keepArcs]] = True
+    keepNodes[np.asarray(arcTo)[keepArcs]] = True
+    keepNodes[(np.asarray(nodePeriod) == -1) | (np.asarray(nodePeriod) == nPeriods)] = True
+    return keepNodes
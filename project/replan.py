@@ -0,0 +1,122 @@
+#This module contains the incremental re-solve of the UC problem when some demands of the forecast change.
+# The network of the previous solve is moved to the new demands by UC_NetworkCSR.updateDemands: only the periods
+# whose demand changed get new valid masks, new ED costs and new out-arc costs. The previous commitment is then
+# a warm start for the new solve:
+#   - the DP solver gets its cost on the new demands as an upper bound (the min up/down feasibility of a path does
+#     not depend on the demands, so it is still feasible if its masks are still valid),
+#   - CPLEX gets it as a MIP start.
+# The previous commitment is only used if it is a path of the new network and meets the min up/down times: the cost
+# of a schedule that breaks them can be below the constrained optimum, and as a bound it would prune every label.
+# The DP solve runs on the network that is not pruned, so the re-plan latency does not depend on a new pruning pass.
+#
+# Usage: python replan.py 3=950 4=1020   (period=new demand)
+import sys
+import time
+
+import numpy as np
+
+import dpsolver
+import input
+import network
+import rolling
+import utils
+
+
+class ReplanResult():
+    """
+    Result of an incremental re-solve
+
+    Attributes:
+        net: network of the new demands (to pass to the next re-plan)
+        inp: input with the new demands (to pass to the next re-plan)
+        masks: commitment mask of each period (None if there is no feasible schedule)
+        objective: cost of the new schedule
+        changedPeriods: periods whose demand changed
+        inPlace: True if the network was patched in place (the valid masks did not change)
+        warmStart: True if the previous commitment was used as a bound or as a MIP start
+        updateTime, solveTime: seconds spent to update the network and to solve
+    """
+
+    def __init__(self, net, inp, masks, objective, changedPeriods, inPlace, warmStart, updateTime, solveTime):
+        self.net = net
+        self.inp = inp
+        self.masks = masks
+        self.objective = objective
+        self.changedPeriods = changedPeriods
+        self.inPlace = inPlace
+        self.warmStart = warmStart
+        self.updateTime = updateTime
+        self.solveTime = solveTime
+
+
+def isPathOfNetwork(net, masks):
+    # True if every mask is a node of its period
+    for t, mask in enumerate(masks):
+        nodes = net.nodesOfPeriod(t)
+        k = np.searchsorted(net.nodeMask[nodes], mask)
+        if k == len(nodes) or net.nodeMask[nodes[k]] != mask:
+            return False
+    return True
+
+
+def replan(net, inp, previousMasks, demandDelta, solver='dp', doMinUpMinDown=True, doCache=True):
+    # net: network of inp (UC_NetworkCSR, not pruned), previousMasks: commitment of the previous solve,
+    # demandDelta: dict period -> new demand. Return a ReplanResult.
+    # The 'cplex' solver builds the model of main.UC_Model, so inp must have the fleet of the input module (e.g. the
+    # inp of the previous ReplanResult) and the new demands are written to the input module.
+    D = list(inp.D)
+    for t, demand in demandDelta.items():
+        D[t] = demand
+
+    start = time.perf_counter()
+    newNet, changed = net.updateDemands(D, inp, doCache=doCache)
+    newInp = rolling.copyInput(inp, D=D)
+    updateTime = time.perf_counter() - start
+
+    start = time.perf_counter()
+    tauUp = np.asarray(inp.min_switch_up, dtype=np.int64)
+    tauDown = np.asarray(inp.min_switch_down, dtype=np.int64)
+    warmStart = (previousMasks is not None and isPathOfNetwork(newNet, previousMasks)
+                 and (not doMinUpMinDown or dpsolver.isFeasibleSchedule(previousMasks, utils.binStrToInt(inp.initial_status),
+                                                                        dpsolver.getInitialCounters(inp, tauUp, tauDown),
+                                                                        tauUp, tauDown, inp.nUnita)))
+    if solver == 'dp':
+        upperBound = rolling.getScheduleCost(newInp, previousMasks, doCache) if warmStart else None
+        solution = dpsolver.solveDP(newNet, tauUp, tauDown, doMinUpMinDown=doMinUpMinDown,
+                                    initialCounters=dpsolver.getInitialCounters(inp, tauUp, tauDown), upperBound=upperBound)
+        masks, objective = (None, None) if solution is None else (solution.masks, solution.objective)
+    elif solver == 'cplex':
+        # the model of main.UC_Model reads the input module: inp must have its fleet, the new demands are written to it
+        import main
+        if any(getattr(inp, name, None) != getattr(input, name, None) for name in rolling.INPUT_ATTRIBUTES
+               if name not in ('nPeriodi', 'D')):
+            raise ValueError("The 'cplex' solver builds the model of the input module: inp must have its fleet")
+        input.nPeriodi, input.D = len(D), list(D)
+        main.UC_Model.reset()
+        backend = main.CplexBackend()
+        myNet = newNet.pruneInfeasibleArcs(inp) if doMinUpMinDown else newNet
+        backend.buildModel(myNet)
+        warmStart = warmStart and main.UC_Model.addMipStart(previousMasks)
+        solution = backend.solve(myNet)
+        masks, objective = (solution.getCommitmentMasks(), solution.objective) if solution.isSolved else (None, None)
+    else:
+        raise ValueError(f"Unknown solver {solver}")
+    solveTime = time.perf_counter() - start
+    return ReplanResult(newNet, newInp, masks, objective, changed, newNet is net, warmStart, updateTime, solveTime)
+
+
+if "__main__" == __name__:
+    demandDelta = {int(t): float(d) for (t, d) in (arg.split('=') for arg in sys.argv[1:])}
+    baseNet = network.UC_NetworkCSR.createModelFromInput()
+    baseSolution = dpsolver.solveDP(baseNet)
+    print(f"Base plan: objective {baseSolution.objective}")
+
+    result = replan(baseNet, input, baseSolution.masks, demandDelta)
+    if result.masks is None:
+        print("The new demands have no feasible schedule")
+        exit(1)
+    for t, commitment in enumerate(utils.intToBinStr(m, input.nUnita) for m in result.masks):
+        print(f"Period {t}: {commitment}")
+    print(f"New plan: objective {result.objective}, {len(result.changedPeriods)} periods changed, "
+          f"network {'patched in place' if result.inPlace else 'rebuilt'} in {result.updateTime:.3f} s, "
+          f"solved in {result.solveTime:.3f} s (warm start: {result.warmStart})")
@@ -0,0 +1,168 @@
+#This module contains the rolling-horizon solve of long planning horizons (e.g. a week of hourly periods).
+# The horizon is cut in overlapping windows of windowLength periods. Each window is solved on its own network
+# and only its first commitLength periods are committed, then the next window starts after them.
+# The committed end state is the initial_status of the next window and the elapsed on/off periods of the units
+# are its initial_status_periods, so the min up/down times hold across the windows.
+# A window that is not the last one does not relax its last period (see dpsolver): its switches may be committed.
+# All the windows share the ED cost cache (edcache), so a (mask, demand) pair is solved once for the whole horizon.
+#
+# Usage: python rolling.py --window 24 --commit 12 --days 7 [--full]
+import argparse
+import time
+import types
+
+import numpy as np
+
+import dispatch
+import dpsolver
+import edcache
+import input
+import network
+import solvers
+import utils
+
+INPUT_ATTRIBUTES = ('nUnita', 'nPeriodi', 'D', 'c1', 'c2', 'c3', 'Pmin', 'Pmax', 'startup_cost',
+                    'min_switch_up', 'min_switch_down', 'initial_status', 'initial_status_periods')
+
+
+class RollingSolution():
+    """
+    Commitment found by the rolling-horizon solve
+
+    Attributes:
+        masks: commitment mask of each period of the horizon
+        objective: cost of the whole schedule (ED costs and startup costs)
+        nWindows: number of windows solved
+        windowTimes: seconds spent on each window (network and solve)
+        wallTime: seconds spent on the whole horizon
+    """
+
+    def __init__(self, masks, objective, nWindows, windowTimes, wallTime):
+        self.masks = masks
+        self.objective = objective
+        self.nWindows = nWindows
+        self.windowTimes = windowTimes
+        self.wallTime = wallTime
+
+    def getCommitmentStrings(self, nUnits):
+        return [utils.intToBinStr(m, nUnits) for m in self.masks]
+
+
+def copyInput(inp=input, **changes):
+    # Return a copy of the input parameters as a namespace, with some of them changed
+    params = {name: getattr(inp, name, None) for name in INPUT_ATTRIBUTES}
+    params.update(changes)
+    return types.SimpleNamespace(**params)
+
+
+def getWindowInput(inp, start, end, initialMask, initialCounters):
+    # Input of the window [start, end): the demands of its periods and the state reached at start
+    return copyInput(inp, nPeriodi=end - start, D=list(inp.D[start:end]),
+                     initial_status=utils.intToBinStr(initialMask, inp.nUnita),
+                     initial_status_periods=[int(c) for c in initialCounters])
+
+
+def getScheduleCost(inp, masks, doCache=True):
+    # Cost of a schedule: ED cost of every period plus the startup costs (from initial_status at the first period)
+    masks = np.asarray(masks, dtype=np.int64)
+    D = np.asarray(inp.D, dtype=np.float64)[:len(masks)]
+    edEngine = dispatch.EconomicDispatch.fromInput(inp)
+    if doCache:
+        edCosts = edcache.openCache(edcache.fleetKey(inp)).getCosts(masks, D, edEngine.cost)
+    else:
+        edCosts = edEngine.cost(masks, D)
+    fromMasks = np.concatenate([[utils.binStrToInt(inp.initial_status)], masks[:-1]])
+    return float(edCosts.sum() + utils.getTransitionCosts(fromMasks, masks, inp.startup_cost).sum())
+
+
+def solveWindow(windowInput, solver='dp', doMinUpMinDown=True, doCache=True, relaxLastPeriod=True):
+    # Return the commitment masks of the optimal schedule of one window (None if the window is infeasible)
+    tauUp = np.asarray(windowInput.min_switch_up, dtype=np.int64)
+    tauDown = np.asarray(windowInput.min_switch_down, dtype=np.int64)
+    net = network.UC_NetworkCSR.createModelFromInput(windowInput, doCache=doCache)
+    if doMinUpMinDown:
+        net = net.pruneInfeasibleArcs(windowInput, relaxLastPeriod)
+    if solver == 'dp':
+        solution = dpsolver.solveDP(net, tauUp, tauDown, doMinUpMinDown=doMinUpMinDown,
+                                    initialCounters=dpsolver.getInitialCounters(windowInput, tauUp, tauDown),
+                                    relaxLastPeriod=relaxLastPeriod)
+        return None if solution is None else solution.masks
+    if solver == 'highs':
+        solution = solvers.ScipyMilpBackend(doMinUpMinDown=doMinUpMinDown, inp=windowInput, relaxLastPeriod=relaxLastPeriod).solve(net)
+        return solution.getCommitmentMasks() if solution.isSolved else None
+    raise ValueError(f"Unknown solver {solver}")
+
+
+def solveRollingHorizon(inp=input, windowLength=24, commitLength=12, solver='dp', doMinUpMinDown=True, doCache=True):
+    # Solve the whole horizon of inp window by window. Return a RollingSolution
+    assert 0 < commitLength <= windowLength
+    nUnits, nPeriods = inp.nUnita, inp.nPeriodi
+    tauUp = np.asarray(inp.min_switch_up, dtype=np.int64)
+    tauDown = np.asarray(inp.min_switch_down, dtype=np.int64)
+    if not doMinUpMinDown:
+        tauUp, tauDown = np.zeros(nUnits, dtype=np.int64), np.zeros(nUnits, dtype=np.int64)
+
+    startTime = time.perf_counter()
+    masks = []
+    windowTimes = []
+    initialMask = utils.binStrToInt(inp.initial_status)
+    counters = dpsolver.getInitialCounters(inp, tauUp, tauDown)
+    start = 0
+    while start < nPeriods:
+        windowStart = time.perf_counter()
+        end = min(start + windowLength, nPeriods)
+        windowMasks = solveWindow(getWindowInput(inp, start, end, initialMask, counters), solver, doMinUpMinDown, doCache,
+                                  relaxLastPeriod=end == nPeriods)
+        if windowMasks is None:
+            raise RuntimeError(f"The window [{start}, {end}) has no feasible schedule from the committed state")
+
+        # Commit the first periods (all of them in the last window) and carry the state to the next window
+        committed = windowMasks if end == nPeriods else windowMasks[:commitLength]
+        for mask in committed:
+            counters = dpsolver.nextCounters(counters[None, :], initialMask ^ mask, np.array([mask]),
+                                             tauUp, tauDown, nUnits)[0]
+            initialMask = mask
+        masks.extend(committed)
+        windowTimes.append(time.perf_counter() - windowStart)
+        print(f"Window [{start}, {end}): committed {len(committed)} periods in {windowTimes[-1]:.3f} s")
+        start += len(committed)
+
+    if doCache:
+        edcache.openCache(edcache.fleetKey(inp)).flush()
+    objective = getScheduleCost(inp, masks, doCache)
+    return RollingSolution(masks, objective, len(windowTimes), windowTimes, time.perf_counter() - startTime)
+
+
+def solveFullHorizon(inp=input, solver='dp', doMinUpMinDown=True, doCache=True):
+    # Solve the whole horizon at once (the reference of the rolling-horizon gap). Return (masks, objective, wall time)
+    startTime = time.perf_counter()
+    masks = solveWindow(copyInput(inp), solver, doMinUpMinDown, doCache)
+    if masks is None:
+        return None, None, time.perf_counter() - startTime
+    return masks, getScheduleCost(inp, masks, doCache), time.perf_counter() - startTime
+
+
+if "__main__" == __name__:
+    parser = argparse.ArgumentParser(description='Rolling-horizon solve of the UC problem')
+    parser.add_argument('--window', type=int, default=24, help='periods solved in each window')
+    parser.add_argument('--commit', type=int, default=12, help='periods committed from each window')
+    parser.add_argument('--days', type=int, default=1, help='repeat the demand of input this many times')
+    parser.add_argument('--solver', choices=['dp', 'highs'], default='dp')
+    parser.add_argument('--full', action='store_true', help='also solve the full horizon and report the gap')
+    args = parser.parse_args()
+
+    horizonInput = copyInput(input, nPeriodi=input.nPeriodi * args.days, D=list(input.D) * args.days)
+    cache = edcache.openCache(edcache.fleetKey(horizonInput))
+    hits, misses = cache.hits, cache.misses
+    rollingSolution = solveRollingHorizon(horizonInput, args.window, args.commit, args.solver)
+    print(f"Rolling horizon: {horizonInput.nPeriodi} periods in {rollingSolution.nWindows} windows, "
+          f"objective {rollingSolution.objective:.2f}, wall time {rollingSolution.wallTime:.3f} s")
+    print(f"ED cost cache: {cache.hits-hits} hits, {cache.misses-misses} misses")
+
+    if args.full:
+        fullMasks, fullObjective, fullTime = solveFullHorizon(horizonInput, args.solver)
+        if fullMasks is None:
+            print("The full horizon has no feasible schedule")
+        else:
+            gap = (rollingSolution.objective - fullObjective) / abs(fullObjective)
+            print(f"Full horizon: objective {fullObjective:.2f}, wall time {fullTime:.3f} s, rolling-horizon gap {100*gap:.3f}%")
@@ -0,0 +1,171 @@
+#This module contains the batch solve of many demand scenarios for the same fleet (e.g. for stochastic studies).
+# The work that only depends on the fleet is done once for the whole batch:
+#   - the commitment masks and the per-mask tables of Pmin, Pmax and startup costs (utils.getSumByMask, inherited by
+#     the worker processes), so every transition cost is a gather on the same table,
+#   - the validity of every (scenario, period, mask) in one broadcast,
+#   - the ED costs of all the distinct (mask, demand) pairs of all the scenarios in one vectorized call.
+# Then every scenario builds its network from the precomputed costs and is solved in a process pool,
+# with no module-level state (no input module, no UC_Model singleton).
+#
+# Usage: python scenarios.py --scenarios 100 --spread 0.1 [--workers N] [--csv results.csv]
+import argparse
+import concurrent.futures
+import csv
+import multiprocessing
+import time
+
+import numpy as np
+
+import dispatch
+import dpsolver
+import edcache
+import input
+import network
+import rolling
+import solvers
+import utils
+
+
+class BatchResult():
+    """
+    Results of a batch of scenarios
+
+    Attributes:
+        objectives: cost of each scenario (nan if the scenario has no feasible schedule)
+        schedules: commitment masks of each scenario (None if the scenario has no feasible schedule)
+        edTime: seconds spent on the validity and ED pass
+        wallTime: seconds spent on the whole batch
+    """
+
+    def __init__(self, objectives, schedules, edTime, wallTime):
+        self.objectives = objectives
+        self.schedules = schedules
+        self.edTime = edTime
+        self.wallTime = wallTime
+
+    @property
+    def throughput(self):
+        # scenarios per second
+        return len(self.objectives) / self.wallTime
+
+    def getTable(self, nUnits):
+        # One row per scenario: index, objective and the commitment of each period
+        return [[s, objective] + ([] if masks is None else [utils.intToBinStr(m, nUnits) for m in masks])
+                for s, (objective, masks) in enumerate(zip(self.objectives, self.schedules))]
+
+    def saveCSV(self, path, nUnits):
+        nPeriods = max((len(masks) for masks in self.schedules if masks is not None), default=0)
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['scenario', 'objective'] + [f'period {t}' for t in range(nPeriods)])
+            writer.writerows(self.getTable(nUnits))
+
+
+def generateScenarios(inp=input, nScenarios=100, spread=0.1, seed=0):
+    # Demand scenarios around inp.D: every demand is scaled by an independent factor in [1-spread, 1+spread]
+    rng = np.random.default_rng(seed)
+    return np.asarray(inp.D, dtype=np.float64)[None, :] * rng.uniform(1 - spread, 1 + spread, (nScenarios, inp.nPeriodi))
+
+
+def getScenarioNodeCosts(fleet, scenarios, doCache=False):
+    # ED costs of the nodes of the network of every scenario (valid masks of each period, by period then mask),
+    # from one vectorized ED call on the distinct (mask, demand) pairs of the whole batch
+    nScenarios, nPeriods = scenarios.shape
+    masks = np.arange(2**fleet.nUnita, dtype=np.int64)
+    isValid = utils.getValidMasksByPeriod(masks, fleet.Pmin, fleet.Pmax, scenarios.ravel())
+    rows, maskIdx = np.nonzero(isValid)
+    pairs = np.column_stack([masks[maskIdx].astype(np.float64), scenarios.ravel()[rows]])
+    uniquePairs, inverse = np.unique(pairs, axis=0, return_inverse=True)
+
+    edEngine = dispatch.EconomicDispatch.fromInput(fleet)
+    uniqueMasks, uniqueDemands = uniquePairs[:, 0].astype(np.int64), uniquePairs[:, 1]
+    if doCache:
+        cache = edcache.openCache(edcache.fleetKey(fleet))
+        uniqueCosts = cache.getCosts(uniqueMasks, uniqueDemands, edEngine.cost)
+        cache.flush()
+    else:
+        uniqueCosts = edEngine.cost(uniqueMasks, uniqueDemands)
+    costs = uniqueCosts[inverse.ravel()]
+
+    # the pairs are sorted by scenario, then period, then mask: split them by scenario
+    nodesPerScenario = isValid.reshape(nScenarios, -1).sum(axis=1)
+    return np.split(costs, np.cumsum(nodesPerScenario)[:-1])
+
+
+_fleet = None
+
+
+def _initWorker(fleet):
+    global _fleet
+    _fleet = fleet
+    # build the per-mask tables once per worker
+    for values in (fleet.Pmin, fleet.Pmax, fleet.startup_cost):
+        utils.getSumByMask(values)
+
+
+def _solveScenario(task):
+    # Solve one scenario in a worker: (demands, ED costs of its nodes, solver, doMinUpMinDown) -> (objective, masks)
+    demands, nodeCosts, solver, doMinUpMinDown = task
+    inp = rolling.copyInput(_fleet, nPeriodi=len(demands), D=list(demands))
+
+    def precomputedCosts(masks, demands):
+        assert len(masks) == len(nodeCosts)
+        return nodeCosts
+    net = network.UC_NetworkCSR.createModelFromInput(inp, costFunction=precomputedCosts)
+    tauUp = np.asarray(inp.min_switch_up, dtype=np.int64)
+    tauDown = np.asarray(inp.min_switch_down, dtype=np.int64)
+    if solver == 'dp':
+        solution = dpsolver.solveDP(net, tauUp, tauDown, doMinUpMinDown=doMinUpMinDown,
+                                    initialCounters=dpsolver.getInitialCounters(inp, tauUp, tauDown))
+        return (np.nan, None) if solution is None else (solution.objective, solution.masks)
+    if solver == 'highs':
+        if doMinUpMinDown:
+            net = net.pruneInfeasibleArcs(inp)
+        solution = solvers.ScipyMilpBackend(doMinUpMinDown=doMinUpMinDown, inp=inp).solve(net)
+        return (solution.objective, solution.getCommitmentMasks()) if solution.isSolved else (np.nan, None)
+    raise ValueError(f"Unknown solver {solver}")
+
+
+def solveScenarios(scenarios, fleet=input, solver='dp', doMinUpMinDown=True, nWorkers=None, doCache=False):
+    # Solve the fleet against every row of scenarios (nScenarios x nPeriods demands). Return a BatchResult
+    startTime = time.perf_counter()
+    scenarios = np.atleast_2d(np.asarray(scenarios, dtype=np.float64))
+    fleet = rolling.copyInput(fleet, nPeriodi=scenarios.shape[1], D=None)
+    nodeCosts = getScenarioNodeCosts(fleet, scenarios, doCache)
+    edTime = time.perf_counter() - startTime
+
+    tasks = [(demands, costs, solver, doMinUpMinDown) for demands, costs in zip(scenarios, nodeCosts)]
+    nWorkers = nWorkers or multiprocessing.cpu_count()
+    if nWorkers == 1:
+        _initWorker(fleet)
+        results = [_solveScenario(task) for task in tasks]
+    else:
+        chunkSize = max(1, len(tasks) // (4 * nWorkers))
+        with concurrent.futures.ProcessPoolExecutor(nWorkers, initializer=_initWorker, initargs=(fleet,)) as executor:
+            results = list(executor.map(_solveScenario, tasks, chunksize=chunkSize))
+
+    objectives = np.array([objective for (objective, _) in results], dtype=np.float64)
+    schedules = [masks for (_, masks) in results]
+    return BatchResult(objectives, schedules, edTime, time.perf_counter() - startTime)
+
+
+if "__main__" == __name__:
+    parser = argparse.ArgumentParser(description='Batch solve of demand scenarios for the fleet of input')
+    parser.add_argument('--scenarios', type=int, default=100)
+    parser.add_argument('--spread', type=float, default=0.1, help='relative spread of the demands around input.D')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=None, help='processes (default: one per core)')
+    parser.add_argument('--solver', choices=['dp', 'highs'], default='dp')
+    parser.add_argument('--csv', default=None, help='write the table of the results to this file')
+    args = parser.parse_args()
+
+    batchResult = solveScenarios(generateScenarios(input, args.scenarios, args.spread, args.seed), input, args.solver,
+                                 nWorkers=args.workers)
+    solved = ~np.isnan(batchResult.objectives)
+    for row in batchResult.getTable(input.nUnita)[:10]:
+        print(*row)
+    print(f"{solved.sum()}/{len(solved)} scenarios solved, mean objective {np.mean(batchResult.objectives[solved]):.2f}")
+    print(f"ED pass {batchResult.edTime:.3f} s, wall time {batchResult.wallTime:.3f} s, "
+          f"throughput {batchResult.throughput:.1f} scenarios/s")
+    if args.csv:
+        batchResult.saveCSV(args.csv, input.nUnita)
@@ -0,0 +1,311 @@
+#This module contains a resident solve service on a loopback HTTP port.
+# A run of main.py imports docplex, builds everything from the input module and ends in a blocking plot window.
+# The service is started once and then answers JSON requests with the schedule of a demand profile:
+#   - the state of every fleet seen so far stays in memory: the commitment masks (or the canonical masks of the
+#     interchangeable units, see symmetry), the per-mask tables of the transition costs (utils.getSumByMask) and
+#     an in-memory ED cost cache, so a warm request only solves the ED problems of demands never seen before,
+#   - the requests are solved by a pool of worker threads, which share these caches. The HTTP server answers
+#     every connection in its own thread, so a long solve does not block the others,
+#   - a request can be asynchronous: it returns a job id at once, the schedule is then read from /jobs/<id>,
+#   - docplex is never imported (the solvers are the DP and HiGHS), matplotlib only when a plot is requested.
+# The memory of the service is bounded: fleets above maxUnits are rejected, only the maxFleets fleets used last are
+# kept (and the per-mask tables of as many fleets, see utils.setSumTableCacheSize), the ED cost cache of a fleet keeps
+# at most edCacheMaxEntries costs, and the finished asynchronous jobs are dropped after JOB_TTL seconds (and above
+# MAX_JOBS jobs).
+# The plots are written in a directory of the service, with names it chooses: a request can not write anywhere else.
+#
+# Usage: python service.py [--port 8765] [--workers 4] [--max-units 16] [--plot-dir DIR]
+#   POST /solve     {"D": [...], "fleet": {"Pmin": [...], ...}, "solver": "dp", "minUpMinDown": true,
+#                    "symmetry": false, "plot": true, "async": false}
+#                   fleet overrides the parameters of the input module (all of them are optional),
+#                   with plot the response has the path of the plot of the solution in the plot directory
+#   GET  /jobs/<id> status and result of an asynchronous request
+#   GET  /stats     fleets in memory, ED cost cache statistics, requests served
+#   GET  /health
+import argparse
+import concurrent.futures
+import collections
+import http.server
+import itertools
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+
+import numpy as np
+
+import dispatch
+import dpsolver
+import edcache
+import input
+import network
+import rolling
+import solvers
+import symmetry
+import utils
+
+DEFAULT_PORT = 8765
+DEFAULT_WORKERS = 4
+DEFAULT_MAX_UNITS = utils.SUM_TABLE_MAX_UNITS  # every fleet enumerates its 2^nUnits masks
+DEFAULT_MAX_FLEETS = 8
+DEFAULT_ED_CACHE_MAX_ENTRIES = 50000  # ED costs kept in memory per fleet
+JOB_TTL = 3600  # seconds a finished job is kept
+MAX_JOBS = 1000
+FLEET_ATTRIBUTES = ('nUnita', 'c1', 'c2', 'c3', 'Pmin', 'Pmax', 'startup_cost', 'min_switch_up', 'min_switch_down',
+                    'initial_status', 'initial_status_periods')
+
+
+class FleetState():
+    """
+    What the service keeps in memory for a fleet
+
+    Attributes:
+        fleet: parameters of the fleet (see rolling.copyInput), without demands
+        masks: commitment masks of the nodes (the canonical ones if the units are aggregated)
+        groups: groups of interchangeable units (empty if the units are not aggregated)
+        cache: in-memory ED cost cache of the fleet (at most edCacheMaxEntries costs)
+        nRequests: number of requests solved for this fleet
+    """
+
+    def __init__(self, fleet, doMinUpMinDown=True, doSymmetry=False, edCacheMaxEntries=DEFAULT_ED_CACHE_MAX_ENTRIES):
+        self.fleet = fleet
+        if doSymmetry:
+            self.masks, self.groups = symmetry.getSymmetryMasks(fleet, doMinUpMinDown)
+        else:
+            self.masks, self.groups = np.arange(2**fleet.nUnita, dtype=np.int64), []
+        self.cache = edcache.EDCostCache(edcache.fleetKey(fleet), path=None, maxEntries=edCacheMaxEntries)
+        self.nRequests = 0
+        self._edEngine = dispatch.EconomicDispatch.fromInput(fleet)
+        self._lock = threading.Lock()
+        # build the per-mask tables of the transition costs once
+        for values in (fleet.Pmin, fleet.Pmax, fleet.startup_cost):
+            utils.getSumByMask(values)
+
+    def getCosts(self, masks, demands):
+        # ED costs through the cache of the fleet (shared by the worker threads). The lock only guards the cache:
+        # the ED problems of the missing pairs are solved outside of it, so the requests solve them concurrently
+        with self._lock:
+            costs, missing = self.cache.getCachedCosts(masks, demands)
+        if missing:
+            keys = list(missing)
+            solvedCosts = self._edEngine.cost([m for (m, _) in keys], [d for (_, d) in keys])
+            with self._lock:
+                self.cache.storeMissing(costs, missing, solvedCosts)
+        return costs
+
+
+class SolveService():
+    """
+    Solve requests on the fleets kept in memory, in a pool of worker threads
+
+    Attributes:
+        fleets: FleetState of the (fleet, options) used last, least recently used first
+        jobs: (future, submit time) of the asynchronous requests, by job id
+        nRequests: number of requests served
+        maxUnits: largest fleet accepted
+        maxFleets: number of fleets kept in memory
+        edCacheMaxEntries: ED costs kept in memory per fleet
+        plotDir: directory of the plots
+    """
+
+    def __init__(self, nWorkers=DEFAULT_WORKERS, maxUnits=DEFAULT_MAX_UNITS, maxFleets=DEFAULT_MAX_FLEETS, plotDir=None,
+                 edCacheMaxEntries=DEFAULT_ED_CACHE_MAX_ENTRIES):
+        self.fleets = collections.OrderedDict()
+        self.jobs = {}
+        self.nRequests = 0
+        self.maxUnits = maxUnits
+        self.maxFleets = maxFleets
+        self.edCacheMaxEntries = edCacheMaxEntries
+        # the per-mask tables (Pmin, Pmax and startup costs) of the fleets kept, the evicted ones go out with them
+        utils.setSumTableCacheSize(3 * maxFleets)
+        self.plotDir = tempfile.mkdtemp(prefix='uc-service-plots-') if plotDir is None else plotDir
+        os.makedirs(self.plotDir, exist_ok=True)
+        self._executor = concurrent.futures.ThreadPoolExecutor(nWorkers)
+        self._lock = threading.Lock()
+        self._jobIds = itertools.count(1)
+
+    def getFleetState(self, fleetParams, doMinUpMinDown, doSymmetry):
+        fleet = rolling.copyInput(input, nPeriodi=None, D=None, **fleetParams)
+        if not 1 <= fleet.nUnita <= self.maxUnits:
+            raise ValueError(f"nUnita must be between 1 and {self.maxUnits}")
+        for name in FLEET_ATTRIBUTES[1:]:
+            value = getattr(fleet, name)
+            if value is not None and len(value) != fleet.nUnita:
+                raise ValueError(f"{name} must have one value per unit ({fleet.nUnita})")
+        key = (repr([getattr(fleet, name) for name in FLEET_ATTRIBUTES]), doMinUpMinDown, doSymmetry)
+        with self._lock:
+            if key in self.fleets:
+                self.fleets.move_to_end(key)
+                return self.fleets[key]
+        # a new fleet is built outside of the lock, so it does not block the requests on the other fleets
+        # (two requests on the same new fleet may both build it, the first one stored is kept)
+        fleetState = FleetState(fleet, doMinUpMinDown, doSymmetry, self.edCacheMaxEntries)
+        with self._lock:
+            fleetState = self.fleets.setdefault(key, fleetState)
+            self.fleets.move_to_end(key)
+            while len(self.fleets) > self.maxFleets:
+                self.fleets.popitem(last=False)
+            return fleetState
+
+    def solve(self, request):
+        # Solve a request (dict) and return the response (dict)
+        start = time.perf_counter()
+        unknown = set(request.get('fleet', {})) - set(FLEET_ATTRIBUTES)
+        if unknown:
+            raise ValueError(f"Unknown fleet parameters {sorted(unknown)}")
+        doMinUpMinDown = bool(request.get('minUpMinDown', True))
+        fleetState = self.getFleetState(request.get('fleet', {}), doMinUpMinDown, bool(request.get('symmetry', False)))
+        D = [float(d) for d in request['D']]
+        inp = rolling.copyInput(fleetState.fleet, nPeriodi=len(D), D=D)
+
+        net = network.UC_NetworkCSR.createModelFromInput(inp, masks=fleetState.masks, costFunction=fleetState.getCosts)
+        networkTime = time.perf_counter() - start
+
+        net, masks, selectedArcs = solveNetwork(net, inp, request.get('solver', 'dp'), doMinUpMinDown)
+        with self._lock:
+            self.nRequests += 1
+            fleetState.nRequests += 1
+        response = {'status': 'infeasible' if masks is None else 'optimal', 'objective': None}
+        if masks is not None:
+            schedule = solvers.getSchedule(masks, inp)
+            response.update({'objective': schedule.totalCost, 'masks': [int(m) for m in masks],
+                             'commitment': [utils.intToBinStr(m, inp.nUnita) for m in masks],
+                             'dispatch': schedule.dispatch.tolist(), 'edCosts': schedule.edCosts.tolist(),
+                             'startupCosts': schedule.startupCosts.tolist()})
+            if request.get('plot'):
+                modelSolution = solvers.UC_Solution(request.get('solver', 'dp'), 'optimal', schedule.totalCost,
+                                                    selectedArcs=selectedArcs)
+                plotPath = os.path.join(self.plotDir, f"plot-{uuid.uuid4().hex}.png")
+                utils.plotNetworkWithSolution(net, modelSolution, savePath=plotPath)
+                response['plot'] = plotPath
+        response['timings'] = {'network': networkTime, 'total': time.perf_counter() - start}
+        return response
+
+    def solveInPool(self, request):
+        # Solve a request in the pool and wait for the response
+        return self._executor.submit(self.solve, request).result()
+
+    def submit(self, request):
+        # Solve a request in the pool, return its job id
+        jobId = str(next(self._jobIds))
+        with self._lock:
+            self.evictJobs()
+            self.jobs[jobId] = (self._executor.submit(self.solve, request), time.monotonic())
+        return jobId
+
+    def evictJobs(self):
+        # Drop the finished jobs older than JOB_TTL, then the oldest finished ones above MAX_JOBS (called with the lock)
+        now = time.monotonic()
+        finished = [jobId for jobId, (future, submitted) in self.jobs.items() if future.done()]
+        for jobId in finished:
+            if now - self.jobs[jobId][1] > JOB_TTL or len(self.jobs) > MAX_JOBS:
+                del self.jobs[jobId]
+
+    def getJob(self, jobId):
+        # Status of a job (None if the job is unknown or was dropped)
+        job = self.jobs.get(jobId)
+        if job is None:
+            return None
+        future = job[0]
+        if not future.done():
+            return {'job': jobId, 'status': 'running'}
+        if future.exception() is not None:
+            return {'job': jobId, 'status': 'error', 'error': str(future.exception())}
+        return {'job': jobId, 'status': 'done', 'result': future.result()}
+
+    def getStats(self):
+        return {'requests': self.nRequests, 'jobs': len(self.jobs),
+                'fleets': [{'units': state.fleet.nUnita, 'states': len(state.masks), 'requests': state.nRequests,
+                            'edCacheEntries': len(state.cache), 'edCacheHits': state.cache.hits,
+                            'edCacheMisses': state.cache.misses} for state in self.fleets.values()]}
+
+
+def solveNetwork(net, inp, solver, doMinUpMinDown):
+    # Return (network solved, commitment masks, selected arc ids) of the optimal path of net (masks and arcs are None
+    # if there is no path). The DP enforces min up/down on its own: it solves the network that is not pruned, because
+    # pruning the arcs takes longer than the DP itself
+    if solver == 'dp':
+        tauUp = np.asarray(inp.min_switch_up, dtype=np.int64)
+        tauDown = np.asarray(inp.min_switch_down, dtype=np.int64)
+        solution = dpsolver.solveDP(net, tauUp, tauDown, doMinUpMinDown=doMinUpMinDown,
+                                    initialCounters=dpsolver.getInitialCounters(inp, tauUp, tauDown))
+        if solution is None:
+            return net, None, None
+        nodeIds = [(int(net.nodeMask[k]), int(net.nodePeriod[k])) for k in solution.nodePath]
+        return net, solution.masks, list(zip(nodeIds[:-1], nodeIds[1:]))
+    if solver == 'highs':
+        if doMinUpMinDown:
+            net = net.pruneInfeasibleArcs(inp)
+        solution = solvers.ScipyMilpBackend(doMinUpMinDown=doMinUpMinDown, inp=inp).solve(net)
+        return (net, solution.getCommitmentMasks(), solution.selectedArcs) if solution.isSolved else (net, None, None)
+    raise ValueError(f"Unknown solver {solver}")
+
+
+class ServiceRequestHandler(http.server.BaseHTTPRequestHandler):
+    # JSON over HTTP: the service is the attribute service of the server
+    def sendJSON(self, code, body):
+        data = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        service = self.server.service
+        job = service.getJob(self.path[len('/jobs/'):]) if self.path.startswith('/jobs/') else None
+        if self.path == '/health':
+            self.sendJSON(200, {'status': 'ok'})
+        elif self.path == '/stats':
+            self.sendJSON(200, service.getStats())
+        elif job is not None:
+            self.sendJSON(200, job)
+        else:
+            self.sendJSON(404, {'error': f"Unknown path {self.path}"})
+
+    def do_POST(self):
+        service = self.server.service
+        if self.path != '/solve':
+            self.sendJSON(404, {'error': f"Unknown path {self.path}"})
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            if 'D' not in request:
+                raise ValueError("The request has no demands D")
+            if request.get('async', False):
+                self.sendJSON(202, {'job': service.submit(request), 'status': 'running'})
+            else:
+                self.sendJSON(200, service.solveInPool(request))
+        except (ValueError, KeyError, TypeError) as e:
+            self.sendJSON(400, {'error': str(e)})
+        except Exception as e:
+            self.sendJSON(500, {'error': repr(e)})
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port=DEFAULT_PORT, nWorkers=DEFAULT_WORKERS, host='127.0.0.1', maxUnits=DEFAULT_MAX_UNITS, plotDir=None):
+    # Run the service until interrupted. It listens on the loopback interface only
+    server = http.server.ThreadingHTTPServer((host, port), ServiceRequestHandler)
+    server.service = SolveService(nWorkers, maxUnits, plotDir=plotDir)
+    print(f"Solve service listening on http://{host}:{server.server_address[1]} with {nWorkers} workers, "
+          f"plots in {server.service.plotDir}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if "__main__" == __name__:
+    parser = argparse.ArgumentParser(description='Resident UC solve service on a loopback HTTP port')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='worker threads solving the requests')
+    parser.add_argument('--max-units', type=int, default=DEFAULT_MAX_UNITS, help='largest fleet accepted')
+    parser.add_argument('--plot-dir', default=None, help='directory of the plots (default: a new temporary directory)')
+    args = parser.parse_args()
+    serve(args.port, args.workers, maxUnits=args.max_units, plotDir=args.plot_dir)
@@ -0,0 +1,281 @@
+#This module contains the MILP solver backends of the UC network model and the solution they return.
+# Every backend takes a network (main.UC_Network or network.UC_NetworkCSR) and returns a UC_Solution:
+#   main.CplexBackend: the docplex model of main.UC_Model, solved with CPLEX,
+#   ScipyMilpBackend: the same model assembled directly as scipy.sparse matrices and solved with
+#                     scipy.optimize.milp (HiGHS), without building one Python object per expression.
+# The min up/down constraints of ScipyMilpBackend are the aggregated ones of
+# UC_Model.addAggregatedMinUpMinDownConstraints (one row per unit and period, same optimal solutions as the indicators).
+# UC_Solution.getSchedule gives the commitment, the ED dispatch and the cost breakdown of a solution as arrays.
+import abc
+import time
+
+import numpy as np
+import scipy.optimize
+import scipy.sparse
+
+import dispatch
+import dpsolver
+import input
+import instrument
+import utils
+
+
+class UC_Solution():
+    """
+    Solution of the UC network model, the same for every backend
+
+    Attributes:
+        backend: name of the backend that produced the solution
+        status: 'optimal', 'feasible' or 'limit' (limit reached with/without a solution), 'infeasible', 'unbounded' or 'error'
+        objective: total cost (None if no solution was found)
+        flows: flow of each arc of the network, in the order of myNet.arcs (None if no solution was found)
+        selectedArcs: ids ((mask1, t1), (mask2, t2)) of the arcs with flow 1, from the source to the sink
+        solveTime: seconds spent in the solver
+    """
+
+    def __init__(self, backend, status, objective=None, flows=None, selectedArcs=(), solveTime=0.0):
+        self.backend = backend
+        self.status = status
+        self.objective = objective
+        self.flows = flows
+        self.selectedArcs = sorted(selectedArcs, key=lambda arcId: arcId[0][1])
+        self.solveTime = solveTime
+
+    @property
+    def isSolved(self):
+        return self.objective is not None
+
+    def getCommitmentMasks(self):
+        # Commitment mask of each period 0..nPeriodi-1 (the heads of the selected arcs, but the sink)
+        return [arcId[1][0] for arcId in self.selectedArcs[:-1]]
+
+    def getSchedule(self, inp=input):
+        # The CommitmentSchedule of the solution (None if no solution was found)
+        return getSchedule(self.getCommitmentMasks(), inp) if self.isSolved else None
+
+    def display(self, nUnits=None):
+        nUnits = input.nUnita if nUnits is None else nUnits
+        print(f"Solution of the {self.backend} backend: {self.status}, objective {self.objective}")
+        for t, mask in enumerate(self.getCommitmentMasks()):
+            print(f"Period {t}: {utils.intToBinStr(mask, nUnits)}")
+
+
+class CommitmentSchedule():
+    """
+    Commitment schedule with the ED dispatch and the cost breakdown of each period
+
+    Attributes:
+        masks: commitment mask of each period
+        commitment: (nPeriods, nUnits) array, 1 if the unit is on
+        dispatch: (nPeriods, nUnits) array of the power of each unit
+        edCosts: ED cost of each period
+        startupCosts: startup costs paid at each period (from initial_status at period 0)
+    """
+
+    def __init__(self, masks, commitment, dispatch, edCosts, startupCosts):
+        self.masks = masks
+        self.commitment = commitment
+        self.dispatch = dispatch
+        self.edCosts = edCosts
+        self.startupCosts = startupCosts
+
+    @property
+    def totalCost(self):
+        return float(self.edCosts.sum() + self.startupCosts.sum())
+
+
+def getSchedule(masks, inp=input):
+    # CommitmentSchedule of the commitment masks of each period (e.g. UC_Solution.getCommitmentMasks or DPSolution.masks)
+    masks = np.asarray(masks, dtype=np.int64)
+    P, edCosts = dispatch.EconomicDispatch.fromInput(inp).dispatch(masks, np.asarray(inp.D, dtype=np.float64)[:len(masks)])
+    fromMasks = np.concatenate([[utils.binStrToInt(inp.initial_status)], masks[:-1]]).astype(np.int64)
+    startupCosts = utils.getTransitionCosts(fromMasks, masks, inp.startup_cost)
+    return CommitmentSchedule(masks, utils.masksToUnitsMatrix(masks, inp.nUnita).astype(np.int64), P, edCosts, startupCosts)
+
+
+class SolverBackend(abc.ABC):
+    # Interface of the solver backends: buildModel(myNet) builds the model of the network, solve(myNet) builds it
+    # (if it is not built yet) and returns a UC_Solution
+    name = None
+
+    @abc.abstractmethod
+    def buildModel(self, myNet):
+        pass
+
+    @abc.abstractmethod
+    def solve(self, myNet):
+        pass
+
+
+def getNetworkArrays(myNet):
+    # Return (nodeMask, nodePeriod, arcFrom, arcTo, arcCost) of a network. The arcs are in the order of myNet.arcs,
+    # the node indexes are the positions in myNet.nodes
+    if hasattr(myNet, 'arcPtr'):
+        return myNet.nodeMask, myNet.nodePeriod, myNet.arcFrom, myNet.arcTo, myNet.arcCost
+    nodeIndex = {n.id: k for k, n in enumerate(myNet.nodes)}
+    nodeMask = np.array([n.id[0] for n in myNet.nodes], dtype=np.int64)
+    nodePeriod = np.array([n.id[1] for n in myNet.nodes], dtype=np.int32)
+    arcFrom = np.array([nodeIndex[a._n1.id] for a in myNet.arcs], dtype=np.int64)
+    arcTo = np.array([nodeIndex[a._n2.id] for a in myNet.arcs], dtype=np.int64)
+    arcCost = np.array([a.cost for a in myNet.arcs], dtype=np.float64)
+    return nodeMask, nodePeriod, arcFrom, arcTo, arcCost
+
+
+def getFlowConservationMatrix(nNodes, arcFrom, arcTo):
+    # Node-arc incidence matrix: +1 on the tail node, -1 on the head node of each arc
+    nArcs = len(arcFrom)
+    rows = np.concatenate([arcFrom, arcTo])
+    cols = np.concatenate([np.arange(nArcs), np.arange(nArcs)])
+    values = np.concatenate([np.ones(nArcs), -np.ones(nArcs)])
+    return scipy.sparse.csr_matrix((values, (rows, cols)), shape=(nNodes, nArcs))
+
+
+def getMinUpMinDownMatrix(nodeMask, nodePeriod, arcFrom, arcTo, nUnits, nPeriods, tauUp, tauDown, initialCounters,
+                          initialMask, relaxLastPeriod=True):
+    # Return (A, lb, ub) of the aggregated min up/down constraints lb <= A x <= ub. For each unit i and period t < nPeriods-1
+    # (t < nPeriods if not relaxLastPeriod):
+    #   sum_{s=t-tauUp[i]+1..t} yOn[i,s] - uOn[i,t] <= 0
+    #   sum_{s=t-tauDown[i]+1..t} yOff[i,s] + uOn[i,t] <= 1
+    # (only the rows with some switching arc) and the rows fixing the initial status of the units with a short history.
+    # uOn[i,t] are the arcs into period t with the unit on, yOn/yOff the arcs into period t switching it on/off.
+    internal = np.flatnonzero(nodePeriod[arcTo] < nPeriods)
+    headPeriod = nodePeriod[arcTo[internal]].astype(np.int64)
+    fromOn = utils.masksToUnitsMatrix(nodeMask[arcFrom[internal]], nUnits) > 0
+    toOn = utils.masksToUnitsMatrix(nodeMask[arcTo[internal]], nUnits) > 0
+    nRowPeriods = nPeriods - 1 if relaxLastPeriod else nPeriods
+
+    rows, cols, values, lb, ub = [], [], [], [], []
+    nRows = 0
+
+    def addWindowRows(switching, unitOn, tau, onSign, upperBound):
+        # one row per period t < nPeriods-1: the switching arcs of the window ending at t, onSign * uOn[i,t]
+        nonlocal nRows
+        rowSwitch, colSwitch = [], []
+        for d in range(tau):
+            rowPeriod = headPeriod[switching] + d
+            inRange = rowPeriod < nRowPeriods
+            rowSwitch.append(rowPeriod[inRange])
+            colSwitch.append(internal[switching][inRange])
+        rowSwitch, colSwitch = np.concatenate(rowSwitch), np.concatenate(colSwitch)
+        onArcs = np.flatnonzero(unitOn & (headPeriod < nRowPeriods))
+        rowOn, colOn = headPeriod[onArcs], internal[onArcs]
+        # keep only the periods with some switching arc in the window
+        hasSwitch = np.zeros(nRowPeriods, dtype=bool)
+        hasSwitch[rowSwitch] = True
+        newRow = np.cumsum(hasSwitch) - 1 + nRows
+        keepOn = hasSwitch[rowOn]
+        rows.extend([newRow[rowSwitch], newRow[rowOn[keepOn]]])
+        cols.extend([colSwitch, colOn[keepOn]])
+        values.extend([np.ones(len(colSwitch)), np.full(keepOn.sum(), float(onSign))])
+        nNew = int(hasSwitch.sum())
+        lb.append(np.full(nNew, -np.inf))
+        ub.append(np.full(nNew, float(upperBound)))
+        nRows += nNew
+
+    for i in range(nUnits):
+        if tauUp[i] > 1:
+            addWindowRows(toOn[:, i] & ~fromOn[:, i], toOn[:, i], tauUp[i], -1, 0)
+        if tauDown[i] > 1:
+            addWindowRows(fromOn[:, i] & ~toOn[:, i], toOn[:, i], tauDown[i], +1, 1)
+
+    # Initial status: a unit with a short history keeps its status in the first periods (the last period is not constrained if relaxLastPeriod)
+    for i in range(nUnits):
+        isOn = bool(initialMask & utils.unitBit(i, nUnits))
+        tau = tauUp[i] if isOn else tauDown[i]
+        for t in range(min(tau - initialCounters[i], nRowPeriods)):
+            onArcs = internal[toOn[:, i] & (headPeriod == t)]
+            rows.append(np.full(len(onArcs), nRows))
+            cols.append(onArcs)
+            values.append(np.ones(len(onArcs)))
+            lb.append(np.array([1.0 if isOn else -np.inf]))
+            ub.append(np.array([np.inf if isOn else 0.0]))
+            nRows += 1
+
+    if nRows == 0:
+        return None
+    A = scipy.sparse.csr_matrix((np.concatenate(values), (np.concatenate(rows), np.concatenate(cols))),
+                                shape=(nRows, len(arcFrom)))
+    return A, np.concatenate(lb), np.concatenate(ub)
+
+
+class ScipyMilpBackend(SolverBackend):
+    """
+    UC network model as sparse matrices, solved with scipy.optimize.milp (HiGHS)
+
+    Attributes:
+        doMinUpMinDown: add the min up/down constraints
+        relaxLastPeriod: never forbid a switch into the last period (as UC_Model does)
+        timeLimit: time limit in seconds (None: no limit)
+        mipRelGap: relative MIP gap (None: HiGHS default)
+    """
+    name = 'highs'
+
+    def __init__(self, doMinUpMinDown=True, timeLimit=None, mipRelGap=None, inp=input, relaxLastPeriod=True):
+        self.doMinUpMinDown = doMinUpMinDown
+        self.relaxLastPeriod = relaxLastPeriod
+        self.timeLimit = timeLimit
+        self.mipRelGap = mipRelGap
+        self.inp = inp
+        self._net = None
+        self._problem = None
+
+    def buildModel(self, myNet):
+        with instrument.phase('model'):
+            self._buildModel(myNet)
+
+    def _buildModel(self, myNet):
+        inp = self.inp
+        nodeMask, nodePeriod, arcFrom, arcTo, arcCost = getNetworkArrays(myNet)
+        nodeMask = np.asarray(nodeMask, dtype=np.int64)
+        nodePeriod = np.asarray(nodePeriod)
+        arcFrom = np.asarray(arcFrom, dtype=np.int64)
+        arcTo = np.asarray(arcTo, dtype=np.int64)
+
+        # Flow conservation: one unit of flow from the source to the sink
+        b = np.where(nodePeriod == -1, 1.0, np.where(nodePeriod == inp.nPeriodi, -1.0, 0.0))
+        constraints = [scipy.optimize.LinearConstraint(getFlowConservationMatrix(len(nodeMask), arcFrom, arcTo), b, b)]
+
+        # Unit commitment constraints
+        if self.doMinUpMinDown:
+            tauUp = np.asarray(inp.min_switch_up, dtype=np.int64)
+            tauDown = np.asarray(inp.min_switch_down, dtype=np.int64)
+            minUpMinDown = getMinUpMinDownMatrix(nodeMask, nodePeriod, arcFrom, arcTo, inp.nUnita, inp.nPeriodi,
+                                                 tauUp, tauDown, dpsolver.getInitialCounters(inp, tauUp, tauDown),
+                                                 utils.binStrToInt(inp.initial_status), self.relaxLastPeriod)
+            if minUpMinDown is not None:
+                constraints.append(scipy.optimize.LinearConstraint(*minUpMinDown))
+
+        self._net = myNet
+        self._problem = (nodeMask, nodePeriod, arcFrom, arcTo, np.asarray(arcCost, dtype=np.float64), constraints)
+        nConstraints = sum(c.A.shape[0] for c in constraints)
+        instrument.count('variables', len(arcFrom))
+        instrument.count('constraints', nConstraints)
+        print(f"Sparse model with {len(arcFrom)} variables and {nConstraints} constraints")
+
+    def solve(self, myNet):
+        if self._net is not myNet:
+            self.buildModel(myNet)
+        nodeMask, nodePeriod, arcFrom, arcTo, arcCost, constraints = self._problem
+        if len(arcCost) == 0:
+            # e.g. a pruned network with no feasible path
+            return UC_Solution(self.name, 'infeasible')
+        options = {}
+        if self.timeLimit is not None:
+            options['time_limit'] = self.timeLimit
+        if self.mipRelGap is not None:
+            options['mip_rel_gap'] = self.mipRelGap
+
+        start = time.perf_counter()
+        with instrument.phase('solve'):
+            result = scipy.optimize.milp(arcCost, constraints=constraints, integrality=np.ones(len(arcCost)),
+                                         bounds=scipy.optimize.Bounds(0, 1), options=options)
+        solveTime = time.perf_counter() - start
+
+        # status 1: time (or iteration) limit reached, with or without a feasible solution
+        status = {0: 'optimal', 1: 'feasible', 2: 'infeasible', 3: 'unbounded'}.get(result.status, 'error')
+        if result.x is None:
+            return UC_Solution(self.name, {'optimal': 'error', 'feasible': 'limit'}.get(status, status), solveTime=solveTime)
+        flows = np.round(result.x)
+        selectedArcs = [((int(nodeMask[arcFrom[a]]), int(nodePeriod[arcFrom[a]])), (int(nodeMask[arcTo[a]]), int(nodePeriod[arcTo[a]])))
+                        for a in np.flatnonzero(flows > 0.5)]
+        return UC_Solution(self.name, status, float(result.fun), flows, selectedArcs, solveTime)
@@ -0,0 +1,122 @@
+#This module contains the aggregation of the interchangeable units of a fleet.
+# Units with the same Pmin, Pmax and startup cost, no min up/down time (1 period at most, or min up/down not
+# enforced) and cost curves that are ordered on [Pmin, Pmax] are interchangeable: for any schedule, committing the
+# cheapest k units of the group instead of any other k costs no more ED cost and no more startups (the startups of
+# a group are at least the increases of its count of units on). So only the commitment count 0..k of the group
+# matters, and it is represented by the canonical mask where the first k units of the group (cheapest first) are on.
+# The canonical masks are the nodes of the network (UC_NetworkCSR.createModelFromInput(masks=...)): the ED and
+# transition costs of a canonical mask are the costs of its count, and a solution is already a per-unit schedule.
+# A fleet with groups of sizes k_g has prod(k_g + 1) * 2^(units not in a group) states instead of 2^nUnits.
+#
+# rtol also groups near-identical units (parameters and cost curves equal up to a relative tolerance): the network
+# then only has the canonical masks, so the schedule found may be suboptimal, but its cost is still exact.
+#
+# Usage: python symmetry.py [--rtol 0.01]
+import argparse
+
+import numpy as np
+
+import input
+import utils
+
+
+def getCostAt(inp, i, p):
+    return inp.c1[i] + inp.c2[i] * p + inp.c3[i] * p**2
+
+
+def isCheaper(inp, i, j, rtol=0.0):
+    # True if the cost curve of the unit i is below the one of the unit j on [Pmin, Pmax] (up to rtol).
+    # The difference of the curves is a parabola: it is checked at the bounds and at its vertex.
+    lo, hi = inp.Pmin[i], inp.Pmax[i]
+    points = [lo, hi]
+    dc3 = inp.c3[i] - inp.c3[j]
+    if dc3 != 0:
+        vertex = -(inp.c2[i] - inp.c2[j]) / (2 * dc3)
+        if lo < vertex < hi:
+            points.append(vertex)
+    return all(getCostAt(inp, i, p) <= getCostAt(inp, j, p) + rtol * abs(getCostAt(inp, j, p)) + 1e-9 for p in points)
+
+
+def findUnitGroups(inp=input, doMinUpMinDown=True, rtol=0.0):
+    # Return the groups of interchangeable units (lists of unit indexes, cheapest first, at least 2 units each)
+    initialMask = utils.binStrToInt(inp.initial_status)
+
+    def isFree(i):
+        return not doMinUpMinDown or (inp.min_switch_up[i] <= 1 and inp.min_switch_down[i] <= 1)
+
+    def isClose(a, b):
+        return np.isclose(a, b, rtol=rtol, atol=0)
+
+    candidates = [i for i in range(inp.nUnita) if isFree(i)]
+    groups = []
+    while candidates:
+        first = candidates[0]
+        similar = [i for i in candidates if isClose(inp.Pmin[i], inp.Pmin[first]) and isClose(inp.Pmax[i], inp.Pmax[first])
+                   and isClose(inp.startup_cost[i], inp.startup_cost[first])]
+        candidates = [i for i in candidates if i not in similar]
+        similar.sort(key=lambda i: getCostAt(inp, i, (inp.Pmin[i] + inp.Pmax[i]) / 2))
+        # cut the group where the cost curves are not ordered
+        group = [similar[0]]
+        for i in similar[1:]:
+            if isCheaper(inp, group[-1], i, rtol):
+                group.append(i)
+                continue
+            groups.append(group)
+            group = [i]
+        groups.append(group)
+
+    # the initial commitment of a group must be canonical too (its units on are the first ones)
+    canonicalGroups = []
+    for group in groups:
+        isOn = [bool(initialMask & utils.unitBit(i, inp.nUnita)) for i in group]
+        if len(group) > 1 and isOn == sorted(isOn, reverse=True):
+            canonicalGroups.append(group)
+    return canonicalGroups
+
+
+def getCanonicalMasks(nUnits, groups):
+    # Sorted masks where the units on in every group are the first ones of the group. They are built from the
+    # counts of the groups (prod(k_g + 1) choices) and the states of the units not in a group, without the 2^nUnits masks
+    choices = []
+    for group in groups:
+        bits = np.cumsum([0] + [utils.unitBit(i, nUnits) for i in group])  # the first k units of the group on
+        choices.append(bits)
+    grouped = {i for group in groups for i in group}
+    choices.extend(np.array([0, utils.unitBit(i, nUnits)]) for i in range(nUnits) if i not in grouped)
+    masks = np.zeros(1, dtype=np.int64)
+    for values in choices:
+        masks = (masks[:, None] + np.asarray(values, dtype=np.int64)[None, :]).ravel()
+    return np.sort(masks)
+
+
+def getGroupCounts(masks, nUnits, groups):
+    # Number of units on in every group for each mask: (len(masks), len(groups)) array
+    units = utils.masksToUnitsMatrix(np.asarray(masks, dtype=np.int64), nUnits).astype(np.int64)
+    return np.column_stack([units[:, group].sum(axis=1) for group in groups]) if groups else np.zeros((len(units), 0), dtype=np.int64)
+
+
+def getSymmetryMasks(inp=input, doMinUpMinDown=True, rtol=0.0):
+    # The masks of the aggregated network of inp (all the masks if no unit is interchangeable) and the groups
+    groups = findUnitGroups(inp, doMinUpMinDown, rtol)
+    masks = getCanonicalMasks(inp.nUnita, groups)
+    print(f"Groups of interchangeable units: {[[i + 1 for i in group] for group in groups]}, "
+          f"{len(masks)} states instead of {2**inp.nUnita}")
+    return masks, groups
+
+
+if "__main__" == __name__:
+    import dpsolver
+    import network
+
+    parser = argparse.ArgumentParser(description='Solve the UC problem of input with and without the aggregation of the interchangeable units')
+    parser.add_argument('--rtol', type=float, default=0.0, help='relative tolerance of the near-identical units')
+    args = parser.parse_args()
+
+    masks, groups = getSymmetryMasks(input, rtol=args.rtol)
+    for name, netMasks in (('full', None), ('aggregated', masks)):
+        net = network.UC_NetworkCSR.createModelFromInput(masks=netMasks, doCache=False).pruneInfeasibleArcs()
+        solution = dpsolver.solveDP(net)
+        print(f"{name}: {net.nNodes} nodes, {net.nArcs} arcs, objective {solution.objective if solution else None}")
+    for t, (commitment, counts) in enumerate(zip(solution.getCommitmentStrings(input.nUnita),
+                                                 getGroupCounts(solution.masks, input.nUnita, groups))):
+        print(f"Period {t}: {commitment} (units on in each group: {counts.tolist()})")
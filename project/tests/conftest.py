@@ -0,0 +1,110 @@
+# Shared fixtures and helpers of the tests: the two cases of input.py (5 units x 10 periods, and the 10 units x 24
+# periods of DO_HUGE_SIZE_PROBLEM) as namespaces, their exact solutions (full network solved by the DP with min
+# up/down), and the DP solve and the min up/down check the tests compare their results with.
+import os
+import sys
+import types
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import beam
+import dpsolver
+import input
+import netcache
+import network
+import rolling
+import utils
+
+
+def _loadCase(doHugeSizeProblem):
+    # Run input.py with DO_HUGE_SIZE_PROBLEM set, and copy its parameters
+    with open(input.__file__) as f:
+        source = f.read().replace('DO_HUGE_SIZE_PROBLEM=False', f'DO_HUGE_SIZE_PROBLEM={doHugeSizeProblem}', 1)
+    namespace = {}
+    exec(source, namespace)
+    return rolling.copyInput(types.SimpleNamespace(**namespace))
+
+
+@pytest.fixture(scope='session')
+def smallInput():
+    return _loadCase(False)
+
+
+@pytest.fixture(scope='session')
+def hugeInput():
+    return _loadCase(True)
+
+
+@pytest.fixture(scope='session', params=['small', 'huge'])
+def case(request, smallInput, hugeInput):
+    return smallInput if request.param == 'small' else hugeInput
+
+
+def solveNetwork(net, inp, doMinUpMinDown=True):
+    # dpsolver.DPSolution of a network of inp (None if it holds no schedule), with the history of inp
+    tauUp, tauDown = beam.getMinUpMinDown(inp, doMinUpMinDown)
+    initialCounters = dpsolver.getInitialCounters(inp, tauUp, tauDown)
+    return dpsolver.solveDP(net, tauUp, tauDown, doMinUpMinDown=doMinUpMinDown, initialCounters=initialCounters)
+
+
+_exactSolutions = {}
+
+
+def solveSingle(inp, doMinUpMinDown=True):
+    # Independent single solve of inp: the DP on its full network (no ED cost cache), kept by the parameters of inp
+    key = (netcache.inputKey(inp), doMinUpMinDown)
+    if key not in _exactSolutions:
+        net = network.UC_NetworkCSR.createModelFromInput(inp, doCache=False)
+        if doMinUpMinDown:
+            net = net.pruneInfeasibleArcs(inp)
+        _exactSolutions[key] = solveNetwork(net, inp, doMinUpMinDown)
+    return _exactSolutions[key]
+
+
+def isFeasible(inp, masks, relaxLastPeriod=True):
+    # The schedule meets every min up/down time, unit by unit from its history (as in solveDP, a switch into the last
+    # period is never forbidden)
+    for i in range(inp.nUnita):
+        isOn = inp.initial_status[i] == '1'
+        initialStatusPeriods = getattr(inp, 'initial_status_periods', None)
+        periods = np.inf if initialStatusPeriods is None else initialStatusPeriods[i]
+        for t, mask in enumerate(masks):
+            if bool(int(mask) & utils.unitBit(i, inp.nUnita)) == isOn:
+                periods += 1
+                continue
+            if periods < (inp.min_switch_up[i] if isOn else inp.min_switch_down[i]) and not (relaxLastPeriod and t == len(masks) - 1):
+                return False
+            isOn, periods = not isOn, 1
+    return True
+
+
+@pytest.fixture(scope='session')
+def exactSolution(case):
+    return solveSingle(case)
+
+
+@pytest.fixture(scope='session')
+def exactObjective(exactSolution):
+    return exactSolution.objective
+
+
+CPLEX_PERIODS = 6  # the network of the first periods of the 5-unit case fits in CPLEX Community Edition (1000 variables)
+
+
+@pytest.fixture
+def cplexInput(monkeypatch, smallInput):
+    # The input module (read by main.py) set to the first CPLEX_PERIODS periods of the 5-unit case, with its history
+    pytest.importorskip('docplex')
+    import main
+    for name in rolling.INPUT_ATTRIBUTES:
+        monkeypatch.setattr(input, name, getattr(smallInput, name))
+    monkeypatch.setattr(input, 'nPeriodi', CPLEX_PERIODS)
+    monkeypatch.setattr(input, 'D', list(smallInput.D[:CPLEX_PERIODS]))
+    monkeypatch.setattr(main, 'DO_ED_COST_CACHE', False)
+    monkeypatch.setattr(main, 'DO_INITIAL_STATUS_CONSTRAINTS', True)
+    main.UC_Model.reset()
+    yield input
+    main.UC_Model.reset()
@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+import beam
+import utils
+from conftest import isFeasible, solveSingle
+
+SMALL_OBJECTIVE = 140163.2275
+HUGE_OBJECTIVE = 610649.4613
+
+
+def test_exactObjectives(smallInput, hugeInput):
+    assert beam.solveExact(smallInput)[0] == pytest.approx(SMALL_OBJECTIVE, abs=1e-3)
+    assert beam.solveExact(hugeInput)[0] == pytest.approx(HUGE_OBJECTIVE, abs=1e-3)
+
+
+def test_getPriorityListMasks(smallInput):
+    masks = beam.getPriorityListMasks(smallInput)
+    assert len(masks) == smallInput.nUnita + 1
+    assert masks[0] == 0 and masks[-1] == 2**smallInput.nUnita - 1
+    # every mask adds one unit to the previous one, in the priority order
+    added = masks[1:] ^ masks[:-1]
+    assert np.all(masks[1:] & masks[:-1] == masks[:-1])
+    assert [int(b) for b in added] == [utils.unitBit(int(i), smallInput.nUnita) for i in beam.getPriorityOrder(smallInput)]
+
+
+def test_getPriorityOrder(smallInput):
+    Pmax = np.asarray(smallInput.Pmax, dtype=np.float64)
+    averageCost = (np.asarray(smallInput.c1) + np.asarray(smallInput.c2) * Pmax + np.asarray(smallInput.c3) * Pmax**2) / Pmax
+    assert np.all(np.diff(averageCost[beam.getPriorityOrder(smallInput)]) >= 0)
+
+
+@pytest.mark.parametrize('nUnits, nSwitches', [(5, 0), (5, 1), (5, 2), (6, 3)])
+def test_getFlipMasks(nUnits, nSwitches):
+    flips = beam.getFlipMasks(nUnits, nSwitches)
+    expected = [m for m in range(2**nUnits) if bin(m).count('1') <= nSwitches]
+    assert sorted(flips.tolist()) == expected
+    assert len(set(flips.tolist())) == len(flips)
+
+
+def test_fullBeamKeepsReachableStates(case):
+    # A beam as wide as all the states, with every unit allowed to switch, keeps the valid masks the counters reach,
+    # among them those of the optimal schedule
+    beamWidth, nSwitches = 2**case.nUnita, case.nUnita
+    layers = beam.getBeamLayers(case, beamWidth, nSwitches)
+    masks = np.arange(2**case.nUnita)
+    isValid = utils.getValidMasksByPeriod(masks, case.Pmin, case.Pmax, np.asarray(case.D, dtype=np.float64))
+    for layer, valid, optimalMask in zip(layers, isValid, solveSingle(case).masks):
+        assert set(layer.tolist()) <= set(masks[valid].tolist())
+        assert optimalMask in layer
+    assert beam.solveBeam(case, beamWidth, nSwitches).objective == pytest.approx(solveSingle(case).objective, abs=1e-3)
+
+
+def test_widerBeamIsNotWorse(case):
+    # The kept states follow the min up/down counters, so even a narrow beam holds a feasible schedule
+    objectives = []
+    for beamWidth in (1, 2, 5, 20):
+        solution = beam.solveBeam(case, beamWidth=beamWidth)
+        assert max(solution.nStates) <= beamWidth
+        assert isFeasible(case, solution.masks)
+        objectives.append(solution.objective)
+    assert np.all(np.diff(objectives) <= 1e-6)
+    assert objectives[-1] >= solveSingle(case).objective - 1e-3
+
+
+def test_beamLayersFollowMinUpMinDown(hugeInput):
+    # With a beam of one state, the layers are a path whose switches the counters allow (except into the last period)
+    layers = beam.getBeamLayers(hugeInput, beamWidth=1)
+    assert all(len(l) == 1 for l in layers)
+    assert isFeasible(hugeInput, [int(l[0]) for l in layers])
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+import scipy.optimize
+
+import dispatch
+import utils
+
+
+def solveWithScipy(edEngine, mask, demand):
+    # Reference ED cost of one node with a generic solver
+    u = utils.masksToUnitsMatrix(np.array([mask]), edEngine.nUnits)[0].astype(np.float64)
+    bounds = list(zip(u * edEngine.Pmin, u * edEngine.Pmax))
+    result = scipy.optimize.minimize(lambda p: u @ edEngine.c1 + edEngine.c2 @ p + edEngine.c3 @ p**2,
+                                     np.array([(lo + hi) / 2 for lo, hi in bounds]), method='SLSQP', bounds=bounds,
+                                     constraints=[{'type': 'eq', 'fun': lambda p: p.sum() - demand}],
+                                     options={'ftol': 1e-12, 'maxiter': 500})
+    return result.fun
+
+
+def test_dispatchOfSchedule(case, exactSolution):
+    # the units on share the demand within their limits, at the ED cost of their mask
+    edEngine = dispatch.EconomicDispatch.fromInput(case)
+    masks = np.array(exactSolution.masks, dtype=np.int64)
+    P, costs = edEngine.dispatch(masks, case.D)
+    units = utils.masksToUnitsMatrix(masks, case.nUnita)
+    assert np.allclose(P.sum(axis=1), case.D)
+    assert np.all(P >= units * np.asarray(case.Pmin) - 1e-6) and np.all(P <= units * np.asarray(case.Pmax) + 1e-6)
+    assert np.allclose(costs, (units * np.asarray(case.c1) + np.asarray(case.c2) * P + np.asarray(case.c3) * P**2).sum(axis=1))
+    assert np.array_equal(costs, edEngine.cost(masks, np.asarray(case.D, dtype=np.float64)))
+
+
+def test_dispatchMatchesScipy(smallInput):
+    edEngine = dispatch.EconomicDispatch.fromInput(smallInput)
+    masks = np.arange(1, 2**smallInput.nUnita)
+    for demand in (300., 700., 1000.):
+        costs = edEngine.cost(masks, np.full(len(masks), demand))
+        for mask, cost in zip(masks, costs):
+            if cost < dispatch.INFEASIBLE_COST:
+                assert cost == pytest.approx(solveWithScipy(edEngine, mask, demand), rel=1e-6)
+
+
+def test_infeasibleCost(smallInput):
+    edEngine = dispatch.EconomicDispatch.fromInput(smallInput)
+    P, costs = edEngine.dispatch([0, 0b10000, 0b11111], [100., 100., 10000.])
+    assert costs.tolist() == [dispatch.INFEASIBLE_COST] * 3
+    assert not P.any()
+
+
+def test_dispatchUnitsMatchesDispatch(hugeInput):
+    edEngine = dispatch.EconomicDispatch.fromInput(hugeInput)
+    masks = np.arange(2**hugeInput.nUnita)
+    demands = np.resize(hugeInput.D, len(masks)).astype(np.float64)
+    P, costs = edEngine.dispatch(masks, demands)
+    Pu, costsU = edEngine.dispatchUnits(utils.masksToUnitsMatrix(masks, hugeInput.nUnita), demands)
+    assert np.array_equal(P, Pu) and np.array_equal(costs, costsU)
@@ -0,0 +1,97 @@
+import numpy as np
+import pytest
+
+import dispatch
+import dpsolver
+import network
+import utils
+from conftest import isFeasible, solveNetwork
+
+
+def solveByStates(inp):
+    # Exact UC by a recursion on every (mask, periods each unit has been in its state) reachable
+    nUnits = inp.nUnita
+    edEngine = dispatch.EconomicDispatch.fromInput(inp)
+    masks = np.arange(2**nUnits)
+    tauUp, tauDown = inp.min_switch_up, inp.min_switch_down
+    initialOn = [s == '1' for s in inp.initial_status]
+    states = {(tuple(initialOn), tuple(min(k, max(tauUp[i], tauDown[i])) for i, k in enumerate(inp.initial_status_periods))): 0}
+    for t, demand in enumerate(inp.D):
+        edCosts = edEngine.cost(masks, np.full(len(masks), float(demand)))
+        newStates = {}
+        for (on, counters), cost in states.items():
+            for mask in masks[edCosts < dispatch.INFEASIBLE_COST]:
+                newOn = tuple(c == '1' for c in utils.intToBinStr(int(mask), nUnits))
+                newCounters, newCost = [], cost + edCosts[mask]
+                for i in range(nUnits):
+                    if newOn[i] == on[i]:
+                        newCounters.append(min(counters[i] + 1, tauUp[i] if on[i] else tauDown[i]))
+                        continue
+                    if t < inp.nPeriodi - 1 and counters[i] < (tauUp[i] if on[i] else tauDown[i]):
+                        break
+                    newCounters.append(1)
+                    newCost += inp.startup_cost[i] if newOn[i] else 0
+                else:
+                    key = (newOn, tuple(newCounters))
+                    newStates[key] = min(newStates.get(key, np.inf), newCost)
+        states = newStates
+    return min(states.values())
+
+
+def test_exactObjective(smallInput):
+    net = network.UC_NetworkCSR.createModelFromInput(smallInput, doCache=False)
+    solution = solveNetwork(net, smallInput)
+    assert solution.objective == pytest.approx(solveByStates(smallInput), abs=1e-6)
+
+
+def test_solutionIsFeasible(case, exactSolution):
+    assert len(exactSolution.masks) == case.nPeriodi
+    assert isFeasible(case, exactSolution.masks)
+    # the path cost is the objective
+    net = network.UC_NetworkCSR.createModelFromInput(case, doCache=False).pruneInfeasibleArcs(case)
+    assert net.arcCost[exactSolution.arcPath].sum() == pytest.approx(exactSolution.objective)
+
+
+def test_upperBoundDoesNotChangeObjective(case, exactSolution):
+    net = network.UC_NetworkCSR.createModelFromInput(case, doCache=False)
+    tauUp, tauDown = np.asarray(case.min_switch_up), np.asarray(case.min_switch_down)
+    initialCounters = dpsolver.getInitialCounters(case, tauUp, tauDown)
+    solution = dpsolver.solveDP(net, tauUp, tauDown, initialCounters=initialCounters, upperBound=exactSolution.objective)
+    assert solution.objective == pytest.approx(exactSolution.objective, abs=1e-6)
+    # a bound below the optimum leaves no schedule
+    assert dpsolver.solveDP(net, tauUp, tauDown, initialCounters=initialCounters,
+                            upperBound=exactSolution.objective - 1) is None
+
+
+def test_isFeasibleSchedule(hugeInput):
+    # the check of the DP agrees with the unit by unit check on schedules with random switches
+    tauUp, tauDown = np.asarray(hugeInput.min_switch_up), np.asarray(hugeInput.min_switch_down)
+    initialMask = utils.binStrToInt(hugeInput.initial_status)
+    initialCounters = dpsolver.getInitialCounters(hugeInput, tauUp, tauDown)
+    rng = np.random.default_rng(0)
+    results = set()
+    for _ in range(200):
+        flips = (rng.random((hugeInput.nPeriodi, hugeInput.nUnita)) < 0.05) * (1 << np.arange(hugeInput.nUnita))
+        masks = initialMask ^ np.bitwise_xor.accumulate(flips.sum(axis=1))
+        for relaxLastPeriod in (False, True):
+            expected = isFeasible(hugeInput, masks, relaxLastPeriod)
+            assert dpsolver.isFeasibleSchedule(masks, initialMask, initialCounters, tauUp, tauDown, hugeInput.nUnita,
+                                               relaxLastPeriod) == expected
+            results.add(expected)
+    assert results == {False, True}
+
+
+def test_pruneDominated():
+    rng = np.random.default_rng(0)
+    for _ in range(20):
+        n = int(rng.integers(1, 200))
+        heads = rng.integers(0, 4, n)
+        costs = rng.integers(0, 20, n).astype(np.float64)
+        counters = rng.integers(0, 9, (n, 12))
+        kept = set(dpsolver._pruneDominated(heads, costs, counters).tolist())
+        # every label is kept or dominated by a kept label: same node, not more expensive, counters all >= its own
+        for k in range(n):
+            dominators = [j for j in kept if heads[j] == heads[k] and costs[j] <= costs[k] and np.all(counters[j] >= counters[k])]
+            assert dominators
+            if k in kept:
+                assert dominators == [k]
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+import dispatch
+import edcache
+import network
+import utils
+
+
+def test_cachedNetworkIsUncachedNetwork(case, tmp_path):
+    cachePath = str(tmp_path / 'ed.sqlite')
+    cached = network.UC_NetworkCSR.createModelFromInput(case, cachePath=cachePath)
+    uncached = network.UC_NetworkCSR.createModelFromInput(case, doCache=False)
+    assert np.array_equal(cached.nodeMask, uncached.nodeMask) and np.array_equal(cached.arcTo, uncached.arcTo)
+    assert np.array_equal(cached.arcCost, uncached.arcCost)
+    # a new cache on the same file (as in a new run) solves no ED problem
+    cache = edcache.EDCostCache(edcache.fleetKey(case), cachePath)
+    masks = np.arange(2**case.nUnita)
+    masks = masks[utils.getValidMasksByPeriod(masks, case.Pmin, case.Pmax, case.D[:1])[0]]
+    demands = np.full(len(masks), float(case.D[0]))
+    costs = cache.getCosts(masks, demands, lambda m, d: pytest.fail('the costs should be on disk'))
+    assert np.array_equal(costs, dispatch.EconomicDispatch.fromInput(case).cost(masks, demands))
+    cache.close()
+
+
+def test_getCostsSolvesEveryMissingPairOnce(smallInput):
+    edEngine = dispatch.EconomicDispatch.fromInput(smallInput)
+    cache = edcache.EDCostCache(edcache.fleetKey(smallInput), path=None)
+    calls = []
+
+    def solve(masks, demands):
+        calls.append(len(masks))
+        return edEngine.cost(masks, demands)
+    masks, demands = [3, 3, 7, 3], [500., 500., 500., 600.]
+    assert np.array_equal(cache.getCosts(masks, demands, solve), edEngine.cost(masks, demands))
+    assert calls == [3] and (cache.hits, cache.misses) == (1, 3)
+    cache.getCosts(masks, demands, solve)
+    assert calls == [3] and cache.hits == 5
+
+
+def test_fleetsDoNotMix(smallInput, tmp_path):
+    cachePath = str(tmp_path / 'ed.sqlite')
+    cache = edcache.EDCostCache('fleet A', cachePath)
+    cache.store(3, 500., 1.)
+    cache.close()
+    assert len(edcache.EDCostCache('fleet A', cachePath)) == 1
+    assert len(edcache.EDCostCache('fleet B', cachePath)) == 0
+
+
+def test_eviction(tmp_path):
+    cachePath = str(tmp_path / 'ed.sqlite')
+    cache = edcache.EDCostCache('fleet', cachePath, maxEntries=2)
+    for mask in range(3):
+        cache.store(mask, 500., float(mask))
+        cache.flush()
+    cache.close()
+    assert len(edcache.EDCostCache('fleet', cachePath)) == 2
+
+
+def test_memoryIsBounded(smallInput):
+    # without a disk store nothing is kept for a flush, and the least recently used costs go out first
+    cache = edcache.EDCostCache('fleet', path=None, maxEntries=3)
+    for mask in range(3):
+        cache.store(mask, 500., float(mask))
+    assert cache.lookup(0, 500.) == 0.
+    cache.store(3, 500., 3.)
+    assert len(cache) == 3
+    assert cache.lookup(1, 500.) is None and cache.lookup(0, 500.) == 0.
+    assert not cache._pendingStores and not cache._pendingHits
@@ -0,0 +1,63 @@
+import json
+
+import pytest
+
+import instrument
+import network
+from conftest import solveNetwork
+
+
+@pytest.fixture
+def enabled():
+    instrument.reset()
+    instrument.enable()
+    yield
+    instrument.enable(False)
+    instrument.reset()
+
+
+def test_instrumentedBuild(case, enabled):
+    with instrument.phase('network'):
+        net = network.UC_NetworkCSR.createModelFromInput(case, doCache=False)
+    with instrument.phase('solve'):
+        solveNetwork(net, case)
+    record = instrument.snapshot()
+    assert record['phases']['solve']['calls'] == 1
+    assert list(record['phases'])[:5] == ['network', 'network/validity', 'network/nodes', 'network/ED', 'network/arcs']
+    assert record['counters']['nodes'] >= net.nNodes and record['counters']['arcs'] >= net.nArcs
+    assert record['histograms']['ED batch']['count'] == 1
+
+
+def test_disabledRecordsNothing(smallInput):
+    instrument.reset()
+    with instrument.phase('network'):
+        network.UC_NetworkCSR.createModelFromInput(smallInput, doCache=False)
+    instrument.count('nodes')
+    assert instrument.snapshot() == {'phases': {}, 'counters': {}, 'histograms': {}}
+
+
+def test_merge(enabled, tmp_path):
+    with instrument.phase('a'):
+        instrument.record('b', 2.0)
+    instrument.count('n', 3)
+    instrument.observe('latency', 1e-3)
+    worker = instrument.snapshot()
+    instrument.merge(worker)
+    record = instrument.snapshot()
+    assert record['phases']['a/b'] == {'seconds': 4.0, 'calls': 2}
+    assert record['counters']['n'] == 6
+    assert record['histograms']['latency']['count'] == 2
+    path = str(tmp_path / 'run.json')
+    instrument.saveJSON(path)
+    with open(path) as f:
+        assert json.load(f) == record
+    assert 'latency' in instrument.summary()
+
+
+def test_histogramQuantiles():
+    histogram = instrument.Histogram()
+    for seconds in [1e-7, 3e-6, 3e-6, 5e-4]:
+        histogram.add(seconds)
+    assert histogram.buckets[0] == 1 and histogram.buckets[2] == 2
+    assert histogram.quantile(0.5) == 4e-6
+    assert histogram.quantile(1.0) == 5e-4
@@ -0,0 +1,27 @@
+import numpy as np
+import pytest
+
+import lagrangian
+import rolling
+
+
+def test_boundsAroundExact(case, exactObjective):
+    solution = lagrangian.solveLagrangian(case)
+    assert solution.schedule is not None
+    assert solution.lowerBound <= exactObjective + 1e-6 <= solution.upperBound + 2e-6
+    # the upper bound is the cost of a schedule that meets every demand
+    assert solution.upperBound == pytest.approx(rolling.getScheduleCost(case, solution.schedule.masks, doCache=False))
+
+
+def test_boundsWithoutMinUpMinDown(smallInput):
+    solution = lagrangian.solveLagrangian(smallInput, doMinUpMinDown=False)
+    assert solution.lowerBound <= solution.upperBound
+
+
+def test_solveUnitDPsKeepsMinUpMinDown():
+    # One unit, on for 2 periods before period 0, min up 3 / min down 2: paid to switch off, it must stay on at 0
+    onCosts = np.array([[10., 10., 10., 10., 10.]])
+    u, values = lagrangian.solveUnitDPs(onCosts, np.array([0.]), np.array([3]), np.array([2]), np.array([True]),
+                                        np.array([2]), relaxLastPeriod=False)
+    assert u.tolist() == [[1, 0, 0, 0, 0]]
+    assert values.tolist() == [10.]
@@ -0,0 +1,87 @@
+# Tests of the object network and of the docplex model of main.py, on the input module set by the cplexInput fixture
+# (small enough for CPLEX Community Edition)
+import numpy as np
+import pytest
+
+import network
+import rolling
+import solvers
+from conftest import isFeasible, solveSingle
+
+
+@pytest.fixture
+def main(cplexInput):
+    import main
+    return main
+
+
+def buildModel(main, monkeypatch, doBulk, doAggregated=False):
+    monkeypatch.setattr(main, 'DO_BULK_MODEL_BUILD', doBulk)
+    monkeypatch.setattr(main, 'DO_AGGREGATED_MINUP_MINDOWN', doAggregated)
+    main.UC_Model.reset()
+    myNet = main.UC_Network.createModelFromInput()
+    backend = main.CplexBackend()
+    backend.buildModel(myNet)
+    return myNet, backend
+
+
+def getModelSizes(model):
+    return {'binary': model.number_of_binary_variables, 'integer': model.number_of_integer_variables,
+            'continuous': model.number_of_continuous_variables, 'linear': model.number_of_linear_constraints,
+            'indicators': model.number_of_indicator_constraints}
+
+
+@pytest.mark.parametrize('doAggregated', [False, True])
+def test_bulkModelIsPerRowModel(main, monkeypatch, doAggregated):
+    myNet, backend = buildModel(main, monkeypatch, True, doAggregated)
+    bulkSizes = getModelSizes(main.UC_Model.getSingletonModel())
+    bulkObjective = backend.solve(myNet).objective
+    myNet, backend = buildModel(main, monkeypatch, False, doAggregated)
+    sizes = getModelSizes(main.UC_Model.getSingletonModel())
+    assert sizes == bulkSizes
+    assert sizes['binary'] == len(myNet.arcs) and sizes['integer'] == sizes['continuous'] == 0
+    assert (sizes['indicators'] == 0) == doAggregated
+    assert backend.solve(myNet).objective == pytest.approx(bulkObjective, abs=1e-3)
+
+
+@pytest.mark.parametrize('doAggregated', [False, True])
+def test_cplexMatchesHighs(main, monkeypatch, doAggregated):
+    myNet, backend = buildModel(main, monkeypatch, True, doAggregated)
+    solution = backend.solve(myNet)
+    highsSolution = solvers.ScipyMilpBackend(inp=main.getHistoryInput()).solve(myNet)
+    assert solution.status == highsSolution.status == 'optimal'
+    assert solution.objective == pytest.approx(highsSolution.objective, abs=1e-3)
+    assert solution.objective == pytest.approx(solveSingle(main.input).objective, abs=1e-3)
+    assert isFeasible(main.input, solution.getCommitmentMasks())
+    # the schedule is read from the values of the arc variables, in the order of the arcs
+    assert len(solution.flows) == len(myNet.arcs)
+    assert sum(arc.cost for arc, flow in zip(myNet.arcs, solution.flows) if flow > 0.5) == pytest.approx(solution.objective)
+    assert solution.getSchedule().totalCost == pytest.approx(solution.objective, abs=1e-3)
+
+
+def test_objectNetworkIsCSRNetwork(main):
+    # same nodes, arcs and arc costs as the CSR network of the same input
+    myNet = main.UC_Network.createModelFromInput()
+    csrNet = network.UC_NetworkCSR.createModelFromInput(main.input, doCache=False)
+    assert [n.id for n in myNet.nodes] == list(zip(csrNet.nodeMask.tolist(), csrNet.nodePeriod.tolist()))
+    nodeIds = [n.id for n in myNet.nodes]
+    csrArcs = {(nodeIds[a], nodeIds[b]): cost for a, b, cost in zip(csrNet.arcFrom, csrNet.arcTo, csrNet.arcCost)}
+    assert len(myNet.arcs) == len(csrArcs)
+    for arc in myNet.arcs:
+        assert arc.cost == pytest.approx(csrArcs[(arc._n1.id, arc._n2.id)])
+
+
+def test_edPoolKeepsOrder(main):
+    myNet = main.UC_Network.createModelFromInput()
+    internalNodes = [n for n in myNet.nodes if not (n.isSource or n.isSink)]
+    costs = main.UC_Network.calculateFlowCostsInPool([(n.getIntegerNumber(), n._t) for n in internalNodes],
+                                                     nWorkers=2, chunksPerWorker=3)
+    assert np.allclose(costs, [n._F for n in internalNodes])
+
+
+def test_pruneInfeasibleArcs(main):
+    # the object network keeps the arcs of the pruned CSR network, for the sizes of the inp it is given
+    inp = rolling.copyInput(main.input)
+    myNet = main.UC_Network.createModelFromInput().pruneInfeasibleArcs(inp)
+    csrNet = network.UC_NetworkCSR.createModelFromInput(inp, doCache=False).pruneInfeasibleArcs(inp)
+    assert (len(myNet.nodes), len(myNet.arcs)) == (csrNet.nNodes, csrNet.nArcs)
@@ -0,0 +1,43 @@
+import os
+
+import numpy as np
+
+import netcache
+import rolling
+from conftest import solveNetwork
+
+
+def test_loadedNetworkIsBuiltNetwork(case, tmp_path):
+    built = netcache.getNetwork(case, str(tmp_path), doCache=False)
+    loaded = netcache.getNetwork(case, str(tmp_path), doCache=False)
+    assert isinstance(loaded.arcCost, np.memmap)
+    assert (loaded.nUnits, loaded.nPeriods) == (built.nUnits, built.nPeriods)
+    for name in netcache.ARRAY_NAMES:
+        assert np.array_equal(getattr(built, name), getattr(loaded, name))
+    # the memory-mapped arrays are read like the built ones (e.g. by the arc pruning)
+    assert np.array_equal(solveNetwork(loaded.pruneInfeasibleArcs(case), case).masks,
+                          solveNetwork(built.pruneInfeasibleArcs(case), case).masks)
+
+
+def test_inputKey(smallInput):
+    assert netcache.inputKey(smallInput) == netcache.inputKey(rolling.copyInput(smallInput))
+    assert netcache.inputKey(smallInput) != netcache.inputKey(rolling.copyInput(smallInput, D=list(smallInput.D[::-1])))
+    assert netcache.inputKey(smallInput) != netcache.inputKey(smallInput, doReduceNodes=False)
+    assert netcache.inputKey(smallInput) != netcache.inputKey(smallInput, masks=[0, 1, 3])
+
+
+def test_saveTwice(smallInput, tmp_path):
+    # a second save of the same key keeps the complete artifact and leaves no temporary directory
+    net = netcache.getNetwork(smallInput, str(tmp_path), doCache=False)
+    path = os.path.join(str(tmp_path), netcache.inputKey(smallInput))
+    netcache.saveNetwork(net, path)
+    assert os.listdir(str(tmp_path)) == [netcache.inputKey(smallInput)]
+    assert np.array_equal(netcache.loadNetwork(path).arcCost, net.arcCost)
+
+
+def test_eviction(smallInput, tmp_path):
+    for t in range(3):
+        D = list(smallInput.D)
+        D[t] += 10
+        netcache.getNetwork(rolling.copyInput(smallInput, D=D), str(tmp_path), maxArtifacts=2, doCache=False)
+    assert len(os.listdir(str(tmp_path))) == 2
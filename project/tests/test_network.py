@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+import dispatch
+import dpsolver
+import network
+import rolling
+import utils
+from conftest import solveNetwork
+
+
+def solveByLayers(inp):
+    # Shortest path without min up/down by a recursion on all the masks: value[m] after period t
+    edEngine = dispatch.EconomicDispatch.fromInput(inp)
+    masks = np.arange(2**inp.nUnita)
+    transitionCosts = utils.getTransitionCosts(masks[:, None], masks[None, :], inp.startup_cost)
+    value = np.full(len(masks), np.inf)
+    value[utils.binStrToInt(inp.initial_status)] = 0
+    for demand in inp.D:
+        edCosts = edEngine.cost(masks, np.full(len(masks), float(demand)))
+        edCosts[edCosts >= dispatch.INFEASIBLE_COST] = np.inf
+        value = np.min(value[:, None] + transitionCosts, axis=0) + edCosts
+    return value.min()
+
+
+@pytest.fixture(scope='module')
+def networks():
+    return {}
+
+
+@pytest.fixture
+def net(case, networks):
+    if id(case) not in networks:
+        networks[id(case)] = network.UC_NetworkCSR.createModelFromInput(case, doCache=False)
+    return networks[id(case)]
+
+
+def test_shortestPathWithoutMinUpMinDown(case, net, exactObjective):
+    objective = solveNetwork(net, case, doMinUpMinDown=False).objective
+    assert objective == pytest.approx(solveByLayers(case), abs=1e-3)
+    assert dpsolver.lowerBoundsToSink(net)[net.source] == pytest.approx(objective, abs=1e-3)
+    assert objective <= exactObjective + 1e-6
+
+
+def test_nodesAndArcs(case, net):
+    masks = np.arange(2**case.nUnita)
+    isValid = utils.getValidMasksByPeriod(masks, case.Pmin, case.Pmax, np.asarray(case.D, dtype=np.float64))
+    for t in range(case.nPeriodi):
+        assert np.array_equal(net.nodeMask[net.nodesOfPeriod(t)], masks[isValid[t]])
+    nNodes = [1] + [int(v.sum()) for v in isValid] + [1]
+    assert net.nNodes == sum(nNodes)
+    assert net.nArcs == sum(a * b for a, b in zip(nNodes[:-1], nNodes[1:]))
+    # cost of an arc: ED cost of its tail plus the startups of the transition (none to the sink)
+    arcFrom = net.arcFrom
+    transitionCosts = utils.getTransitionCosts(net.nodeMask[arcFrom], net.nodeMask[net.arcTo], case.startup_cost)
+    transitionCosts[net.arcTo == net.sink] = 0
+    assert np.allclose(net.arcCost, net.nodeF[arcFrom] + transitionCosts)
+
+
+def test_updateDemands(smallInput):
+    # moving a network to new demands is the same as building it for them
+    D = list(smallInput.D)
+    D[3] += 50
+    net = network.UC_NetworkCSR.createModelFromInput(smallInput, doCache=False)
+    updated, changed = net.updateDemands(D, smallInput, doCache=False)
+    rebuilt = network.UC_NetworkCSR.createModelFromInput(rolling.copyInput(smallInput, D=D), doCache=False)
+    assert list(changed) == [3]
+    assert np.array_equal(updated.nodeMask, rebuilt.nodeMask) and np.array_equal(updated.arcTo, rebuilt.arcTo)
+    assert np.allclose(updated.arcCost, rebuilt.arcCost)
@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+
+import network
+import preprocess
+from conftest import solveNetwork
+
+
+@pytest.fixture
+def net(case):
+    return network.UC_NetworkCSR.createModelFromInput(case, doCache=False)
+
+
+def test_pruningKeepsOptimum(case, net):
+    # only arcs on no feasible path go: the DP on the pruned network finds the same optimum
+    prunedNet = net.pruneInfeasibleArcs(case)
+    assert prunedNet.nArcs < net.nArcs
+    assert solveNetwork(prunedNet, case).objective == pytest.approx(solveNetwork(net, case).objective, abs=1e-6)
+
+
+def test_everyKeptArcIsOnAPath(case, net):
+    # after pruning, every node but the sink has an out arc and every node but the source an in arc
+    prunedNet = net.pruneInfeasibleArcs(case)
+    outDegree = np.diff(prunedNet.arcPtr)
+    inDegree = np.bincount(prunedNet.arcTo, minlength=prunedNet.nNodes)
+    assert np.all(np.delete(outDegree, prunedNet.sink) > 0)
+    assert np.all(np.delete(inDegree, prunedNet.source) > 0)
+
+
+def test_nothingPrunedWithoutMinUpMinDown(smallInput):
+    net = network.UC_NetworkCSR.createModelFromInput(smallInput, doCache=False)
+    zeros = np.zeros(smallInput.nUnita, dtype=np.int64)
+    keep = preprocess.findFeasibleArcs(net.nodeMask, net.nodePeriod, net.arcFrom, net.arcTo, net.nPeriods, net.nUnits,
+                                       zeros, zeros, zeros)
+    assert keep.all()
@@ -0,0 +1,85 @@
+import pytest
+
+import dpsolver
+import network
+import replan
+import rolling
+from conftest import solveSingle
+
+
+@pytest.mark.parametrize('delta', [1, 150])
+def test_replanMatchesSingleSolve(case, exactSolution, delta):
+    net = network.UC_NetworkCSR.createModelFromInput(case, doCache=False)
+    demandDelta = {1: case.D[1] + delta, case.nPeriodi - 2: case.D[-2] - delta}
+    result = replan.replan(net, case, exactSolution.masks, demandDelta, doCache=False)
+    newInput = rolling.copyInput(case, D=[demandDelta.get(t, d) for t, d in enumerate(case.D)])
+    assert result.changedPeriods.tolist() == sorted(demandDelta)
+    assert result.objective == pytest.approx(solveSingle(newInput).objective, abs=1e-3)
+    assert rolling.getScheduleCost(newInput, result.masks, doCache=False) == pytest.approx(result.objective, abs=1e-3)
+
+    # the result is the starting point of the next re-plan
+    again = replan.replan(result.net, result.inp, result.masks, {1: case.D[1]}, doCache=False)
+    assert again.warmStart
+    assert again.objective == pytest.approx(solveSingle(again.inp).objective, abs=1e-3)
+
+
+def test_warmStartBound(smallInput, monkeypatch):
+    # the bound given to the DP is the cost of the previous schedule under the new demands
+    upperBounds = []
+    solveDP = dpsolver.solveDP
+
+    def boundedSolveDP(*args, upperBound=None, **kwargs):
+        upperBounds.append(upperBound)
+        return solveDP(*args, upperBound=upperBound, **kwargs)
+    monkeypatch.setattr(dpsolver, 'solveDP', boundedSolveDP)
+    net = network.UC_NetworkCSR.createModelFromInput(smallInput, doCache=False)
+    previousMasks = solveSingle(smallInput).masks
+    result = replan.replan(net, smallInput, previousMasks, {4: smallInput.D[4] + 20}, doCache=False)
+    assert result.warmStart
+    assert upperBounds == [pytest.approx(rolling.getScheduleCost(result.inp, previousMasks, doCache=False))]
+    assert result.objective <= upperBounds[0] + 1e-6
+    # without a previous schedule there is no bound
+    replan.replan(net, smallInput, None, {}, doCache=False)
+    assert upperBounds[-1] is None
+
+
+def test_inPlace(smallInput):
+    # a small change keeps the valid masks: the network is patched in place, a large one is rebuilt
+    net = network.UC_NetworkCSR.createModelFromInput(smallInput, doCache=False)
+    result = replan.replan(net, smallInput, solveSingle(smallInput).masks, {1: smallInput.D[1] + 1}, doCache=False)
+    assert result.inPlace and result.net is net
+    result = replan.replan(net, result.inp, result.masks, {1: smallInput.D[1] + 150}, doCache=False)
+    assert not result.inPlace
+
+
+def test_isPathOfNetwork(smallInput):
+    net = network.UC_NetworkCSR.createModelFromInput(smallInput, doCache=False)
+    assert replan.isPathOfNetwork(net, solveSingle(smallInput).masks)
+    assert not replan.isPathOfNetwork(net, [0] * smallInput.nPeriodi)
+
+
+def test_infeasibleWarmStartIsIgnored(smallInput):
+    # the optimum without min up/down is cheaper than the constrained one: it is not a valid upper bound
+    net = network.UC_NetworkCSR.createModelFromInput(smallInput, doCache=False)
+    relaxed = solveSingle(smallInput, doMinUpMinDown=False)
+    assert relaxed.objective < solveSingle(smallInput).objective - 1
+    result = replan.replan(net, smallInput, relaxed.masks, {}, doCache=False)
+    assert not result.warmStart
+    assert result.objective == pytest.approx(solveSingle(smallInput).objective, abs=1e-3)
+    # without min up/down it is the optimum itself
+    result = replan.replan(net, smallInput, relaxed.masks, {}, doMinUpMinDown=False, doCache=False)
+    assert result.warmStart and result.objective == pytest.approx(relaxed.objective, abs=1e-6)
+
+
+def test_chainedCplexReplans(cplexInput):
+    net = network.UC_NetworkCSR.createModelFromInput(cplexInput, doCache=False)
+    first = replan.replan(net, cplexInput, None, {2: 850.}, solver='cplex', doCache=False)
+    assert first.inp.D[2] == 850. and cplexInput.D[2] == 850.
+    assert first.objective == pytest.approx(solveSingle(first.inp).objective, abs=1e-3)
+    # the second re-plan starts from the result of the first one: both changes hold
+    second = replan.replan(first.net, first.inp, first.masks, {4: 750.}, solver='cplex', doCache=False)
+    assert (second.inp.D[2], second.inp.D[4]) == (850., 750.)
+    assert second.warmStart
+    assert second.objective == pytest.approx(solveSingle(second.inp).objective, abs=1e-3)
+    with pytest.raises(ValueError):
+        replan.replan(second.net, rolling.copyInput(second.inp, startup_cost=[0] * 5), None, {}, solver='cplex')
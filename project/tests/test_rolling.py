@@ -0,0 +1,43 @@
+import math
+
+import pytest
+
+import dpsolver
+import rolling
+import utils
+from conftest import isFeasible
+
+
+def test_oneWindowIsFullHorizon(case):
+    solution = rolling.solveRollingHorizon(case, windowLength=case.nPeriodi, commitLength=case.nPeriodi, doCache=False)
+    masks, objective, _ = rolling.solveFullHorizon(case, doCache=False)
+    assert solution.nWindows == 1
+    assert list(solution.masks) == list(masks)
+    assert solution.objective == pytest.approx(objective, abs=1e-6)
+
+
+def test_fullHorizon(case, exactSolution):
+    masks, objective, _ = rolling.solveFullHorizon(case, doCache=False)
+    assert objective == pytest.approx(exactSolution.objective, abs=1e-3)
+    assert rolling.getScheduleCost(case, exactSolution.masks, doCache=False) == pytest.approx(exactSolution.objective, abs=1e-3)
+
+
+@pytest.mark.parametrize('windowLength, commitLength', [(4, 2), (6, 3), (6, 6)])
+def test_rollingHorizonIsFeasible(case, exactObjective, windowLength, commitLength):
+    solution = rolling.solveRollingHorizon(case, windowLength, commitLength, doCache=False)
+    assert len(solution.masks) == case.nPeriodi
+    assert solution.nWindows == 1 + math.ceil(max(case.nPeriodi - windowLength, 0) / commitLength)
+    assert isFeasible(case, solution.masks)
+    assert solution.objective >= exactObjective - 1e-3
+    # the first committed periods are those of the first window solved on its own
+    initialCounters = dpsolver.getInitialCounters(case, case.min_switch_up, case.min_switch_down)
+    firstWindow = rolling.getWindowInput(case, 0, windowLength, utils.binStrToInt(case.initial_status), initialCounters)
+    assert list(solution.masks[:commitLength]) == list(rolling.solveWindow(firstWindow, doCache=False, relaxLastPeriod=False)[:commitLength])
+
+
+def test_getWindowInput(hugeInput):
+    windowInput = rolling.getWindowInput(hugeInput, 5, 9, 0b1100000001, [3, 8, 1, 1, 1, 1, 1, 1, 1, 2])
+    assert (windowInput.nPeriodi, windowInput.D) == (4, list(hugeInput.D[5:9]))
+    assert windowInput.initial_status == '1100000001'
+    assert windowInput.initial_status_periods == [3, 8, 1, 1, 1, 1, 1, 1, 1, 2]
+    assert windowInput.c1 == hugeInput.c1
@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+
+import rolling
+import scenarios
+from conftest import solveSingle
+
+
+def test_scenariosMatchSingleSolves(case):
+    # every scenario of the batch (the first one is the demand of the case) has the result of its own single solve
+    demands = np.vstack([case.D, scenarios.generateScenarios(case, 4, 0.05, seed=1)])
+    result = scenarios.solveScenarios(demands, case, nWorkers=1)
+    for D, objective, masks in zip(demands, result.objectives, result.schedules):
+        scenarioInput = rolling.copyInput(case, D=list(D))
+        single = solveSingle(scenarioInput)
+        if single is None:
+            # e.g. a demand over the capacity of the fleet
+            assert np.isnan(objective) and masks is None
+            continue
+        assert objective == pytest.approx(single.objective, abs=1e-3)
+        assert rolling.getScheduleCost(scenarioInput, masks, doCache=False) == pytest.approx(objective, abs=1e-3)
+
+
+def test_poolMatchesOneProcess(smallInput):
+    demands = scenarios.generateScenarios(smallInput, 6, 0.1)
+    assert np.allclose(scenarios.solveScenarios(demands, smallInput, nWorkers=2).objectives,
+                       scenarios.solveScenarios(demands, smallInput, nWorkers=1).objectives)
+
+
+def test_infeasibleScenario(smallInput):
+    demands = np.array([smallInput.D, [2000.] * smallInput.nPeriodi])
+    result = scenarios.solveScenarios(demands, smallInput, nWorkers=1)
+    assert np.isnan(result.objectives[1]) and result.schedules[1] is None
+    assert len(result.getTable(smallInput.nUnita)[1]) == 2
+
+
+def test_generateScenarios(hugeInput):
+    demands = scenarios.generateScenarios(hugeInput, 50, 0.1)
+    assert demands.shape == (50, hugeInput.nPeriodi)
+    ratio = demands / np.asarray(hugeInput.D)
+    assert np.all((ratio >= 0.9) & (ratio <= 1.1))
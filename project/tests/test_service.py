@@ -0,0 +1,106 @@
+import http.client
+import json
+import threading
+import time
+
+import numpy as np
+import pytest
+
+import service
+import utils
+from conftest import isFeasible, solveSingle
+
+
+def getRequest(case, **options):
+    fleet = {name: getattr(case, name) for name in service.FLEET_ATTRIBUTES}
+    return dict({'D': list(case.D), 'fleet': fleet}, **options)
+
+
+@pytest.fixture
+def solveService(tmp_path):
+    solveService = service.SolveService(nWorkers=2, plotDir=str(tmp_path))
+    yield solveService
+    solveService._executor.shutdown()
+
+
+@pytest.mark.parametrize('solver, doMinUpMinDown', [('dp', True), ('dp', False), ('highs', True)])
+def test_responseMatchesSingleSolve(smallInput, solveService, solver, doMinUpMinDown):
+    response = solveService.solveInPool(getRequest(smallInput, solver=solver, minUpMinDown=doMinUpMinDown))
+    assert response['status'] == 'optimal'
+    assert response['objective'] == pytest.approx(solveSingle(smallInput, doMinUpMinDown).objective, abs=1e-3)
+    if doMinUpMinDown:
+        assert isFeasible(smallInput, response['masks'])
+    assert response['commitment'] == [utils.intToBinStr(m, smallInput.nUnita) for m in response['masks']]
+    assert np.allclose(np.sum(response['dispatch'], axis=1), smallInput.D)
+    assert sum(response['edCosts']) + sum(response['startupCosts']) == pytest.approx(response['objective'])
+
+
+@pytest.mark.parametrize('doSymmetry', [False, True])
+def test_warmRequestSolvesNoED(hugeInput, solveService, doSymmetry):
+    response = solveService.solveInPool(getRequest(hugeInput, symmetry=doSymmetry))
+    misses = solveService.getStats()['fleets'][0]['edCacheMisses']
+    assert solveService.solveInPool(getRequest(hugeInput, symmetry=doSymmetry))['objective'] == response['objective']
+    assert solveService.getStats()['fleets'][0]['edCacheMisses'] == misses
+    # the aggregated network of the identical units keeps the optimum
+    assert response['objective'] == pytest.approx(solveSingle(hugeInput).objective, abs=1e-3)
+
+
+def test_fleetsAreBounded(smallInput, tmp_path):
+    solveService = service.SolveService(nWorkers=1, maxUnits=8, maxFleets=2, plotDir=str(tmp_path))
+    for startup in (1000, 2000, 3000):
+        request = getRequest(smallInput)
+        request['fleet']['startup_cost'] = [startup] * smallInput.nUnita
+        solveService.solve(request)
+    assert len(solveService.fleets) == 2
+    request['fleet'] = dict(request['fleet'], nUnita=9)
+    with pytest.raises(ValueError):
+        solveService.solve(request)
+    request['fleet'] = {'Pmin': [1, 2]}
+    with pytest.raises(ValueError):
+        solveService.solve(request)
+
+
+def test_http(hugeInput, tmp_path):
+    server = service.http.server.ThreadingHTTPServer(('127.0.0.1', 0), service.ServiceRequestHandler)
+    server.service = service.SolveService(nWorkers=2, plotDir=str(tmp_path))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    def call(method, path, body=None):
+        connection = http.client.HTTPConnection('127.0.0.1', server.server_address[1], timeout=60)
+        connection.request(method, path, None if body is None else json.dumps(body))
+        response = connection.getresponse()
+        return response.status, json.loads(response.read())
+    try:
+        assert call('GET', '/health') == (200, {'status': 'ok'})
+        status, job = call('POST', '/solve', getRequest(hugeInput, **{'async': True}))
+        assert status == 202
+        for _ in range(600):
+            status, result = call('GET', f"/jobs/{job['job']}")
+            if result['status'] != 'running':
+                break
+            time.sleep(0.1)
+        assert result['status'] == 'done'
+        assert result['result']['objective'] == pytest.approx(solveSingle(hugeInput).objective, abs=1e-3)
+        assert call('POST', '/solve', {'fleet': {}})[0] == 400
+        assert call('GET', '/jobs/unknown')[0] == 404
+    finally:
+        server.shutdown()
+        server.server_close()
+        server.service._executor.shutdown()
+
+
+def test_memoryIsBounded(smallInput, tmp_path):
+    # many fleets and many demands: the fleets, their ED caches and the per-mask tables stay bounded
+    solveService = service.SolveService(nWorkers=1, maxFleets=2, plotDir=str(tmp_path), edCacheMaxEntries=100)
+    for k in range(6):
+        request = getRequest(smallInput)
+        request['fleet']['startup_cost'] = [1000 + k] * smallInput.nUnita
+        for shift in range(4):
+            request['D'] = [d + 10 * shift for d in smallInput.D]
+            assert solveService.solve(request)['status'] == 'optimal'
+    assert len(solveService.fleets) == 2
+    for fleetState in solveService.fleets.values():
+        assert len(fleetState.cache) <= 100
+        assert not fleetState.cache._pendingStores and not fleetState.cache._pendingHits
+    assert utils._getSumByMask.cache_info().currsize <= 3 * 2
@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+import beam
+import network
+import solvers
+from conftest import isFeasible, solveNetwork
+
+
+def test_milpMatchesDP(smallInput):
+    net = network.UC_NetworkCSR.createModelFromInput(smallInput, doCache=False)
+    solution = solvers.ScipyMilpBackend(inp=smallInput).solve(net)
+    assert solution.status == 'optimal'
+    assert solution.objective == pytest.approx(solveNetwork(net, smallInput).objective, abs=1e-3)
+    # the selected arcs are a path of the network, with the min up/down times of the input
+    assert isFeasible(smallInput, solution.getCommitmentMasks())
+    schedule = solution.getSchedule(smallInput)
+    assert schedule.totalCost == pytest.approx(solution.objective, abs=1e-3)
+
+
+def test_milpMatchesDPOnBeamNetwork(hugeInput):
+    # the full network of the 10 units is too large for HiGHS in a test: compare on the network of a beam
+    net = network.UC_NetworkCSR.createModelFromInput(hugeInput, doCache=False, layers=beam.getBeamLayers(hugeInput, 5))
+    solution = solvers.ScipyMilpBackend(inp=hugeInput).solve(net)
+    assert solution.status == 'optimal'
+    assert solution.objective == pytest.approx(solveNetwork(net, hugeInput).objective, abs=1e-3)
+
+
+def test_milpWithoutMinUpMinDown(smallInput):
+    net = network.UC_NetworkCSR.createModelFromInput(smallInput, doCache=False)
+    solution = solvers.ScipyMilpBackend(doMinUpMinDown=False, inp=smallInput).solve(net)
+    assert solution.objective == pytest.approx(solveNetwork(net, smallInput, doMinUpMinDown=False).objective, abs=1e-3)
+
+
+def test_getSchedule(case, exactSolution):
+    schedule = solvers.getSchedule(exactSolution.masks, case)
+    assert schedule.totalCost == pytest.approx(exactSolution.objective, abs=1e-3)
+    assert np.allclose(schedule.dispatch.sum(axis=1), case.D)
+
+
+def test_backendIsAbstract():
+    with pytest.raises(TypeError):
+        solvers.SolverBackend()
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+import network
+import rolling
+import symmetry
+import utils
+from conftest import isFeasible, solveNetwork, solveSingle
+
+
+def solveOnMasks(inp, masks, doMinUpMinDown=True):
+    return solveNetwork(network.UC_NetworkCSR.createModelFromInput(inp, masks=masks, doCache=False), inp, doMinUpMinDown)
+
+
+def test_aggregatedNetworkKeepsOptimum(hugeInput):
+    # one mask for each number of units on in a group: fewer states, the same optimum
+    masks, groups = symmetry.getSymmetryMasks(hugeInput)
+    nUnits = hugeInput.nUnita
+    assert len(masks) == np.prod([len(g) + 1 for g in groups]) * 2**(nUnits - sum(len(g) for g in groups))
+    assert len(masks) < 2**nUnits
+    allMasks = np.arange(2**nUnits)
+    assert {tuple(c) for c in symmetry.getGroupCounts(masks, nUnits, groups)} == \
+        {tuple(c) for c in symmetry.getGroupCounts(allMasks, nUnits, groups)}
+    solution = solveOnMasks(hugeInput, masks)
+    assert solution.objective == pytest.approx(solveSingle(hugeInput).objective, abs=1e-3)
+    assert isFeasible(hugeInput, solution.masks)
+    assert rolling.getScheduleCost(hugeInput, solution.masks, doCache=False) == pytest.approx(solution.objective, abs=1e-3)
+
+
+def test_groups(smallInput, hugeInput):
+    assert symmetry.findUnitGroups(smallInput) == []
+    # the last 3 units of the 10-unit case are identical but for their cost curves, and free to switch
+    assert symmetry.findUnitGroups(hugeInput) == [[7, 8, 9]]
+
+
+def test_groupsWithoutMinUpMinDown(smallInput):
+    # without min up/down the units 3 and 4 (startup costs 1100 and 1120) are grouped with a 2% tolerance (the unit 4 is the cheaper one)
+    groups = symmetry.findUnitGroups(smallInput, doMinUpMinDown=False, rtol=0.02)
+    assert groups == [[3, 2]]
+    masks = symmetry.getCanonicalMasks(smallInput.nUnita, groups)
+    solution = solveOnMasks(smallInput, masks, doMinUpMinDown=False)
+    exact = solveOnMasks(smallInput, None, doMinUpMinDown=False)
+    assert solution.objective >= exact.objective - 1e-3
+    assert rolling.getScheduleCost(smallInput, solution.masks, doCache=False) == pytest.approx(solution.objective, abs=1e-3)
+
+
+@pytest.mark.parametrize('groups', [[], [[0, 1]], [[1, 3, 4]], [[0, 2], [3, 5, 1]]])
+def test_getCanonicalMasks(groups):
+    nUnits = 6
+    masks = np.arange(2**nUnits)
+    counts = symmetry.getGroupCounts(masks, nUnits, groups)
+    units = utils.masksToUnitsMatrix(masks, nUnits)
+    # canonical: in every group the units on are the first ones
+    isCanonical = np.all([np.all(units[:, g] == (np.arange(len(g))[None, :] < counts[:, [k]]), axis=1)
+                          for k, g in enumerate(groups)], axis=0) if groups else np.ones(len(masks), dtype=bool)
+    assert np.array_equal(symmetry.getCanonicalMasks(nUnits, groups), masks[isCanonical])
@@ -1,205 +1,228 @@
 #This module contains all the functions that are used in the main module.
 
-'''This function returns a list of all the possible combinations of binary strings of length nUnits.
-    e.g. nUnits = 3 -> ['000', '001', '010', '011', '100', '101', '110', '111']
-
-    Args:
-        nUnits (int): The length of the binary strings.
-        
-    Returns:
-        list: A list of all the possible combinations of binary strings of length nUnits.'''
-def getAllBinaryStringCombinations(nUnits):
-    nCombs = 2**nUnits
-    return ([intToBinStr(i, nUnits) for i in range(nCombs)], nCombs)
-
 def intToBinStr(i, nDigits=8):
     int_to_binstr = f'{i:0{nDigits}b}'
     return int_to_binstr
 
 
-def binStrToBin(binStr):
-    binStr_to_bin = bin(int(binStr, 2))
-    return binStr_to_bin
-
-
-def binToInt(bin):
-    bin_to_int = int(bin, 2)
-    return bin_to_int
-
-
 def binStrToInt(binStr):
-    binStr_to_int = binToInt(binStrToBin(binStr))
-    return binStr_to_int
+    # e.g. '01101' -> 13 (the mask of a commitment string, as inp.initial_status)
+    return int(binStr, 2)
+
+import numpy as np
+def masksToUnitsMatrix(masks, nUnits):
+    # Return a (len(masks), nUnits) matrix of 0/1 floats. The unit i is the i-th character of the binary string,
+    # so it is the bit (nUnits-1-i) of the integer mask.
+    # e.g. masks = [3], nUnits = 3 -> [[0., 1., 1.]]
+    masks = np.asarray(masks, dtype=np.int64).reshape(-1, 1)
+    shifts = np.arange(nUnits - 1, -1, -1, dtype=np.int64)[None, :]
+    return ((masks >> shifts) & 1).astype(np.float64)
+
+###################### Bitmasks ######################
+# A commitment state is an integer mask: the unit i is the i-th character of the binary string,
+# so it is the bit (nUnits-1-i) of the mask. e.g. '01001' -> 9
+# A pattern is a pair (patternMask, patternValue): the bits set in patternMask are fixed to the bits of
+# patternValue, the other bits are free (the 'x' characters of the string patterns).
+# e.g. 'x10x1' -> (0b01101, 0b01001)
+def unitBit(i, nUnits):
+    return 1 << (nUnits - 1 - i)
+
+def getAllMasks(nUnits):
+    return range(2**nUnits)
+
+import functools
+SUM_TABLE_CACHE_SIZE = 24  # tables kept by getSumByMask, least recently used first out (3 per fleet: Pmin, Pmax, startup costs)
+
+def _sumByMask(values):
+    nUnits = len(values)
+    return masksToUnitsMatrix(np.arange(2**nUnits), nUnits) @ np.asarray(values, dtype=np.float64)
+
+_getSumByMask = functools.lru_cache(maxsize=SUM_TABLE_CACHE_SIZE)(_sumByMask)
+
+def setSumTableCacheSize(size):
+    # Keep at most size tables in getSumByMask (e.g. 3 per fleet a resident process keeps in memory)
+    global _getSumByMask
+    if _getSumByMask.cache_info().maxsize != size:
+        _getSumByMask = functools.lru_cache(maxsize=size)(_sumByMask)
+
+def getSumByMask(values):
+    # Return S as a NumPy array with S[m] = sum of values[i] over the units i that are on in m
+    # e.g. values = [1, 2, 4] -> S = [0, 4, 2, 6, 1, 5, 3, 7]
+    return _getSumByMask(tuple(values))
+
+SUM_TABLE_MAX_UNITS = 16  # above this number of units the 2^nUnits table of getSumByMask is not built
+
+def getSumOfMasks(masks, values):
+    # Return S[masks] of getSumByMask (for an array of masks of any shape), without the table for the large fleets
+    masks = np.asarray(masks, dtype=np.int64)
+    if len(values) <= SUM_TABLE_MAX_UNITS:
+        return getSumByMask(values)[masks]
+    nUnits = len(values)
+    total = np.zeros(masks.shape)
+    for i, value in enumerate(values):
+        total += ((masks >> (nUnits - 1 - i)) & 1) * float(value)
+    return total
+
+def getTransitionCosts(fromMasks, toMasks, startup_cost):
+    # Startup cost of the transitions fromMasks -> toMasks (scalars or broadcastable arrays).
+    # The cost only depends on the units switched on, ~fromMask & toMask, so the table of all the
+    # (fromMask, toMask) pairs is the per-mask sum of the startup costs read at that index.
+    # e.g. startup_cost = [10, 20, 40], 0b100 -> 0b011 -> 60
+    fullMask = (1 << len(startup_cost)) - 1
+    switchedOn = ~np.asarray(fromMasks, dtype=np.int64) & np.asarray(toMasks, dtype=np.int64) & fullMask
+    return getSumOfMasks(switchedOn, startup_cost)
+
+def getValidMasksByPeriod(masks, Pmin, Pmax, D):
+    # Return a (len(D), len(masks)) boolean matrix: True if the units on in the mask can meet the demand of the period,
+    # i.e. sum of their Pmin <= D[t] <= sum of their Pmax. The capacity window of a mask does not depend on the period.
+    masks = np.asarray(masks, dtype=np.int64)
+    minPower = getSumOfMasks(masks, Pmin)
+    maxPower = getSumOfMasks(masks, Pmax)
+    D = np.asarray(D, dtype=np.float64)[:, None]
+    return (minPower[None, :] <= D) & (D <= maxPower[None, :])
 
 ###################### Network ######################
-import re
-def getAllBinaryStringCombinationMatchingPattern(strNumber):
-    # Get a string of length n. Each character can be 0, 1 or x.
-    # Return a list of all the possible combinations of binary strings of length n.
-    # e.g. strNumber = 'x10x1' -> ['01001', '01011', '11001', '11011']
-    # e.g. strNumber = 'x1x' -> ['010', '011', '110', '111']
-    # e.g. strNumber = 'x' -> ['0', '1']
-    # e.g. strNumber = '1' -> ['1']
-    # e.g. strNumber = '0' -> ['0']
-    # e.g. strNumber = 'xx' -> ['00', '01', '10', '11']
-    # e.g. strNumber = 'xxx' -> ['000', '001', '010', '011', '100', '101', '110', '111']
-
-    # Get the list of all the possible combinations of binary strings of length strNumber
-    allCombs, _ = getAllBinaryStringCombinations(len(strNumber))
-    # Create a regex pattern with strNumber
-    pattern = strNumber.replace('x', '.')
-    # Remove all the combinations that do not match the pattern
-    allCombs = [i for i in allCombs if not re.match(pattern, i)]
-    return allCombs
-
-def getAllBinaryStringCombinationMatchingPattern(strNumber):
-    # Get a string of length n. Each character can be 0, 1 or x.
-    # Return a list of all the possible combinations of binary strings of length n.
-    # e.g. strNumber = 'x10x1' -> ['01001', '01011', '11001', '11011']
-    # e.g. strNumber = 'x1x' -> ['010', '011', '110', '111']
-    # e.g. strNumber = 'x' -> ['0', '1']
-    # e.g. strNumber = '1' -> ['1']
-    # e.g. strNumber = '0' -> ['0']
-    # e.g. strNumber = 'xx' -> ['00', '01', '10', '11']
-    # e.g. strNumber = 'xxx' -> ['000', '001', '010', '011', '100', '101', '110', '111']
-
-    # Get the list of all the possible combinations of binary strings of length strNumber
-    allCombs, _ = getAllBinaryStringCombinations(len(strNumber))
-    # Create a regex pattern with strNumber
-    pattern = strNumber.replace('x', '.')
-    # Remove all the combinations that do not match the pattern
-    allCombs = [i for i in allCombs if re.match(pattern, i)]
-    return allCombs
+def getAllMasksMatchingPattern(pattern, nUnits):
+    # Return the list of all the masks m of nUnits bits with (m & patternMask) == patternValue, in increasing order.
+    # e.g. pattern = (0b01101, 0b01001) ('x10x1'), nUnits = 5 -> [0b01001, 0b01011, 0b11001, 0b11011]
+    patternMask, patternValue = pattern
+    freeBits = ((1 << nUnits) - 1) & ~patternMask
+    # enumerate the subsets of the free bits
+    matching = []
+    subset = 0
+    while True:
+        matching.append(patternValue | subset)
+        if subset == freeBits:
+            break
+        subset = (subset - freeBits) & freeBits
+    return matching
 
 def getIDPatternDifferences(id1, id2):
-    # Return a string as long as id1 and id2. Each character is x if the corresponding characters in id1 and id2 are the same. Otherwise, it is the character in id2.
-    # e.g. id1 = '0000', id2 = '0011' -> 'xx11'
-    # e.g. id1 = '0000', id2 = '1111' -> '1111'
-    # e.g. id1 = '0000', id2 = '0000' -> '0000'
-    # e.g. id1 = '0000', id2 = '0001' -> 'xxx1'
-    assert len(id1) == len(id2)
-    output = 'x' * len(id1)
-    for i in range(len(id1)):
-        if id1[i] != id2[i]:
-            # Replace the character in the output string with the character in id2
-            output = output[:i] + id2[i] + output[i+1:]
-    # print(output)
-    return output
-
-def splitPattern(pattern):
-    # Split a pattern into a list of simple patterns. Each simple pattern has all characters equal to x but one that can be 0 or 1.
-    # e.g. pattern = 'x10x1' -> ['x1xxx, xx0xx', xxxx1]
-    # e.g. pattern = 'x1x' -> ['x1x']
-    # e.g. pattern = 'x' -> ['x']
-    # e.g. pattern = '1' -> ['1']
-    # e.g. pattern = '0' -> ['0']
-    # e.g. pattern = 'xx' -> ['xx']
-    # e.g. pattern = 'xx0' -> ['xx0']
-    # e.g. pattern = 'x1x0' -> ['x1xx', 'xxx0']
-    
-    # count the 0s and 1s in the pattern
-    n0 = pattern.count('0')
-    n1 = pattern.count('1')
-    # # If the sum is 1, then the pattern is a simple pattern
-    if n0 + n1 == 0:
-        assert False
-        # return [pattern]
-
+    # Return the pattern fixing the bits that differ between id1 and id2 to their value in id2.
+    # e.g. id1 = 0b0000, id2 = 0b0011 -> (0b0011, 0b0011) ('xx11')
+    # e.g. id1 = 0b0101, id2 = 0b0011 -> (0b0110, 0b0010) ('x01x')
+    # e.g. id1 = 0b0000, id2 = 0b0000 -> (0b0000, 0b0000) ('xxxx')
+    patternMask = id1 ^ id2
+    return (patternMask, id2 & patternMask)
+
+def splitPattern(pattern, nUnits):
+    # Split a pattern into a list of simple patterns. Each simple pattern fixes only one bit.
+    # Return a list of tuples (simple_pattern, i) where i is the unit of the fixed bit.
+    # e.g. pattern = 'x10x1' -> [('x1xxx', 1), ('xx0xx', 2), ('xxxx1', 4)] (as (mask, value) pairs)
+    patternMask, patternValue = pattern
+    assert patternMask != 0
     simple_patterns = []
-    for i in range(len(pattern)):
-        if pattern[i] != 'x':
-            ith_simple_pattern = ('x'*len(pattern[:i])) + pattern[i] + ('x'*len(pattern[i+1:]))
-            simple_patterns.append( (ith_simple_pattern,i) )
+    for i in range(nUnits):
+        bit = unitBit(i, nUnits)
+        if patternMask & bit:
+            simple_patterns.append(((bit, patternValue & bit), i))
     return simple_patterns
 
 def negatePattern(pattern):
-    # Return the negation of a pattern
+    # Return the negation of a pattern: the fixed bits are flipped
     # e.g. pattern = 'x10x1' -> 'x01x0'
-    # e.g. pattern = 'x1x' -> 'x0x'
-    # e.g. pattern = 'x' -> 'x'
-    # e.g. pattern = '1' -> '0'
-    # e.g. pattern = '0' -> '1'
-    # e.g. pattern = 'xx' -> 'xx'
-    # e.g. pattern = 'xx0' -> 'xx1'
-    # e.g. pattern = 'x1x0' -> 'x0x1'
-    return pattern.replace('0', 't').replace('1', '0').replace('t', '1')
-
-def getAllNodesViolatingMinDownAndUpTime(id1, id2, nIntervalli, pattern, tau):
+    patternMask, patternValue = pattern
+    return (patternMask, patternValue ^ patternMask)
+
+def getAllNodesViolatingMinDownAndUpTime(id1, id2, nIntervalli, pattern, tau, nUnits):
     i1, t1 = id1
     i2, t2 = id2
     #1 Create pattern. P.S. pattern is already in input
     # pattern = pattern
 
     # 2 Split the pattern into a list of tuples (simple_pattern, i) where
-    #     simple_pattern is a pattern with all characters equal to x but one that can be 0 or 1.
-    #     i is the index of the character that is not x.
-    pSplit = splitPattern(pattern)
+    #     simple_pattern is a pattern fixing only the bit of the unit i.
+    pSplit = splitPattern(pattern, nUnits)
 
-
-    # 3 Negate the simple patterns: 0 -> 1, 1 -> 0, x -> x
+    # 3 Negate the simple patterns
     pSplit_Negated = [(negatePattern(simple_pattern),i) for (simple_pattern,i) in pSplit]
 
-    # 4 Create an empty dictionary <string, int>. 
-    # For all the simple patterns in pSplit_Negated, 
-    #   get all the possible combinations of binary strings
+    # 4 Create an empty dictionary <mask, int>.
+    # For all the simple patterns in pSplit_Negated,
+    #   get all the masks matching the pattern
     #       and add them to the dictionary with the value tau[i].
     #   If the key is already in the dictionary, then update the value with the maximum between the current value and tau[i].
     d = {}
     for (sp_negated, i) in pSplit_Negated:
-        for p in getAllBinaryStringCombinationMatchingPattern(sp_negated):
+        for p in getAllMasksMatchingPattern(sp_negated, nUnits):
             if p not in d:
                 d[p] = tau[i]
             else:
                 d[p] = max(d[p], tau[i])
 
-    # 5 For each (node_id, window_size) in the dictionary, create a list of tuples (node_id, time) for all time in [t2+1, t2+2, ..., min(t2+window_size, nIntervalli-1)]
-    output = []
+    # 5 For each (node_id, window_size) in the dictionary, create the set of tuples (node_id, time) for all time in [t2+1, t2+2, ..., min(t2+window_size, nIntervalli-1)]
+    output = set()
     for (node_id,window_size) in d.items():
         lht = t2+1
         rht = min(t2+window_size,nIntervalli-1)
         if lht > rht:
             continue
         r = range(lht, rht)
-        output.extend([(node_id,time) for time in r])
+        output.update((node_id,time) for time in r)
 
     # Return the output
     return output
 
 
 ###################### Draw ######################
-# Get the tuple formed by a string and an integer ('1100100000', 0) from the strin "1100100000 0 1100100000 1)"
-def getArcFromStrVariableName(str):
-    str = str.replace("x_('", "")
-    str = str.replace("', ", " ")
-    str = str.replace(")_('", " ")
-    str = str.replace("', ", " ")
-    str = str.replace(")", "")
-    id1, t1, id2, t2 = tuple(str.split(" "))
-    t1 = int(t1)
-    t2 = int(t2)
-    return (id1, t1, id2, t2)
-   
-   
-import matplotlib.pyplot as plt
-def plotNetworkWithSolution(myNet, modelSolution, print_all_arcs=False):
-    plt.figure()
-
-    for i in myNet.nodes:
-        # Plot the nodes
-        plt.plot(i._t, i.getIntegerNumber(), 'o')
-
+PLOT_MAX_ARCS = 20000  # above this number of arcs, only an evenly spaced sample of them is drawn
+
+
+def getArcSegments(nodeMask, nodePeriod, arcFrom, arcTo):
+    # (nArcs, 2, 2) array of the segments (period, mask) -> (period, mask) of the arcs
+    return np.stack([np.column_stack([nodePeriod[arcFrom], nodeMask[arcFrom]]),
+                     np.column_stack([nodePeriod[arcTo], nodeMask[arcTo]])], axis=1).astype(np.float64)
+
+
+def sampleArcs(nArcs, maxArcs):
+    # Indexes of at most maxArcs arcs, evenly spaced (so every period keeps some of its arcs)
+    if maxArcs is None or nArcs <= maxArcs:
+        return np.arange(nArcs)
+    return np.linspace(0, nArcs - 1, maxArcs).astype(np.int64)
+
+
+def plotNetworkWithSolution(myNet, modelSolution, print_all_arcs=False, savePath=None, maxArcs=PLOT_MAX_ARCS):
+    # Draw the nodes (period, mask) with one scatter and the arcs with one LineCollection each for the network and the
+    # solution. With savePath (.png, .svg, ...) the figure is rendered without a window, e.g. in batch jobs.
+    from matplotlib.collections import LineCollection
+    import solvers
+    if savePath is None:
+        import matplotlib.pyplot as plt
+        fig = plt.figure()
+    else:
+        from matplotlib.figure import Figure
+        fig = Figure()
+    ax = fig.add_subplot()
+
+    # Plot the nodes (the arrays of a UC_NetworkCSR are read as they are, a UC_Network is scanned once per node)
+    if hasattr(myNet, 'arcPtr'):
+        nodeMask, nodePeriod = np.asarray(myNet.nodeMask), np.asarray(myNet.nodePeriod)
+    else:
+        nodeMask = np.array([n.id[0] for n in myNet.nodes], dtype=np.int64)
+        nodePeriod = np.array([n.id[1] for n in myNet.nodes], dtype=np.int32)
+    ax.scatter(nodePeriod, nodeMask, s=12, c=nodePeriod, cmap='tab10', zorder=3)
+
+    # The arcs of the network are only collected when they are drawn
     if print_all_arcs:
-        for arc in myNet.arcs:
-            i1, t1 = arc._n1.id
-            i2, t2 = arc._n2.id
-            plt.plot([t1, t2], [binStrToInt(i1), binStrToInt(i2)], color='black')
-
-    # Plot the solution arcs
-    for (k,v) in modelSolution.iter_var_values():
-        if k.name.startswith("x_") and v == 1:
-            i1, t1, i2, t2 = (getArcFromStrVariableName(k.name))
-            plt.plot([t1, t2], [binStrToInt(i1), binStrToInt(i2)], color='red')
-        #plt.arrow(t1, binStrToInt(i1), t2,  binStrToInt(i2), width=1, head_width=5, head_length=2.5, color='black')
-
-    plt.title(f'Final cost is: {modelSolution.get_objective_value()}')
-    plt.show()
\ No newline at end of file
+        nodeMask, nodePeriod, arcFrom, arcTo, _ = solvers.getNetworkArrays(myNet)
+        nodeMask, nodePeriod = np.asarray(nodeMask), np.asarray(nodePeriod)
+        arcs = sampleArcs(len(arcFrom), maxArcs)
+        if len(arcs) < len(arcFrom):
+            print(f"I'm drawing {len(arcs)} of the {len(arcFrom)} arcs")
+        segments = getArcSegments(nodeMask, nodePeriod, np.asarray(arcFrom)[arcs], np.asarray(arcTo)[arcs])
+        ax.add_collection(LineCollection(segments, colors='black', linewidths=0.3, alpha=0.3, zorder=1))
+
+    # Plot the solution arcs (modelSolution is a solvers.UC_Solution): ((mask, period), (mask, period)) pairs
+    if len(modelSolution.selectedArcs):
+        segments = np.asarray(modelSolution.selectedArcs, dtype=np.float64)[:, :, ::-1]
+        ax.add_collection(LineCollection(segments, colors='red', linewidths=1.5, zorder=2))
+
+    ax.autoscale_view()
+    ax.set_xlabel('period')
+    ax.set_ylabel('commitment mask')
+    ax.set_title(f'Final cost is: {modelSolution.objective}')
+    if savePath is None:
+        plt.show()
+    else:
+        fig.savefig(savePath)
+        print(f"I saved the plot in {savePath}")